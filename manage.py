@@ -3,7 +3,9 @@ import os
 import sys
 
 if __name__ == "__main__":
-    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "mylibrary.settings")
+    # Tests get their own cache and request log; see mylibrary/test_settings.py.
+    testing = sys.argv[1:2] == ["test"]
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "mylibrary.test_settings" if testing else "mylibrary.settings")
     try:
         from django.core.management import execute_from_command_line
     except ImportError as exc:
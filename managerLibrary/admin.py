@@ -1,8 +1,20 @@
-from .models import *
 from django.contrib import admin
+from django.contrib.admin.views.autocomplete import AutocompleteJsonView
+from django.contrib.admin.views.main import ORDER_VAR, PAGE_VAR
 from django.contrib.auth.admin import UserAdmin
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+
 from .forms import CustomUserCreationForm, CustomUserChangeForm
+from .models import *
 from .models import CustomUser
+from .signals import refresh_written_rows
+
+
+# Unfiltered changelists of tables estimated to hold more rows than this
+# show the estimate instead of running COUNT(*) on every page.
+ESTIMATED_COUNT_THRESHOLD = 100000
 
 
 class CustomUserAdmin(UserAdmin):
@@ -25,17 +37,226 @@ class CustomUserAdmin(UserAdmin):
     ordering = ('email',)
 
 
-admin.site.register(Course)
-admin.site.register(Subject)
-admin.site.register(Principal)
-admin.site.register(Preceptor)
-admin.site.register(Professor)
-admin.site.register(Student)
-admin.site.register(Category)
-admin.site.register(Comment)
-admin.site.register(Phone)
-admin.site.register(CourseHistory)
-admin.site.register(AcademicHistory)
-admin.site.register(Grades)
-admin.site.register(Presence)
-admin.site.register(CustomUser)
\ No newline at end of file
+def estimated_count(model, using):
+    """
+    A cheap estimate of the rows in ``model``'s table, or None: the planner
+    statistics on PostgreSQL, ANALYZE's on SQLite or else its largest rowid.
+    """
+    connection = connections[using]
+    table = model._meta.db_table
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE relname = %s', [table])
+        elif connection.vendor == 'sqlite':
+            # sqlite_stat1 only exists once the database has been analyzed.
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'sqlite_stat1'")
+            if cursor.fetchone():
+                cursor.execute('SELECT CAST(stat AS INTEGER) FROM sqlite_stat1 WHERE tbl = %s LIMIT 1', [table])
+                row = cursor.fetchone()
+                if row is not None:
+                    return row[0]
+            cursor.execute('SELECT MAX(rowid) FROM %s' % connection.ops.quote_name(table))
+        else:
+            return None
+        row = cursor.fetchone()
+    return row[0] if row else None
+
+
+class EstimatedCountPaginator(Paginator):
+    """Pages with ``estimate`` as the count when it is past ESTIMATED_COUNT_THRESHOLD."""
+
+    def __init__(self, *args, estimate=None, **kwargs):
+        super(EstimatedCountPaginator, self).__init__(*args, **kwargs)
+        self.estimate = estimate
+
+    @cached_property
+    def count(self):
+        if self.estimate is not None and self.estimate > ESTIMATED_COUNT_THRESHOLD:
+            return self.estimate
+        return super(EstimatedCountPaginator, self).count
+
+
+class DeletionStatusFilter(admin.SimpleListFilter):
+    """Alive rows by default, like the objects manager; deleted or all rows on demand."""
+    title = 'estado'
+    parameter_name = 'estado'
+    DELETED = 'borrados'
+    ALL = 'todos'
+
+    def lookups(self, request, model_admin):
+        return ((self.DELETED, 'Borrados'), (self.ALL, 'Todos'))
+
+    def queryset(self, request, queryset):
+        if self.value() == self.DELETED:
+            return queryset.dead()
+        if self.value() == self.ALL:
+            return queryset
+        return queryset.alive()
+
+    def choices(self, changelist):
+        yield {
+            'selected': self.value() not in (self.DELETED, self.ALL),
+            'query_string': changelist.get_query_string(remove=[self.parameter_name]),
+            'display': 'Activos',
+        }
+        for lookup, title in self.lookup_choices:
+            yield {
+                'selected': self.value() == lookup,
+                'query_string': changelist.get_query_string({self.parameter_name: lookup}),
+                'display': title,
+            }
+
+
+class AliveAutocompleteJsonView(AutocompleteJsonView):
+
+    def get_queryset(self):
+        return super(AliveAutocompleteJsonView, self).get_queryset().alive()
+
+
+class SoftDeletionAdmin(admin.ModelAdmin):
+    """
+    Admin for SoftDeletionModels. Lists come from all_objects behind a
+    DeletionStatusFilter, so deleted rows can be found, edited and restored;
+    the actions soft delete, restore and purge with one UPDATE or DELETE per
+    table and batch. Subclasses set list_select_related for whatever
+    list_display follows, so every page runs a fixed number of queries.
+    """
+    list_filter = (DeletionStatusFilter,)
+    actions = ['soft_delete_selected', 'restore_selected', 'purge_selected']
+    show_full_result_count = False
+    paginator = EstimatedCountPaginator
+
+    def get_queryset(self, request):
+        queryset = self.model.all_objects.get_queryset()
+        ordering = self.get_ordering(request)
+        if ordering:
+            queryset = queryset.order_by(*ordering)
+        return queryset
+
+    def get_actions(self, request):
+        actions = super(SoftDeletionAdmin, self).get_actions(request)
+        # delete_selected collects every related object to confirm.
+        actions.pop('delete_selected', None)
+        return actions
+
+    def get_paginator(self, request, queryset, per_page, orphans=0, allow_empty_first_page=True):
+        # The estimate counts the whole table, so it only fits the unfiltered "Todos" view.
+        estimate = None
+        if request.GET.get(DeletionStatusFilter.parameter_name) == DeletionStatusFilter.ALL \
+                and not set(request.GET) - {ORDER_VAR, PAGE_VAR, DeletionStatusFilter.parameter_name}:
+            estimate = estimated_count(self.model, queryset.db)
+        return self.paginator(queryset, per_page, orphans, allow_empty_first_page, estimate=estimate)
+
+    def autocomplete_view(self, request):
+        return AliveAutocompleteJsonView.as_view(model_admin=self)(request)
+
+    def _report(self, request, counts, verb):
+        self.message_user(request, '%d %s %s.' % (
+            counts.get(self.model._meta.label, 0), self.model._meta.verbose_name_plural, verb))
+
+    # soft_delete() and restore() write with update(), which sends no
+    # signals, so the caches the handlers keep are refreshed afterwards.
+
+    def soft_delete_selected(self, request, queryset):
+        rows = queryset.cascade_pks()
+        counts = queryset.soft_delete()
+        refresh_written_rows(rows)
+        self._report(request, counts, 'borrados')
+    soft_delete_selected.allowed_permissions = ('delete',)
+    soft_delete_selected.short_description = 'Borrar seleccionados'
+
+    def restore_selected(self, request, queryset):
+        rows = queryset.cascade_pks()
+        counts = queryset.restore()
+        refresh_written_rows(rows)
+        self._report(request, counts, 'restaurados')
+    restore_selected.allowed_permissions = ('change',)
+    restore_selected.short_description = 'Restaurar seleccionados'
+
+    def purge_selected(self, request, queryset):
+        # Only rows already soft-deleted, with what depends on them. The
+        # DELETEs send post_delete for every row, so the handlers run.
+        self._report(request, queryset.purge(days=0), 'eliminados definitivamente')
+    purge_selected.allowed_permissions = ('delete',)
+    purge_selected.short_description = 'Eliminar definitivamente (solo borrados)'
+
+
+@admin.register(Course)
+class CourseAdmin(SoftDeletionAdmin):
+    list_display = ('year', 'division', 'shift')
+    list_filter = (DeletionStatusFilter, 'year', 'shift')
+    search_fields = ('year', 'division', 'shift')
+
+
+@admin.register(Subject)
+class SubjectAdmin(SoftDeletionAdmin):
+    search_fields = ('name',)
+
+
+@admin.register(Principal, Preceptor)
+class StaffAdmin(SoftDeletionAdmin):
+    list_display = ('email', 'first_name', 'last_name', 'is_active')
+    search_fields = ('email', 'first_name', 'last_name')
+
+
+@admin.register(Professor)
+class ProfessorAdmin(StaffAdmin):
+    autocomplete_fields = ('subjects',)
+
+
+@admin.register(Student)
+class StudentAdmin(SoftDeletionAdmin):
+    list_display = ('last_name', 'first_name', 'birthday')
+    search_fields = ('last_name', 'first_name')
+
+
+@admin.register(Category)
+class CategoryAdmin(SoftDeletionAdmin):
+    search_fields = ('name',)
+
+
+@admin.register(Comment)
+class CommentAdmin(SoftDeletionAdmin):
+    list_display = ('id', 'student', 'author', 'date')
+    list_select_related = ('student', 'author')
+    autocomplete_fields = ('student', 'categories')
+    raw_id_fields = ('author',)
+
+
+@admin.register(Phone)
+class PhoneAdmin(SoftDeletionAdmin):
+    list_display = ('number', 'student')
+    list_select_related = ('student',)
+    autocomplete_fields = ('student',)
+
+
+@admin.register(CourseHistory)
+class CourseHistoryAdmin(SoftDeletionAdmin):
+    list_display = ('id', 'student', 'id_course')
+    list_select_related = ('student', 'id_course')
+    autocomplete_fields = ('student', 'id_course')
+
+
+@admin.register(AcademicHistory)
+class AcademicHistoryAdmin(SoftDeletionAdmin):
+    list_display = ('id', 'id_course', 'subject', 'cycle')
+    list_select_related = ('id_course', 'subject')
+    autocomplete_fields = ('id_course', 'subject')
+
+
+@admin.register(Grades)
+class GradesAdmin(SoftDeletionAdmin):
+    list_display = ('id', 'student', 'subject', 'professor', 'grade')
+    list_select_related = ('student', 'subject', 'professor')
+    autocomplete_fields = ('student', 'subject', 'professor')
+
+
+@admin.register(Presence)
+class PresenceAdmin(SoftDeletionAdmin):
+    list_display = ('date', 'student', 'presence', 'preceptor')
+    list_select_related = ('student', 'preceptor')
+    autocomplete_fields = ('student', 'preceptor')
+
+
+admin.site.register(CustomUser)
+admin.site.register(Job)
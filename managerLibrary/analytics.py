@@ -0,0 +1,133 @@
+from collections import namedtuple
+from itertools import chain, islice
+
+import numpy as np
+from django.db.models import Avg, Case, Count, F, IntegerField, OuterRef, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
+
+from .models import Grades
+from .timeline import current_enrolments
+
+
+PASSING_GRADE = 6
+MISSING = -1
+CHUNK_SIZE = 20000
+
+GradeArrays = namedtuple('GradeArrays', ['student', 'subject', 'professor', 'course', 'grade'])
+GroupStats = namedtuple('GroupStats', ['keys', 'count', 'mean', 'median', 'percentiles', 'failure_rate'])
+
+
+def load_grades(queryset=None, chunk_size=CHUNK_SIZE):
+    """
+    Stream the valid grades of ``queryset`` into parallel NumPy arrays.
+
+    Missing foreign keys become MISSING, as do students without a course.
+    Rows not graded yet are skipped.
+    """
+    if queryset is None:
+        queryset = Grades.objects.all()
+    # Let the database fill in missing keys so every row is four plain
+    # integers that NumPy can consume without per-value work.
+    rows = queryset.filter(Grades.GRADED).annotate(
+        student_key=Coalesce('student_id', Value(MISSING)),
+        subject_key=Coalesce('subject_id', Value(MISSING)),
+        professor_key=Coalesce('professor_id', Value(MISSING)),
+    ).values_list('student_key', 'subject_key', 'professor_key', 'grade').iterator(chunk_size=chunk_size)
+
+    chunks = []
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            break
+        chunks.append(np.fromiter(chain.from_iterable(chunk), dtype=np.int64, count=4 * len(chunk)))
+    data = np.concatenate(chunks).reshape(-1, 4) if chunks else np.empty((0, 4), dtype=np.int64)
+    student, subject, professor, grade = data.T
+    return GradeArrays(student, subject, professor, _courses_of(student), grade)
+
+
+def _courses_of(student):
+    """Map every student id to their current course, by the course timeline."""
+    history = np.array(list(
+        current_enrolments().values_list('student_id', 'id_course_id')
+    ), dtype=np.int64).reshape(-1, 2)
+    course = np.full(student.shape, MISSING, dtype=np.int64)
+    if not len(history):
+        return course
+    # Keep the last row per student: reverse, then take the first occurrence.
+    students, first = np.unique(history[::-1, 0], return_index=True)
+    courses = history[::-1, 1][first]
+    position = np.searchsorted(students, student).clip(0, len(students) - 1)
+    found = students[position] == student
+    course[found] = courses[position[found]]
+    return course
+
+
+def summarize(keys, grades, percentiles=(25, 75), passing_grade=PASSING_GRADE):
+    """
+    Group ``grades`` (1 to 10) by ``keys`` and compute every statistic in
+    one sort.
+
+    Percentiles use linear interpolation, like numpy.percentile.
+    """
+    keep = keys != MISSING
+    keys, grades = keys[keep], grades[keep]
+    if not len(keys):
+        empty = np.empty(0)
+        return GroupStats(keys, empty, empty, empty, {p: empty for p in percentiles}, empty)
+
+    # Grades fit in four bits, so one sort of a packed key orders the rows by
+    # group and by grade inside each group.
+    packed = np.sort(keys.astype(np.int64) << 4 | grades.astype(np.int64))
+    keys, grades = packed >> 4, (packed & 0xF).astype(np.float64)
+    starts = np.concatenate(([0], np.flatnonzero(np.diff(keys)) + 1))
+    unique = keys[starts]
+    counts = np.diff(np.append(starts, len(keys)))
+
+    mean = np.add.reduceat(grades, starts) / counts
+    failure_rate = np.add.reduceat((grades < passing_grade).astype(np.float64), starts) / counts
+
+    def quantile(q):
+        position = starts + (counts - 1) * q
+        low, high = np.floor(position).astype(np.int64), np.ceil(position).astype(np.int64)
+        return grades[low] + (grades[high] - grades[low]) * (position - low)
+
+    return GroupStats(
+        unique, counts, mean, quantile(0.5), {p: quantile(p / 100.0) for p in percentiles}, failure_rate)
+
+
+def grade_report(queryset=None, **kwargs):
+    """Per-student, per-subject, per-course and per-professor statistics."""
+    arrays = load_grades(queryset)
+    return {
+        dimension: summarize(getattr(arrays, dimension), arrays.grade, **kwargs)
+        for dimension in ('student', 'subject', 'course', 'professor')
+    }
+
+
+# Functions, since the current course depends on the day they are called.
+DB_DIMENSIONS = {
+    'student': lambda: F('student_id'),
+    'subject': lambda: F('subject_id'),
+    'professor': lambda: F('professor_id'),
+    # The student's current course, as in _courses_of().
+    'course': lambda: Subquery(current_enrolments().filter(student_id=OuterRef('student_id')).order_by(
+        '-valid_from', '-id').values('id_course_id')[:1]),
+}
+
+
+def db_grade_averages(dimension, queryset=None, passing_grade=PASSING_GRADE):
+    """
+    Aggregate in the database instead.
+
+    Returns {key: (count, mean, failure rate)}. Medians and percentiles are
+    only available through grade_report().
+    """
+    if queryset is None:
+        queryset = Grades.objects.all()
+    rows = queryset.filter(Grades.GRADED).annotate(key=DB_DIMENSIONS[dimension]()).exclude(key=None).values(
+        'key').annotate(
+        count=Count('id'),
+        mean=Avg('grade'),
+        failures=Sum(Case(When(grade__lt=passing_grade, then=1), default=0, output_field=IntegerField())),
+    ).order_by('key')
+    return {row['key']: (row['count'], row['mean'], row['failures'] / row['count']) for row in rows}
@@ -0,0 +1,226 @@
+import json
+from collections import namedtuple
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from django.http import Http404, HttpResponse, HttpResponseBadRequest, HttpResponseForbidden, HttpResponseNotModified
+from django.utils import timezone
+from django.utils.cache import patch_vary_headers
+from django.utils.dateparse import parse_date
+from django.utils.http import parse_etags, quote_etag
+from django.utils.text import compress_string
+
+from .caching import cached, generations, make_key
+from .feeds import _after, decode_keys, encode_cursor
+from .models import Category, Comment, Course, CourseHistory, Grades, Presence, Student, Subject
+from .roles import role_for_request
+from .timeline import valid_on
+
+try:
+    import brotli
+except ImportError:
+    # Optional: without it responses are only ever gzipped.
+    brotli = None
+
+
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 500
+# Smaller bodies aren't worth compressing, as in GZipMiddleware.
+MIN_COMPRESS_SIZE = 200
+IDENTITY = 'identity'
+
+# Pages are in primary key order, so the cursor is the last key sent.
+KEYS = (('pk', False, int),)
+
+# ``fields`` maps the names in the JSON to values() lookups; ``id`` is always
+# sent. ``related`` fields are filled in by a function of the page's ids,
+# one query each. ``filters`` maps query parameters to a parser and a
+# function building the filter. ``depends_on`` are the models whose writes
+# change the responses, and so their ETag.
+Resource = namedtuple('Resource', ['model', 'fields', 'related', 'filters', 'depends_on'])
+
+
+def _comment_categories(ids):
+    categories = {}
+    for comment_id, category_id in Comment.categories.through.objects.filter(
+            comment_id__in=ids, category__deleted_at=None).order_by('category_id').values_list(
+            'comment_id', 'category_id'):
+        categories.setdefault(comment_id, []).append(category_id)
+    return lambda row: categories.get(row['id'], [])
+
+
+def _digits(value):
+    if not value.isdigit():
+        raise ValueError(value)
+    return int(value)
+
+
+def _date(value):
+    day = parse_date(value)
+    if day is None:
+        raise ValueError(value)
+    return day
+
+
+def _enrolment(value):
+    """A course id and the day whose enrolments count; both go into the ETag."""
+    return _digits(value), timezone.localdate()
+
+
+def _course_filter(enrolment):
+    course_id, day = enrolment
+    return Q(id__in=CourseHistory.objects.filter(valid_on(day), id_course_id=course_id).values('student_id'))
+
+
+def _student_filter(student_id):
+    return Q(student_id=student_id)
+
+
+RESOURCES = {
+    'cursos': Resource(Course, {
+        'id': 'id_course', 'year': 'year', 'division': 'division', 'shift': 'shift',
+    }, {}, {}, [Course]),
+    'alumnos': Resource(Student, {
+        'id': 'id', 'first_name': 'first_name', 'last_name': 'last_name', 'birthday': 'birthday',
+    }, {}, {
+        'curso': (_enrolment, _course_filter),
+    }, [Student, CourseHistory]),
+    'notas': Resource(Grades, {
+        'id': 'id', 'student': 'student_id', 'subject': 'subject_id', 'subject_name': 'subject__name',
+        'professor': 'professor_id', 'grade': 'grade',
+    }, {}, {
+        'alumno': (_digits, _student_filter),
+        'materia': (_digits, lambda subject_id: Q(subject_id=subject_id)),
+    }, [Grades, Subject]),
+    'comentarios': Resource(Comment, {
+        'id': 'id', 'student': 'student_id', 'author': 'author_id', 'date': 'date', 'description': 'description',
+    }, {'categories': _comment_categories}, {
+        'alumno': (_digits, _student_filter),
+    }, [Comment, Category]),
+    'asistencias': Resource(Presence, {
+        'id': 'id', 'student': 'student_id', 'preceptor': 'preceptor_id', 'date': 'date', 'presence': 'presence',
+    }, {}, {
+        'alumno': (_digits, _student_filter),
+        'desde': (_date, lambda day: Q(date__gte=day)),
+        'hasta': (_date, lambda day: Q(date__lte=day)),
+    }, [Presence]),
+}
+
+
+def api_page(resource, fields, filters, cursor=None, limit=DEFAULT_LIMIT):
+    """
+    One page of ``resource`` with the given ``fields`` (all by default),
+    read with values_list() and never instantiating a model: one query,
+    plus one per related field asked for.
+    """
+    fields = fields or list(resource.fields) + list(resource.related)
+    columns = ['id'] + [field for field in fields if field in resource.fields and field != 'id']
+    queryset = resource.model.objects.filter(*filters).order_by('pk')
+    if cursor:
+        queryset = queryset.filter(_after(KEYS, decode_keys(cursor, KEYS)))
+    rows = [dict(zip(columns, row))
+            for row in queryset.values_list(*[resource.fields[column] for column in columns])[:limit + 1]]
+    has_next = len(rows) > limit
+    rows = rows[:limit]
+    ids = [row['id'] for row in rows]
+    for field in fields:
+        if field in resource.related and rows:
+            value = resource.related[field](ids)
+            for row in rows:
+                row[field] = value(row)
+    return {
+        'results': rows,
+        'next_cursor': encode_cursor([rows[-1]['id']]) if has_next else None,
+        'has_next': has_next,
+    }
+
+
+def accepted_encoding(request):
+    """The best encoding the client takes: br, gzip or identity."""
+    accepted = set()
+    for item in request.META.get('HTTP_ACCEPT_ENCODING', '').split(','):
+        coding, _, params = item.partition(';')
+        quality = params.strip()
+        try:
+            if quality.startswith('q=') and float(quality[2:]) == 0:
+                continue
+        except ValueError:
+            continue
+        accepted.add(coding.strip().lower())
+    if brotli is not None and 'br' in accepted:
+        return 'br'
+    if 'gzip' in accepted:
+        return 'gzip'
+    return IDENTITY
+
+
+def _encode(page, encoding):
+    content = json.dumps(page, cls=DjangoJSONEncoder, separators=(',', ':')).encode('utf-8')
+    if len(content) < MIN_COMPRESS_SIZE or encoding == IDENTITY:
+        return content, IDENTITY
+    if encoding == 'br':
+        return brotli.compress(content), encoding
+    return compress_string(content), encoding
+
+
+def api(request, resource):
+    """
+    GET /api/<resource>/?fields=a,b&cursor=...&limit=N plus the resource's
+    filters. Responses carry a weak ETag made of the query and the write
+    generations of the models they read, so If-None-Match is answered
+    without touching the database; the encoded body is cached under it.
+    """
+    if resource not in RESOURCES:
+        raise Http404('Recurso inexistente')
+    role = role_for_request(request)
+    if role is None or role.name is None:
+        return HttpResponseForbidden('Solo personal de la escuela')
+    definition = RESOURCES[resource]
+
+    fields = [field for field in request.GET.get('fields', '').split(',') if field]
+    unknown = [field for field in fields if field not in definition.fields and field not in definition.related]
+    if unknown:
+        return HttpResponseBadRequest('Campo inválido: %s' % ', '.join(unknown))
+    limit = request.GET.get('limit', '')
+    if limit and not limit.isdigit():
+        return HttpResponseBadRequest('Límite inválido')
+    limit = max(1, min(int(limit or DEFAULT_LIMIT), MAX_LIMIT))
+    filters, values = [], []
+    for param, (parse, build) in sorted(definition.filters.items()):
+        if request.GET.get(param):
+            try:
+                value = parse(request.GET[param])
+            except ValueError:
+                return HttpResponseBadRequest('Parámetro inválido: %s' % param)
+            filters.append(build(value))
+            values.append((param, value))
+    cursor = request.GET.get('cursor')
+    if cursor:
+        try:
+            decode_keys(cursor, KEYS)
+        except ValueError:
+            return HttpResponseBadRequest('Cursor inválido')
+    encoding = accepted_encoding(request)
+
+    etag = 'W/' + quote_etag(make_key('api', resource, fields, values, cursor, limit,
+                                      generations(definition.depends_on)))
+    if _weak_match(etag, request.META.get('HTTP_IF_NONE_MATCH', '')):
+        response = HttpResponseNotModified()
+    else:
+        content, content_encoding = cached(
+            make_key('api', etag, encoding),
+            lambda: _encode(api_page(definition, fields, filters, cursor, limit), encoding),
+            definition.depends_on)
+        response = HttpResponse(content, content_type='application/json')
+        if content_encoding != IDENTITY:
+            response['Content-Encoding'] = content_encoding
+        response['Content-Length'] = str(len(content))
+    response['ETag'] = etag
+    patch_vary_headers(response, ('Accept-Encoding', 'Cookie'))
+    return response
+
+
+def _weak_match(etag, header):
+    def opaque(tag):
+        return tag[2:] if tag.startswith('W/') else tag
+    return any(tag == '*' or opaque(tag) == opaque(etag) for tag in parse_etags(header))
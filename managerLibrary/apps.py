@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class ManagerLibraryConfig(AppConfig):
     name = 'managerLibrary'
+
+    def ready(self):
+        from . import signals  # noqa: F401
@@ -0,0 +1,42 @@
+from django.db import transaction
+from django.utils import timezone
+
+from .attendance_bitmaps import set_days
+from .models import CourseHistory, Presence
+from .summaries import refresh_summaries
+from .timeline import valid_on
+
+
+def record_roll_call(course_id, present_ids, date=None, preceptor_id=None):
+    """
+    Record a whole course's attendance for ``date`` in one transaction.
+
+    Students in the course on ``date`` missing from ``present_ids`` are
+    marked absent. Those who had moved to another course by then are left
+    alone, so the roll call of their new course stands.
+    Existing rows for that day are overwritten (and revived if they had been
+    soft-deleted), so submitting twice is harmless. The number of queries
+    does not depend on the size of the course. Returns the number of
+    students recorded.
+    """
+    date = date or timezone.localdate()
+    roster = set(CourseHistory.objects.filter(
+        valid_on(date), id_course=course_id, student__deleted_at=None).values_list('student_id', flat=True))
+    present = roster & {int(pk) for pk in present_ids}
+    absent = roster - present
+
+    with transaction.atomic():
+        # Insert the rows that don't exist yet; a concurrent submission for the
+        # same course can't make this fail, it just inserts nothing.
+        Presence.all_objects.bulk_create(
+            [Presence(student_id=pk, date=date, preceptor_id=preceptor_id, presence=pk in present) for pk in roster],
+            ignore_conflicts=True,
+        )
+        for student_ids, value in ((present, True), (absent, False)):
+            if student_ids:
+                Presence.all_objects.filter(student_id__in=student_ids, date=date).update(
+                    presence=value, preceptor_id=preceptor_id, deleted_at=None)
+        # bulk_create and update() don't send signals.
+        set_days([(pk, date, pk in present) for pk in roster])
+        refresh_summaries(roster)
+    return len(roster)
@@ -0,0 +1,164 @@
+from collections import defaultdict, namedtuple
+from datetime import date as Date, timedelta
+
+import numpy as np
+from django.db import transaction
+
+from .caching import bump
+from .models import AttendanceBitmap, Presence
+from .timeline import valid_between
+
+
+DAYS_PER_YEAR = 366
+BITMAP_BYTES = (DAYS_PER_YEAR + 7) // 8
+EMPTY_BITMAP = bytes(BITMAP_BYTES)
+
+AttendanceRange = namedtuple('AttendanceRange', ['student_ids', 'dates', 'present', 'absent'])
+
+
+def _day_index(day):
+    return day.timetuple().tm_yday - 1
+
+
+def _unpack(blobs):
+    """Turn a list of packed bitmaps into a (len(blobs), DAYS_PER_YEAR) bool matrix."""
+    packed = np.frombuffer(b''.join(bytes(blob) for blob in blobs), dtype=np.uint8).reshape(-1, BITMAP_BYTES)
+    return np.unpackbits(packed, axis=1)[:, :DAYS_PER_YEAR].astype(bool)
+
+
+def _pack(bits):
+    return np.packbits(bits).tobytes()
+
+
+def set_days(entries):
+    """
+    Apply (student id, date, presence) changes to the bitmaps. A presence of
+    None clears the day. Costs one bulk INSERT, one SELECT and one bulk
+    UPDATE, whatever the number of entries.
+
+    Concurrent calls for the same students are safe: missing bitmaps are
+    inserted ignoring conflicts and the rows are then read locked (SQLite
+    already holds the write lock after the INSERT), so neither a student's
+    first roll call of the year nor overlapping ones fail or lose days.
+    """
+    changes = defaultdict(list)
+    for student_id, day, presence in entries:
+        if student_id is not None:
+            changes[student_id, day.year].append((_day_index(day), presence))
+    if not changes:
+        return
+
+    with transaction.atomic():
+        AttendanceBitmap.objects.bulk_create([
+            AttendanceBitmap(student_id=student_id, year=year, present=EMPTY_BITMAP, absent=EMPTY_BITMAP)
+            for student_id, year in changes
+        ], ignore_conflicts=True)
+        bitmaps = AttendanceBitmap.objects.select_for_update().filter(
+            student_id__in={student_id for student_id, _ in changes},
+            year__in={year for _, year in changes},
+        )
+        updated = []
+        for bitmap in bitmaps:
+            days = changes.get((bitmap.student_id, bitmap.year))
+            if days is None:
+                continue
+            present, absent = _unpack([bitmap.present, bitmap.absent])
+            for index, presence in days:
+                present[index] = presence is True
+                absent[index] = presence is False
+            bitmap.present, bitmap.absent = _pack(present), _pack(absent)
+            updated.append(bitmap)
+        AttendanceBitmap.objects.bulk_update(updated, ['present', 'absent'])
+    bump(AttendanceBitmap)
+
+
+def rebuild_bitmaps(student_ids=None):
+    """Recompute bitmaps from the alive Presence rows. Returns how many were written."""
+    presences = Presence.objects.exclude(student=None).exclude(presence=None)
+    bitmaps = AttendanceBitmap.objects.all()
+    if student_ids is not None:
+        presences = presences.filter(student_id__in=student_ids)
+        bitmaps = bitmaps.filter(student_id__in=student_ids)
+
+    bits = {}
+    for student_id, day, presence in presences.values_list('student_id', 'date', 'presence').iterator():
+        key = (student_id, day.year)
+        if key not in bits:
+            bits[key] = np.zeros((2, DAYS_PER_YEAR), dtype=bool)
+        bits[key][0 if presence else 1, _day_index(day)] = True
+
+    with transaction.atomic():
+        bitmaps.delete()
+        AttendanceBitmap.objects.bulk_create([
+            AttendanceBitmap(student_id=student_id, year=year, present=_pack(day_bits[0]), absent=_pack(day_bits[1]))
+            for (student_id, year), day_bits in bits.items()
+        ])
+    bump(AttendanceBitmap)
+    return len(bits)
+
+
+def course_attendance(course_id, start, end):
+    """
+    Attendance of the course's students between ``start`` and ``end``
+    (inclusive) as two (students, days) bool matrices, read in one query.
+    Only the days each student was in the course count; a student who
+    moved in or out shows nothing for the days they were elsewhere.
+    """
+    history = 'student__courseHistory__'
+    # One filter() call, so the range read comes from the enrolment matched.
+    rows = list(AttendanceBitmap.objects.filter(
+        valid_between(start, end, history),
+        student__courseHistory__id_course=course_id,
+        student__courseHistory__deleted_at=None,
+        student__deleted_at=None,
+        year__range=(start.year, end.year),
+    ).values_list('student_id', 'year', 'present', 'absent', history + 'valid_from', history + 'valid_to'))
+
+    student_ids = np.array([row[0] for row in rows], dtype=np.int64)
+    years = np.array([row[1] for row in rows], dtype=np.int64)
+    present_bits = _unpack([row[2] for row in rows])
+    absent_bits = _unpack([row[3] for row in rows])
+    students = np.unique(student_ids)
+    row_of = np.searchsorted(students, student_ids)
+
+    days = (end - start).days + 1
+    present = np.zeros((len(students), days), dtype=bool)
+    absent = np.zeros_like(present)
+    for year in range(start.year, end.year + 1):
+        first_day = max(start, Date(year, 1, 1))
+        first, last = _day_index(first_day), _day_index(min(end, Date(year, 12, 31)))
+        offset = (first_day - start).days
+        in_year = years == year
+        # A student enrolled twice in the range has a row per enrolment; their bits are the same.
+        present[row_of[in_year], offset:offset + last - first + 1] = present_bits[in_year, first:last + 1]
+        absent[row_of[in_year], offset:offset + last - first + 1] = absent_bits[in_year, first:last + 1]
+
+    enrolled = np.zeros_like(present)
+    for row, (_, _, _, _, valid_from, valid_to) in zip(row_of, rows):
+        enrolled[row, max((valid_from - start).days, 0):days if valid_to is None else (valid_to - start).days] = True
+
+    dates = [start + timedelta(days=offset) for offset in range(days)]
+    return AttendanceRange(students, dates, present & enrolled, absent & enrolled)
+
+
+def attendance_counts(attendance):
+    """(present days, recorded absences) per student of an AttendanceRange."""
+    return attendance.present.sum(axis=1), attendance.absent.sum(axis=1)
+
+
+def longest_absence_streaks(attendance):
+    """
+    Longest run of consecutive absences per student, counted over the days on
+    which anyone in the range had attendance taken, so weekends and holidays
+    don't break a streak.
+    """
+    recorded = (attendance.present | attendance.absent).any(axis=0)
+    absent = attendance.absent[:, recorded].astype(np.int8)
+    padded = np.pad(absent, ((0, 0), (1, 1)), mode='constant')
+    edges = np.diff(padded, axis=1)
+    # Starts and ends come out row by row in order, so they pair up directly.
+    start_rows, start_cols = np.nonzero(edges == 1)
+    _, end_cols = np.nonzero(edges == -1)
+    streaks = np.zeros(len(attendance.student_ids), dtype=np.int64)
+    np.maximum.at(streaks, start_rows, end_cols - start_cols)
+    return streaks
@@ -0,0 +1,349 @@
+import threading
+import time
+import uuid
+from collections import namedtuple
+from contextlib import ExitStack, contextmanager
+from datetime import timedelta
+from functools import lru_cache
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connection, connections, transaction
+from django.db.models import Max
+from django.template import engines, loader
+from django.template.loaders.cached import Loader as CachedLoader
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from . import api as api_views, views
+from .analytics import db_grade_averages, grade_report
+from .api import RESOURCES, api_page
+from .attendance import record_roll_call
+from .attendance_bitmaps import course_attendance
+from .category_stats import category_stats
+from .feeds import ORDER_BY_NAME, comment_feed
+from .management.commands.benchmark_comment_feed import _Rollback
+from .models import Comment, Course, CourseHistory, Grades, Presence, Principal, Student, StudentAcademicSummary
+from .rosters import build_rosters, get_course_roster
+from .search import search
+from .seeding import counts
+from .summaries import build_summaries
+from .timeline import roster_at
+
+
+QUERY, VIEW, TEMPLATE, BULK = 'query', 'view', 'template', 'bulk'
+DEFAULT_REPEAT = 5
+# Differences under this many ms are noise, whatever the ratio.
+MIN_REGRESSION_MS = 1.0
+
+Benchmark = namedtuple('Benchmark', ['name', 'group', 'function', 'setup'])
+# What the benchmarks run against: a course with students, one of them,
+# the principal the views are rendered for and the last day with attendance.
+Context = namedtuple('Context', ['course_id', 'student_id', 'principal', 'day'])
+
+BENCHMARKS = []
+# The key prefix private_cache() gave this thread's benchmarks.
+_private = threading.local()
+
+
+def benchmark(name, group=QUERY, setup=None):
+    """
+    Register a function of the Context as the benchmark ``name``.
+    ``setup``, also given the Context, runs untimed before each run.
+    """
+    def register(function):
+        BENCHMARKS.append(Benchmark(name, group, function, setup))
+        return function
+    return register
+
+
+@contextmanager
+def rolled_back():
+    """Run the block in a transaction that is always rolled back, so bulk writes leave the data as it was."""
+    try:
+        with transaction.atomic():
+            yield
+            raise _Rollback()
+    except _Rollback:
+        pass
+
+
+def _cold_cache(ctx=None):
+    """Switch this thread's cache to keys never used before: every lookup misses, as after clearing it."""
+    cache.key_prefix = '%s-%s' % (_private.key_prefix, uuid.uuid4().hex)
+
+
+@contextmanager
+def private_cache():
+    """
+    Run the block on cache keys of its own, so the benchmarks neither read
+    nor clear what the servers cached, and drop those keys afterwards: the
+    generation counters among them never expire.
+    """
+    key_prefix = cache.key_prefix
+    _private.key_prefix = 'benchmarks-%s' % uuid.uuid4().hex
+    _cold_cache()
+    try:
+        yield
+    finally:
+        cache.key_prefix = key_prefix
+        cache.delete_prefix(_private.key_prefix)
+
+
+def context():
+    """The Context of the seeded database; ValueError if it has no students or principal."""
+    registration = CourseHistory.objects.filter(student__deleted_at=None).order_by('id').values_list(
+        'student_id', 'id_course_id').first()
+    principal = Principal.objects.order_by('pk').first()
+    if registration is None or principal is None:
+        raise ValueError('The database has no students or principal; fill it with seed_benchmark first.')
+    day = Presence.objects.aggregate(last=Max('date'))['last'] or timezone.localdate()
+    return Context(registration[1], registration[0], principal, day)
+
+
+def cached_templates():
+    """Whether templates are compiled once per process (the cached loader) or on every render."""
+    return any(isinstance(template_loader, CachedLoader)
+               for template_loader in engines['django'].engine.template_loaders)
+
+
+def measure(function, repeat=DEFAULT_REPEAT, setup=None):
+    """
+    Run ``function`` ``repeat`` times. Returns the median, 95th percentile
+    and fastest run in ms, and the queries of one run on the primary and
+    the replicas.
+    """
+    timings, queries = [], 0
+    for _ in range(repeat):
+        if setup:
+            setup()
+        with ExitStack() as stack:
+            captured = [stack.enter_context(CaptureQueriesContext(connections[alias]))
+                        for alias in [DEFAULT_DB_ALIAS] + settings.REPLICA_DATABASES]
+            start = time.perf_counter()
+            function()
+            timings.append((time.perf_counter() - start) * 1000)
+        queries = sum(len(queries) for queries in captured)
+    return {
+        'median_ms': float(np.median(timings)),
+        'p95_ms': float(np.percentile(timings, 95)),
+        'min_ms': min(timings),
+        'queries': queries,
+    }
+
+
+def run(repeat=DEFAULT_REPEAT, groups=None, names=None, stdout=None):
+    """
+    Run the registered benchmarks (those in ``groups``, or named in
+    ``names``) and return a JSON-ready report: when and where it ran, the
+    rows per model and each benchmark's timings.
+    """
+    ctx = context()
+    _page_data.cache_clear()
+    report = {
+        'started': timezone.now().isoformat(),
+        'vendor': connection.vendor,
+        'cached_templates': cached_templates(),
+        'repeat': repeat,
+        'counts': counts(),
+        'results': {},
+    }
+    with private_cache():
+        for bench in BENCHMARKS:
+            if (groups and bench.group not in groups) or (names and bench.name not in names):
+                continue
+            result = measure(lambda: bench.function(ctx), repeat, bench.setup and (lambda: bench.setup(ctx)))
+            result['group'] = bench.group
+            report['results'][bench.name] = result
+            if stdout:
+                stdout.write('%-48s %10.2f %10.2f %6d' % (
+                    bench.name, result['median_ms'], result['p95_ms'], result['queries']))
+    return report
+
+
+def compare(old, new, tolerance=0.2, min_ms=MIN_REGRESSION_MS):
+    """
+    The benchmarks of ``new`` whose median is more than ``tolerance`` (a
+    share) and ``min_ms`` slower than in ``old``, or that run more queries,
+    as (name, old result, new result) tuples.
+    """
+    regressions = []
+    for name, result in sorted(new['results'].items()):
+        before = old['results'].get(name)
+        if before is None:
+            continue
+        slower = result['median_ms'] - before['median_ms']
+        if (slower > min_ms and slower > before['median_ms'] * tolerance) or result['queries'] > before['queries']:
+            regressions.append((name, before, result))
+    return regressions
+
+
+# Manager and module queries.
+
+@benchmark('count alive students')
+def _count_students(ctx):
+    Student.objects.count()
+
+
+@benchmark('count alive grades')
+def _count_grades(ctx):
+    Grades.objects.count()
+
+
+@benchmark('comment feed by date, first page')
+def _comment_feed(ctx):
+    list(comment_feed().object_list)
+
+
+@benchmark('comment feed by name, second page')
+def _comment_feed_next(ctx):
+    list(comment_feed(order=ORDER_BY_NAME, cursor=comment_feed(order=ORDER_BY_NAME).next_cursor).object_list)
+
+
+@benchmark('roster of every course')
+def _rosters(ctx):
+    build_rosters()
+
+
+@benchmark('course roster on a day')
+def _roster_at(ctx):
+    roster_at(ctx.course_id, ctx.day)
+
+
+@benchmark('summaries of a course')
+def _summaries(ctx):
+    build_summaries(list(CourseHistory.objects.filter(id_course=ctx.course_id).values_list('student_id', flat=True)))
+
+
+@benchmark('grade report')
+def _grade_report(ctx):
+    grade_report()
+
+
+@benchmark('grade averages per subject')
+def _grade_averages(ctx):
+    db_grade_averages('subject')
+
+
+@benchmark('course attendance, last 30 days')
+def _course_attendance(ctx):
+    course_attendance(ctx.course_id, ctx.day - timedelta(days=30), ctx.day)
+
+
+@benchmark('category stats, last 30 days')
+def _category_stats(ctx):
+    category_stats(ctx.day - timedelta(days=30), ctx.day)
+
+
+@benchmark('search')
+def _search(ctx):
+    search('gonzalez')
+
+
+@benchmark('api page of grades')
+def _api_page(ctx):
+    api_page(RESOURCES['notas'], None, [])
+
+
+# Views, rendered for the principal with an empty cache and again with a warm one.
+
+def _request(ctx, path, params=None):
+    request = RequestFactory().get(path, params(ctx) if callable(params) else params or {})
+    request.user = ctx.principal
+    return request
+
+
+def _view(name, view, path, params=None, **kwargs):
+    def render(ctx):
+        response = view(_request(ctx, path, params), **{
+            key: value(ctx) if callable(value) else value for key, value in kwargs.items()})
+        if response.status_code != 200:
+            raise ValueError('%s answered %d' % (name, response.status_code))
+        if response.streaming:
+            b''.join(response.streaming_content)
+    benchmark(name + ', cold cache', VIEW, setup=_cold_cache)(render)
+    benchmark(name + ', warm cache', VIEW)(render)
+
+
+_view('comment history', views.historialnotas, '/')
+_view('academic progress', views.progreso_academico, '/progreso/', lambda ctx: {'curso': ctx.course_id})
+_view('roll call form', views.asistencia, '/asistencia/', course_id=lambda ctx: ctx.course_id)
+_view('attendance summary', views.ver_asistencia, '/asistencia/resumen/', course_id=lambda ctx: ctx.course_id)
+_view('student profile', views.perfil_alumno, '/alumno/', student_id=lambda ctx: ctx.student_id)
+_view('search page', views.buscar, '/buscar/', {'q': 'gonzalez'})
+_view('category stats page', views.estadisticas_categorias, '/estadisticas/categorias/')
+_view('api students', api_views.api, '/api/alumnos/', resource='alumnos')
+
+
+# Pages, each template rendered on its own: loading (and, without the
+# cached loader, compiling) it plus rendering, with the data already at hand.
+
+@lru_cache(maxsize=None)
+def _page_data(template_name, ctx, data):
+    return data(ctx)
+
+
+def _page(template_name, data=lambda ctx: {}):
+    def render(ctx):
+        loader.get_template(template_name).render(_page_data(template_name, ctx, data), _request(ctx, '/'))
+    benchmark(template_name, TEMPLATE, setup=lambda ctx: _page_data(template_name, ctx, data))(render)
+
+
+def _attendance_summary(ctx):
+    start = ctx.day - timedelta(days=30)
+    return {'Course': Course.objects.get(pk=ctx.course_id), 'From': start, 'To': ctx.day,
+            'Rows': views._attendance_rows(ctx.course_id, start, ctx.day)}
+
+
+_page('comments_history.html', lambda ctx: {'Comments': comment_feed()})
+_page('academic_progress.html', lambda ctx: {'Course': ctx.course_id, 'Summaries': list(
+    StudentAcademicSummary.objects.filter(course_id=ctx.course_id).select_related('student'))})
+_page('assistance.html', lambda ctx: {'Course': get_course_roster(ctx.course_id),
+                                      'Students': get_course_roster(ctx.course_id).students})
+_page('see_assistance.html', _attendance_summary)
+for _template_name in ('director_userprofile.html', 'preceptor_userprofile.html', 'teacher_userprofile.html',
+                       'create_comment.html', 'update_grade.html', 'my_comments.html', 'capacitaciondocente.html',
+                       'menu.html', 'new_account.html'):
+    _page(_template_name)
+
+
+# Bulk writes, rolled back after every run.
+
+@benchmark('bulk create a day of attendance', BULK)
+def _bulk_presences(ctx):
+    with rolled_back():
+        day = ctx.day + timedelta(days=1)
+        Presence.objects.bulk_create([
+            Presence(student_id=student_id, date=day, presence=True)
+            for student_id in Student.objects.values_list('id', flat=True)])
+
+
+@benchmark('bulk update a course\'s grades', BULK)
+def _bulk_update_grades(ctx):
+    with rolled_back():
+        grades = list(Grades.objects.filter(student__courseHistory__id_course=ctx.course_id).only('id', 'grade'))
+        for grade in grades:
+            grade.grade = grade.grade and 11 - grade.grade
+        Grades.objects.bulk_update(grades, ['grade'])
+
+
+@benchmark('soft delete a course', BULK)
+def _soft_delete_course(ctx):
+    with rolled_back():
+        Course.objects.filter(pk=ctx.course_id).soft_delete()
+
+
+@benchmark('roll call of a course', BULK)
+def _roll_call(ctx):
+    with rolled_back():
+        record_roll_call(ctx.course_id, CourseHistory.objects.filter(id_course=ctx.course_id).values_list(
+            'student_id', flat=True), ctx.day + timedelta(days=1))
+
+
+@benchmark('soft delete and restore comments of a student', BULK)
+def _soft_delete_comments(ctx):
+    with rolled_back():
+        Comment.objects.filter(student_id=ctx.student_id).soft_delete()
+        Comment.all_objects.filter(student_id=ctx.student_id).restore()
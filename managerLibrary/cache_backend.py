@@ -0,0 +1,142 @@
+import os
+import pickle
+import sqlite3
+import threading
+import time
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+
+class SQLiteCache(BaseCache):
+    """
+    Cache shared by every process on the machine, kept in its own SQLite
+    file (LOCATION) in WAL mode, so gunicorn workers see each other's
+    entries without an external service. Unlike the file-based cache,
+    add() and incr() are atomic, which locks and version counters rely on.
+    """
+
+    def __init__(self, location, params):
+        super(SQLiteCache, self).__init__(params)
+        self._path = location
+        self._local = threading.local()
+        self._sets = 0
+
+    def _connection(self):
+        # One connection per thread and process; never shared across a fork.
+        connection = getattr(self._local, 'connection', None)
+        if connection is not None and self._local.pid == os.getpid():
+            return connection
+        directory = os.path.dirname(self._path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        connection = sqlite3.connect(self._path, timeout=30, isolation_level=None)
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute('PRAGMA synchronous=NORMAL')
+        connection.execute('CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value BLOB NOT NULL, expires REAL)')
+        connection.execute('CREATE INDEX IF NOT EXISTS cache_expires ON cache (expires)')
+        self._local.connection, self._local.pid = connection, os.getpid()
+        return connection
+
+    def _key(self, key, version):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return key
+
+    def _expires(self, timeout):
+        return self.get_backend_timeout(timeout)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        # One statement: insert, or take over the row only if it has expired.
+        cursor = self._connection().execute(
+            'INSERT INTO cache (key, value, expires) VALUES (?, ?, ?) '
+            'ON CONFLICT (key) DO UPDATE SET value = excluded.value, expires = excluded.expires '
+            'WHERE cache.expires IS NOT NULL AND cache.expires <= ?',
+            (self._key(key, version), pickle.dumps(value, pickle.HIGHEST_PROTOCOL), self._expires(timeout),
+             time.time()))
+        return cursor.rowcount == 1
+
+    def get(self, key, default=None, version=None):
+        row = self._connection().execute(
+            'SELECT value FROM cache WHERE key = ? AND (expires IS NULL OR expires > ?)',
+            (self._key(key, version), time.time())).fetchone()
+        return default if row is None else pickle.loads(row[0])
+
+    def get_many(self, keys, version=None):
+        keys = {self._key(key, version): key for key in keys}
+        if not keys:
+            return {}
+        rows = self._connection().execute(
+            'SELECT key, value FROM cache WHERE key IN (%s) AND (expires IS NULL OR expires > ?)'
+            % ', '.join('?' * len(keys)), list(keys) + [time.time()])
+        return {keys[key]: pickle.loads(value) for key, value in rows}
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.set_many({key: value}, timeout, version)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        expires = self._expires(timeout)
+        connection = self._connection()
+        connection.executemany(
+            'INSERT OR REPLACE INTO cache (key, value, expires) VALUES (?, ?, ?)',
+            [(self._key(key, version), pickle.dumps(value, pickle.HIGHEST_PROTOCOL), expires)
+             for key, value in data.items()])
+        self._sets += len(data)
+        if self._sets >= self._cull_frequency * 100:
+            self._sets = 0
+            self._cull(connection)
+        return []
+
+    def _cull(self, connection):
+        connection.execute('DELETE FROM cache WHERE expires IS NOT NULL AND expires <= ?', (time.time(),))
+        count = connection.execute('SELECT COUNT(*) FROM cache').fetchone()[0]
+        if count > self._max_entries:
+            # Like the database cache: drop a 1/CULL_FREQUENCY share, soonest to expire first.
+            connection.execute(
+                'DELETE FROM cache WHERE key IN (SELECT key FROM cache ORDER BY expires IS NULL, expires LIMIT ?)',
+                (count // self._cull_frequency,))
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        cursor = self._connection().execute(
+            'UPDATE cache SET expires = ? WHERE key = ? AND (expires IS NULL OR expires > ?)',
+            (self._expires(timeout), self._key(key, version), time.time()))
+        return cursor.rowcount == 1
+
+    def delete(self, key, version=None):
+        self._connection().execute('DELETE FROM cache WHERE key = ?', (self._key(key, version),))
+
+    def delete_many(self, keys, version=None):
+        keys = [self._key(key, version) for key in keys]
+        if keys:
+            self._connection().execute('DELETE FROM cache WHERE key IN (%s)' % ', '.join('?' * len(keys)), keys)
+
+    def delete_prefix(self, prefix):
+        """Drop every entry whose key starts with ``prefix``, e.g. a key prefix that is no longer used."""
+        self._connection().execute('DELETE FROM cache WHERE substr(key, 1, ?) = ?', (len(prefix), prefix))
+
+    def has_key(self, key, version=None):
+        return self._connection().execute(
+            'SELECT 1 FROM cache WHERE key = ? AND (expires IS NULL OR expires > ?)',
+            (self._key(key, version), time.time())).fetchone() is not None
+
+    def incr(self, key, delta=1, version=None):
+        key = self._key(key, version)
+        connection = self._connection()
+        # BEGIN IMMEDIATE takes the write lock first, so read and update can't interleave.
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            row = connection.execute(
+                'SELECT value FROM cache WHERE key = ? AND (expires IS NULL OR expires > ?)',
+                (key, time.time())).fetchone()
+            if row is None:
+                raise ValueError("Key '%s' not found" % key)
+            value = pickle.loads(row[0]) + delta
+            connection.execute('UPDATE cache SET value = ? WHERE key = ?',
+                               (pickle.dumps(value, pickle.HIGHEST_PROTOCOL), key))
+        except Exception:
+            connection.execute('ROLLBACK')
+            raise
+        connection.execute('COMMIT')
+        return value
+
+    def clear(self):
+        self._connection().execute('DELETE FROM cache')
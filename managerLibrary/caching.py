@@ -0,0 +1,122 @@
+import hashlib
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+
+
+# Cached reports depend on models through generation numbers: every write
+# to a model bumps its generation, and an entry computed under other
+# generations than the current ones is stale. Entries outlive their fresh
+# period by STALE_TIMEOUT, so while one request recomputes a stale entry the
+# others keep being served the previous value instead of piling onto the
+# database; with nothing to serve they wait for it instead.
+GENERATION_KEY = 'generation:%s'
+ENTRY_KEY = 'report:%s'
+LOCK_KEY = 'report-lock:%s'
+FRESH_TIMEOUT = 10 * 60
+STALE_TIMEOUT = 60 * 60
+LOCK_TIMEOUT = 30
+WAIT_INTERVAL = 0.05
+
+
+def _label(model):
+    return model if isinstance(model, str) else model._meta.label
+
+
+def _new_generation():
+    # Like roster versions, generations start from the clock so one that was
+    # evicted can't come back with a number some cached entry was built under.
+    return int(time.time() * 1000)
+
+
+def generations(models):
+    """The current generation of each model (or model label), as a tuple."""
+    keys = [GENERATION_KEY % _label(model) for model in models]
+    found = cache.get_many(keys)
+    for key in keys:
+        if key not in found:
+            cache.add(key, _new_generation(), None)
+            found[key] = cache.get(key)
+    return tuple(found[key] for key in keys)
+
+
+def _bump(labels):
+    for label in labels:
+        try:
+            cache.incr(GENERATION_KEY % label)
+        except ValueError:
+            # No generation yet means nothing was cached under it.
+            pass
+
+
+class _PendingBumps(object):
+    """The models written to in a transaction, bumped once when it commits."""
+
+    def __init__(self):
+        self.labels = set()
+
+    def __call__(self):
+        _bump(self.labels)
+
+
+def bump(*models):
+    """
+    Mark everything cached from these models as stale. Inside a transaction
+    the bump waits for the commit, since until then other requests would
+    only recompute from the data as it was, and all the transaction's
+    writes share one bump per model.
+    """
+    labels = {_label(model) for model in models}
+    connection = transaction.get_connection()
+    if not connection.in_atomic_block:
+        _bump(labels)
+        return
+    # A rolled back savepoint takes its on_commit callbacks, and so what
+    # they held, with it.
+    pending = next((callback for _, callback in reversed(connection.run_on_commit)
+                    if isinstance(callback, _PendingBumps)), None)
+    if pending is None:
+        pending = _PendingBumps()
+        transaction.on_commit(pending)
+    pending.labels |= labels
+
+
+def make_key(*parts):
+    """A cache key for any parts, user input included."""
+    return hashlib.md5(repr(parts).encode('utf-8')).hexdigest()
+
+
+def cached(key, compute, depends_on, timeout=FRESH_TIMEOUT, stale_timeout=STALE_TIMEOUT):
+    """
+    ``compute()``, cached under ``key`` until ``timeout`` seconds pass or
+    one of the ``depends_on`` models is written to. Only one process at a
+    time recomputes a key; meanwhile the others get the stale value if there
+    is one, or wait up to LOCK_TIMEOUT for the result.
+    """
+    entry_key, lock_key = ENTRY_KEY % key, LOCK_KEY % key
+    current = generations(depends_on)
+    entry = cache.get(entry_key)
+    if entry is not None and entry[1] == current and entry[2] > time.time():
+        return entry[0]
+
+    if cache.add(lock_key, True, LOCK_TIMEOUT):
+        try:
+            value = compute()
+            cache.set(entry_key, (value, current, time.time() + timeout), timeout + stale_timeout)
+        finally:
+            cache.delete(lock_key)
+        return value
+    if entry is not None:
+        return entry[0]
+
+    deadline = time.time() + LOCK_TIMEOUT
+    while time.time() < deadline:
+        time.sleep(WAIT_INTERVAL)
+        entry = cache.get(entry_key)
+        if entry is not None:
+            return entry[0]
+        if not cache.has_key(lock_key):
+            break
+    # Whoever held the lock gave up; don't wait on them forever.
+    return compute()
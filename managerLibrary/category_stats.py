@@ -0,0 +1,168 @@
+import heapq
+import operator
+from collections import defaultdict
+from functools import reduce
+
+from django.db import transaction
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .caching import bump
+from .models import CategoryDailyCount, Comment, CourseHistory, Student
+
+
+DEFAULT_CHUNK_SIZE = 5000
+DEFAULT_TOP = 5
+
+CommentCategory = Comment.categories.through
+
+
+def comment_bucket(comment):
+    """The (student id, local day) a comment is counted under."""
+    date = comment.__dict__.get('date')
+    return comment.__dict__.get('student_id'), timezone.localdate(date) if date else None
+
+
+def course_timelines(student_ids=None):
+    """Each student's course registrations as (course id, valid from, valid to), oldest first."""
+    histories = CourseHistory.objects.order_by('id')
+    if student_ids is not None:
+        histories = histories.filter(student_id__in=student_ids)
+    timelines = defaultdict(list)
+    for student_id, course_id, valid_from, valid_to in histories.values_list(
+            'student_id', 'id_course_id', 'valid_from', 'valid_to'):
+        timelines[student_id].append((course_id, valid_from, valid_to))
+    return timelines
+
+
+def course_on(timeline, day):
+    """
+    The course a student was in on ``day``, by the course timeline: the
+    latest registration valid that day, else the latest one started by
+    then, else their first one. Rows from before the timeline have no
+    range and count as valid every day.
+    """
+    started = [row for row in timeline if row[1] is None or row[1] <= day]
+    valid = [row for row in started if row[2] is None or day < row[2]]
+    if valid or started:
+        return (valid or started)[-1][0]
+    return timeline[0][0] if timeline else None
+
+
+def _counts(comment_categories):
+    return comment_categories.filter(comment__deleted_at=None).values(
+        'category_id', 'comment__student_id', day=TruncDate('comment__date')).annotate(
+        count=Count('comment_id')).order_by()
+
+
+def refresh_buckets(buckets):
+    """
+    Recount the given (student id, day) buckets from the comments, each
+    under the course the student was in that day. Costs a fixed number of
+    queries, so signal handlers call it for every change. The students are
+    locked first, so concurrent recounts of one student run one at a time
+    instead of colliding on the unique (student, day, category).
+    """
+    buckets = {bucket for bucket in buckets if None not in bucket}
+    if not buckets:
+        return
+    students = {student_id for student_id, _ in buckets}
+    days = {day for _, day in buckets}
+    with transaction.atomic():
+        list(Student.all_objects.select_for_update().filter(pk__in=students).values_list('pk'))
+        rows = _counts(CommentCategory.objects.filter(comment__student_id__in=students, comment__date__date__in=days))
+        timelines = course_timelines(students)
+        CategoryDailyCount.objects.filter(reduce(operator.or_, (
+            Q(student_id=student_id, day=day) for student_id, day in buckets))).delete()
+        CategoryDailyCount.objects.bulk_create([
+            CategoryDailyCount(category_id=row['category_id'], student_id=row['comment__student_id'],
+                               course_id=course_on(timelines[row['comment__student_id']], row['day']),
+                               day=row['day'], count=row['count'])
+            # Students times days may cover more than the buckets asked for.
+            for row in rows if (row['comment__student_id'], row['day']) in buckets
+        ])
+    bump(CategoryDailyCount)
+
+
+def move_students(student_ids):
+    """
+    Point the students' counts at the course they were in on each day,
+    after their course timeline changed. Days the change doesn't cover
+    keep their course, so earlier notes stay with earlier courses.
+    """
+    timelines = course_timelines(student_ids)
+    moved = defaultdict(list)
+    for pk, student_id, day, course_id in CategoryDailyCount.objects.filter(student_id__in=student_ids).values_list(
+            'id', 'student_id', 'day', 'course_id'):
+        new_course_id = course_on(timelines[student_id], day)
+        if new_course_id != course_id:
+            moved[new_course_id].append(pk)
+    for course_id, ids in moved.items():
+        CategoryDailyCount.objects.filter(pk__in=ids).update(course_id=course_id)
+    if moved:
+        bump(CategoryDailyCount)
+
+
+def backfill(chunk_size=DEFAULT_CHUNK_SIZE):
+    """Rebuild the whole table from the comments. Returns the number of rows written."""
+    timelines = course_timelines()
+    written = 0
+    with transaction.atomic():
+        CategoryDailyCount.objects.all().delete()
+        batch = []
+        for row in _counts(CommentCategory.objects.all()).iterator(chunk_size=chunk_size):
+            batch.append(CategoryDailyCount(
+                category_id=row['category_id'], student_id=row['comment__student_id'],
+                course_id=course_on(timelines[row['comment__student_id']], row['day']), day=row['day'],
+                count=row['count']))
+            if len(batch) == chunk_size:
+                CategoryDailyCount.objects.bulk_create(batch)
+                written += len(batch)
+                batch = []
+        CategoryDailyCount.objects.bulk_create(batch)
+        written += len(batch)
+    bump(CategoryDailyCount)
+    return written
+
+
+def _counts_between(start, end, course_id=None, category_ids=None):
+    counts = CategoryDailyCount.objects.filter(
+        day__gte=start, day__lte=end, category__deleted_at=None, student__deleted_at=None)
+    if course_id is not None:
+        counts = counts.filter(course_id=course_id)
+    if category_ids is not None:
+        counts = counts.filter(category_id__in=category_ids)
+    return counts
+
+
+def category_stats(start, end, course_id=None, category_ids=None, top=DEFAULT_TOP):
+    """
+    Per category, for the days from ``start`` to ``end``: the total, the
+    count of each day and the ``top`` students with most comments. Reads
+    only the rollup table, three grouped queries whatever the size of the
+    comment history.
+    """
+    counts = _counts_between(start, end, course_id, category_ids)
+    categories = {
+        row['category_id']: {
+            'id': row['category_id'], 'name': row['category__name'], 'total': row['total'],
+            'trend': [], 'top_students': [],
+        }
+        for row in counts.values('category_id', 'category__name').annotate(total=Sum('count')).order_by()
+    }
+    for category_id, day, total in counts.values('category_id', 'day').annotate(
+            total=Sum('count')).order_by('day').values_list('category_id', 'day', 'total'):
+        categories[category_id]['trend'].append((day, total))
+
+    students = defaultdict(list)
+    for row in counts.values('category_id', 'student_id', 'student__first_name', 'student__last_name').annotate(
+            total=Sum('count')).order_by():
+        students[row['category_id']].append(row)
+    for category_id, rows in students.items():
+        categories[category_id]['top_students'] = [
+            {'id': row['student_id'], 'name': '%s %s' % (row['student__first_name'], row['student__last_name']),
+             'count': row['total']}
+            for row in heapq.nsmallest(top, rows, key=lambda row: (-row['total'], row['student_id']))
+        ]
+    return sorted(categories.values(), key=lambda category: (-category['total'], category['name']))
@@ -0,0 +1,45 @@
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from django.db import DEFAULT_DB_ALIAS, close_old_connections, connections
+
+from .databases import is_pinned, pin_primary, unpin
+from .middleware import current_metrics, track_queries
+
+
+# Threads the ORM calls of gather() run in. Each keeps its own persistent
+# database connection, so this also bounds the connections it opens.
+MAX_WORKERS = 8
+
+_executor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix='orm')
+
+
+def _bridge(call, metrics, pinned):
+    def run():
+        # Worker threads never see request_started/finished, so expire their
+        # connections here, by the same CONN_MAX_AGE rules.
+        close_old_connections()
+        # Read from wherever the calling thread would.
+        unpin()
+        if pinned:
+            pin_primary()
+        if metrics is None:
+            return call()
+        with track_queries(metrics):
+            return call()
+    return run
+
+
+def gather(*calls):
+    """
+    Run independent ORM calls at the same time and return their results in
+    order. Their queries count towards the current request's metrics.
+
+    Inside a transaction the calls run one after another in this thread
+    instead, since other connections can't see its uncommitted rows.
+    """
+    if len(calls) < 2 or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+        return [call() for call in calls]
+    metrics, pinned = current_metrics(), is_pinned()
+    futures = [_executor.submit(_bridge(call, metrics, pinned)) for call in calls]
+    wait(futures)
+    return [future.result() for future in futures]
@@ -0,0 +1,8 @@
+from django.utils.functional import SimpleLazyObject
+
+from .roles import role_for_request
+
+
+def role(request):
+    """Expose the logged-in user's cached Role to every template as ``Role``."""
+    return {'Role': SimpleLazyObject(lambda: role_for_request(request))}
@@ -0,0 +1,111 @@
+import random
+import threading
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from .models import AttendanceBitmap, CategoryDailyCount, CustomUser, SoftDeletionModel, StudentAcademicSummary
+
+
+# Applied to every new SQLite connection. WAL lets report reads run while a
+# roll call is being written; the rest trades a little durability on power
+# loss (never corruption) for far fewer fsyncs, and keeps more pages cached.
+SQLITE_PRAGMAS = (
+    ('journal_mode', 'WAL'),
+    ('synchronous', 'NORMAL'),
+    ('busy_timeout', 20000),
+    ('cache_size', -20000),
+    ('temp_store', 'MEMORY'),
+    ('mmap_size', 256 * 1024 * 1024),
+)
+
+_state = threading.local()
+
+
+def pin_primary():
+    """
+    Send this thread's reads to the primary until unpin() is called, which
+    happens at the end of every request and before every job.
+    """
+    _state.pinned = True
+
+
+def unpin():
+    _state.pinned = _state.wrote = False
+
+
+def unpin_after_request(**kwargs):
+    """request_finished handler: a write pins the thread only for the rest of its request."""
+    unpin()
+
+
+def is_pinned():
+    return getattr(_state, 'pinned', False)
+
+
+def has_written():
+    """Whether this thread wrote to the primary since it was last unpinned."""
+    return getattr(_state, 'wrote', False)
+
+
+def _reportable(model):
+    # School data and the tables derived from it; users, sessions and the
+    # rest of auth always read from the primary.
+    return (issubclass(model, (SoftDeletionModel, StudentAcademicSummary, AttendanceBitmap, CategoryDailyCount))
+            and not issubclass(model, CustomUser))
+
+
+class ReplicaRouter(object):
+    """
+    Send reads of the school's data to one of ``settings.REPLICA_DATABASES``,
+    and everything else to the primary. Reads go to the primary instead
+    when the thread has written (see pin_primary()) or is inside a
+    transaction, so nobody reads around their own writes.
+    """
+
+    def __init__(self):
+        self.replicas = list(getattr(settings, 'REPLICA_DATABASES', []))
+
+    def db_for_read(self, model, **hints):
+        if not self.replicas or is_pinned() or not _reportable(model):
+            return DEFAULT_DB_ALIAS
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return random.choice(self.replicas)
+
+    def db_for_write(self, model, **hints):
+        pin_primary()
+        _state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        aliases = {DEFAULT_DB_ALIAS} | set(self.replicas)
+        if obj1._state.db in aliases and obj2._state.db in aliases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas get their schema through replication.
+        return db not in self.replicas
+
+
+def configure_sqlite(sender, connection, **kwargs):
+    """connection_created handler applying SQLITE_PRAGMAS."""
+    if connection.vendor != 'sqlite':
+        return
+    # On the raw connection, so request instrumentation doesn't count them.
+    for pragma, value in SQLITE_PRAGMAS:
+        connection.connection.execute('PRAGMA %s = %s' % (pragma, value))
+
+
+def check_connections(**kwargs):
+    """
+    request_started handler: drop persistent connections (CONN_MAX_AGE)
+    that went bad while idle, e.g. after a database restart, before the
+    request runs into them. Set CONN_HEALTH_CHECKS in a database's settings
+    to enable it.
+    """
+    for connection in connections.all():
+        if connection.connection is not None and connection.settings_dict.get('CONN_HEALTH_CHECKS') \
+                and not connection.is_usable():
+            connection.close()
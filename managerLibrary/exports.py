@@ -0,0 +1,289 @@
+import csv
+import io
+import re
+import zipfile
+from collections import namedtuple
+from datetime import date as Date, datetime
+from itertools import chain, islice
+from xml.sax.saxutils import escape
+
+from django.db.models import F
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import Comment, Course, Grades, Presence
+from .timeline import valid_on
+
+
+DEFAULT_CHUNK_SIZE = 2000
+ROWS_PER_CHUNK = 500
+XLSX_FLUSH_BYTES = 64 * 1024
+CELL_CACHE_SIZE = 10000
+
+CSV = 'csv'
+XLSX = 'xlsx'
+CONTENT_TYPES = {
+    CSV: 'text/csv; charset=utf-8',
+    XLSX: 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+}
+
+Column = namedtuple('Column', ['header', 'field', 'format'])
+# ``day`` is the day whose course a row is exported under, as an expression
+# of the row; None for the course the student is in today.
+Export = namedtuple('Export', ['model', 'columns', 'date_lookup', 'day', 'order_by'])
+
+_YEARS = dict(Course.YEAR_IN_SCHOOL_CHOICES)
+_SHIFTS = dict(Course.SHIFT_IN_SCHOOL_CHOICES)
+
+# Rows are exported under the course the student was in on the row's day,
+# so every export starts with the course columns.
+HISTORY = 'student__courseHistory__'
+COURSE = HISTORY + 'id_course__'
+COURSE_COLUMNS = [
+    Column('Año', COURSE + 'year', _YEARS.get),
+    Column('División', COURSE + 'division', None),
+    Column('Turno', COURSE + 'shift', _SHIFTS.get),
+    Column('Apellido', 'student__last_name', None),
+    Column('Nombre', 'student__first_name', None),
+]
+COURSE_ORDER = [COURSE + 'year', COURSE + 'division', COURSE + 'shift', 'student__last_name', 'student__first_name']
+
+
+def _presence(value):
+    return {True: 'Presente', False: 'Ausente'}.get(value)
+
+
+def _local_datetime(value):
+    """Naive local time to the second, which reads well in both formats."""
+    return timezone.localtime(value).replace(tzinfo=None, microsecond=0)
+
+
+EXPORTS = {
+    'notas': Export(Grades, COURSE_COLUMNS + [
+        Column('Materia', 'subject__name', None),
+        Column('Nota', 'grade', None),
+    ], None, None, COURSE_ORDER + ['subject__name', 'id']),
+    'comentarios': Export(Comment, COURSE_COLUMNS + [
+        Column('Fecha', 'date', _local_datetime),
+        Column('Comentario', 'description', None),
+    ], 'date__date', TruncDate('date'), COURSE_ORDER + ['date', 'id']),
+    'asistencia': Export(Presence, COURSE_COLUMNS + [
+        Column('Fecha', 'date', None),
+        Column('Asistencia', 'presence', _presence),
+    ], 'date', F('date'), COURSE_ORDER + ['date', 'id']),
+}
+
+
+def export_rows(kind, year=None, division=None, shift=None, start=None, end=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Lazily yield the rows of one export as tuples, reading ``chunk_size`` rows
+    from the database at a time. Course filters match Course.year, division
+    and shift codes; the date range is inclusive and ignored for grades,
+    which have no date and go under the student's current course.
+    """
+    export = EXPORTS[kind]
+    filters = {HISTORY + 'deleted_at': None, COURSE + 'deleted_at': None}
+    for field, value in (('year', year), ('division', division), ('shift', shift)):
+        if value:
+            filters[COURSE + field] = value
+    if export.date_lookup and start:
+        filters[export.date_lookup + '__gte'] = start
+    if export.date_lookup and end:
+        filters[export.date_lookup + '__lte'] = end
+    # One filter() call, so the course columns come from the same join.
+    queryset = export.model.objects.filter(valid_on(export.day or timezone.localdate(), HISTORY), **filters)
+
+    formats = [column.format for column in export.columns]
+    rows = queryset.order_by(*export.order_by).values_list(*[column.field for column in export.columns])
+    for row in rows.iterator(chunk_size=chunk_size):
+        yield tuple(value if format is None else format(value) for value, format in zip(row, formats))
+
+
+def export_header(kind):
+    return [column.header for column in EXPORTS[kind].columns]
+
+
+# Spreadsheets read text starting with these as a formula.
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+
+def _csv_value(value):
+    # A leading quote makes the cell text, so names and comments can't run as formulas.
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+def csv_stream(header, rows):
+    """Yield a CSV document as text chunks of a few hundred rows each."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    # The BOM makes Excel open the file as UTF-8.
+    buffer.write('\ufeff')
+    writer.writerow(header)
+    for batch in _batches(rows):
+        writer.writerows([_csv_value(value) for value in row] for row in batch)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
+
+
+def _batches(rows, size=ROWS_PER_CHUNK):
+    iterator = iter(rows)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+# A minimal SpreadsheetML workbook with one sheet. Strings are written inline
+# instead of through a shared string table, so nothing has to be kept in
+# memory while rows go out.
+
+_STATIC_PARTS = [
+    ('[Content_Types].xml',
+     '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+     '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+     '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+     '<Default Extension="xml" ContentType="application/xml"/>'
+     '<Override PartName="/xl/workbook.xml" '
+     'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+     '<Override PartName="/xl/worksheets/sheet1.xml" '
+     'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+     '<Override PartName="/xl/styles.xml" '
+     'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+     '</Types>'),
+    ('_rels/.rels',
+     '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+     '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+     '<Relationship Id="rId1" '
+     'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+     'Target="xl/workbook.xml"/>'
+     '</Relationships>'),
+    ('xl/workbook.xml',
+     '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+     '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+     'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+     '<sheets><sheet name="%s" sheetId="1" r:id="rId1"/></sheets>'
+     '</workbook>'),
+    ('xl/_rels/workbook.xml.rels',
+     '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+     '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+     '<Relationship Id="rId1" '
+     'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+     'Target="worksheets/sheet1.xml"/>'
+     '<Relationship Id="rId2" '
+     'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles" '
+     'Target="styles.xml"/>'
+     '</Relationships>'),
+    # Style 1 is a date, style 2 a date and time, both built-in number formats.
+    ('xl/styles.xml',
+     '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+     '<styleSheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+     '<fonts count="1"><font><sz val="11"/><name val="Calibri"/></font></fonts>'
+     '<fills count="2"><fill><patternFill patternType="none"/></fill>'
+     '<fill><patternFill patternType="gray125"/></fill></fills>'
+     '<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>'
+     '<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>'
+     '<cellXfs count="3"><xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/>'
+     '<xf numFmtId="14" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/>'
+     '<xf numFmtId="22" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/></cellXfs>'
+     '</styleSheet>'),
+]
+
+_SHEET_HEAD = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>')
+_SHEET_TAIL = '</sheetData></worksheet>'
+
+_EPOCH = datetime(1899, 12, 30)
+_INVALID_XML = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+
+def _cell(value):
+    # Cells carry no reference; SpreadsheetML places them one after another,
+    # so empty values still need an empty cell.
+    if isinstance(value, str):
+        return '<c t="inlineStr"><is><t xml:space="preserve">%s</t></is></c>' % escape(_INVALID_XML.sub('', value))
+    if value is None:
+        return '<c/>'
+    if isinstance(value, bool):
+        return '<c t="b"><v>%d</v></c>' % value
+    if isinstance(value, (int, float)):
+        return '<c><v>%r</v></c>' % value
+    if isinstance(value, datetime):
+        if timezone.is_aware(value):
+            value = timezone.make_naive(value)
+        return '<c s="2"><v>%.6f</v></c>' % ((value - _EPOCH).total_seconds() / 86400)
+    if isinstance(value, Date):
+        return '<c s="1"><v>%d</v></c>' % (value - _EPOCH.date()).days
+    return _cell(str(value))
+
+
+class _Sink(object):
+    """Write-only, non-seekable target for ZipFile; collects what was written."""
+
+    def __init__(self):
+        self.chunks = []
+        self.size = 0
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.size += len(data)
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def take(self):
+        data = b''.join(self.chunks)
+        self.chunks, self.size = [], 0
+        return data
+
+
+def xlsx_stream(header, rows, sheet_name='Datos'):
+    """Yield an XLSX workbook as byte chunks, in constant memory."""
+    sink = _Sink()
+    with zipfile.ZipFile(sink, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for name, content in _STATIC_PARTS:
+            if name == 'xl/workbook.xml':
+                content = content % escape(sheet_name, {'"': '&quot;'})
+            archive.writestr(name, content)
+        yield sink.take()
+
+        # Course, subject and student names repeat a lot; reuse their XML.
+        # The cache is emptied when it grows, so memory stays bounded.
+        cells = {}
+        # The sheet's size isn't known up front; ZIP64 lifts the 4GB limit.
+        with archive.open('xl/worksheets/sheet1.xml', 'w', force_zip64=True) as sheet:
+            sheet.write(_SHEET_HEAD.encode())
+            for batch in _batches(chain([header], rows)):
+                xml = []
+                for row in batch:
+                    xml.append('<row>')
+                    for value in row:
+                        # Keyed by value, so only strings: True == 1 would collide.
+                        if value.__class__ is not str:
+                            xml.append(_cell(value))
+                        elif value in cells:
+                            xml.append(cells[value])
+                        else:
+                            if len(cells) >= CELL_CACHE_SIZE:
+                                cells.clear()
+                            xml.append(cells.setdefault(value, _cell(value)))
+                    xml.append('</row>')
+                sheet.write(''.join(xml).encode())
+                if sink.size >= XLSX_FLUSH_BYTES:
+                    yield sink.take()
+            sheet.write(_SHEET_TAIL.encode())
+    yield sink.take()
+
+
+def export_stream(kind, format, **filters):
+    """The chunks of one export in ``format`` (csv or xlsx)."""
+    header, rows = export_header(kind), export_rows(kind, **filters)
+    if format == XLSX:
+        return xlsx_stream(header, rows, sheet_name=kind.capitalize())
+    return csv_stream(header, rows)
@@ -0,0 +1,100 @@
+import base64
+import json
+from collections import namedtuple
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+from .models import Comment
+
+
+ORDER_BY_DATE = 'fecha'
+ORDER_BY_NAME = 'alfabetico'
+
+# Each sort mode is a list of (field, descending, parser) tuples. The last
+# field is always the primary key so that the ordering is total and the
+# cursor identifies exactly one position in the feed.
+SORT_MODES = {
+    ORDER_BY_DATE: (
+        ('date', True, parse_datetime),
+        ('id', True, int),
+    ),
+    ORDER_BY_NAME: (
+        ('student__last_name', False, str),
+        ('student__first_name', False, str),
+        ('id', False, int),
+    ),
+}
+
+DEFAULT_PAGE_SIZE = 20
+
+FeedPage = namedtuple('FeedPage', ['object_list', 'next_cursor', 'has_next', 'order'])
+
+
+def encode_cursor(values):
+    raw = json.dumps([v.isoformat() if hasattr(v, 'isoformat') else v for v in values])
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor, order):
+    return decode_keys(cursor, SORT_MODES[order])
+
+
+def decode_keys(cursor, fields):
+    """The values of ``fields``, a sort mode, that ``cursor`` points after."""
+    try:
+        raw = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8'))
+        values = [parser(value) for (_, _, parser), value in zip(fields, raw)]
+    except (TypeError, ValueError, UnicodeError):
+        raise ValueError('Invalid cursor')
+    if len(values) != len(fields) or None in values:
+        raise ValueError('Invalid cursor')
+    return values
+
+
+def _after(fields, values):
+    """Build the keyset predicate "row comes after (values)" for a sort mode."""
+    condition = Q()
+    for i, (field, descending, _) in enumerate(fields):
+        step = Q(**{'%s__%s' % (field, 'lt' if descending else 'gt'): values[i]})
+        for previous, (previous_field, _, _) in enumerate(fields[:i]):
+            step &= Q(**{previous_field: values[previous]})
+        condition |= step
+    return condition
+
+
+def comment_feed(queryset=None, order=ORDER_BY_DATE, cursor=None, page_size=DEFAULT_PAGE_SIZE):
+    """
+    Return one page of comments using keyset pagination.
+
+    A page costs two queries no matter how deep into the history it is: one
+    for the comments with their student and author, and one for the
+    categories of every comment in the page.
+    """
+    if order not in SORT_MODES:
+        order = ORDER_BY_DATE
+    fields = SORT_MODES[order]
+
+    if queryset is None:
+        queryset = Comment.objects.all()
+    queryset = queryset.select_related('student', 'author').prefetch_related('categories')
+    queryset = queryset.order_by(*[('-' if descending else '') + field for field, descending, _ in fields])
+
+    if cursor:
+        queryset = queryset.filter(_after(fields, decode_cursor(cursor, order)))
+
+    comments = list(queryset[:page_size + 1])
+    has_next = len(comments) > page_size
+    comments = comments[:page_size]
+
+    next_cursor = None
+    if has_next:
+        last = comments[-1]
+        next_cursor = encode_cursor([_resolve(last, field) for field, _, _ in fields])
+    return FeedPage(comments, next_cursor, has_next, order)
+
+
+def _resolve(obj, field):
+    for attr in field.split('__'):
+        obj = getattr(obj, attr)
+    return obj
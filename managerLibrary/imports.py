@@ -0,0 +1,325 @@
+import csv
+import json
+import os
+import re
+import unicodedata
+from collections import deque, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, time
+
+import django
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from . import search
+from .models import Course, CourseHistory, Phone, Student, StudentAcademicSummary
+from .rosters import invalidate_rosters
+from .summaries import refresh_summaries
+from .timeline import cycle_of
+
+
+DEFAULT_CHUNK_SIZE = 500
+
+# Column names of the ministry's enrollment files.
+FIRST_NAME = 'nombre'
+LAST_NAME = 'apellido'
+BIRTHDAY = 'fecha_nacimiento'
+PHONES = 'telefono'
+YEAR = 'anio'
+DIVISION = 'division'
+SHIFT = 'turno'
+COLUMNS = (FIRST_NAME, LAST_NAME, BIRTHDAY, PHONES, YEAR, DIVISION, SHIFT)
+
+DATE_FORMATS = ('%Y-%m-%d', '%d/%m/%Y', '%d-%m-%Y')
+PHONE_SEPARATORS = re.compile(r'[;/,]')
+VALID_PHONE = re.compile(r'^\+?[\d\s()-]{6,50}$')
+
+# One cleaned row: the student's dedup key, their phones and the
+# (year, division, shift) codes of their course.
+StudentRow = namedtuple('StudentRow', ['row', 'first_name', 'last_name', 'birthday', 'phones', 'course'])
+RowError = namedtuple('RowError', ['row', 'field', 'message'])
+
+
+class ImportReport(object):
+    """Counts of what an import wrote, and the rows it rejected."""
+
+    def __init__(self, rows=0, rejected=0, created=0, existing=0, phones=0, course_histories=0):
+        self.rows = rows
+        self.rejected = rejected
+        self.created = created
+        self.existing = existing
+        self.phones = phones
+        self.course_histories = course_histories
+        self.errors = []
+
+    def counts(self):
+        return {
+            'rows': self.rows,
+            'rejected': self.rejected,
+            'created': self.created,
+            'existing': self.existing,
+            'phones': self.phones,
+            'course_histories': self.course_histories,
+        }
+
+
+def _fold(text):
+    decomposed = unicodedata.normalize('NFKD', text)
+    return ''.join(c for c in decomposed if not unicodedata.combining(c)).strip().lower()
+
+
+def _aliases(choices):
+    """Map codes and labels, case and accent insensitive, to the choice code."""
+    aliases = {}
+    for code, label in choices:
+        aliases[_fold(code)] = code
+        aliases[_fold(label)] = code
+    return aliases
+
+
+def _clean_chunk(rows):
+    """
+    Validate raw (row number, dict) pairs. Runs in the worker processes, so
+    it only parses; nothing here touches the database.
+    """
+    years = _aliases(Course.YEAR_IN_SCHOOL_CHOICES)
+    divisions = _aliases(Course.DIVISION_IN_SCHOOL_CHOICES)
+    shifts = _aliases(Course.SHIFT_IN_SCHOOL_CHOICES)
+    shifts.update((_fold(label).replace('turno ', ''), code) for code, label in Course.SHIFT_IN_SCHOOL_CHOICES)
+
+    cleaned, errors = [], []
+    for number, raw in rows:
+        row_errors = []
+        names = []
+        for field in (FIRST_NAME, LAST_NAME):
+            name = ' '.join((raw.get(field) or '').split())
+            if not name:
+                row_errors.append(RowError(number, field, 'Campo obligatorio'))
+            elif len(name) > 50:
+                row_errors.append(RowError(number, field, 'Más de 50 caracteres'))
+            names.append(name)
+
+        birthday = None
+        for date_format in DATE_FORMATS:
+            try:
+                birthday = datetime.strptime((raw.get(BIRTHDAY) or '').strip(), date_format).date()
+                break
+            except ValueError:
+                pass
+        if birthday is None:
+            row_errors.append(RowError(number, BIRTHDAY, 'Fecha inválida'))
+
+        phones = []
+        for phone in PHONE_SEPARATORS.split(raw.get(PHONES) or ''):
+            phone = ' '.join(phone.split())
+            if not phone:
+                continue
+            if VALID_PHONE.match(phone):
+                phones.append(phone)
+            else:
+                row_errors.append(RowError(number, PHONES, 'Teléfono inválido: %s' % phone))
+
+        course = []
+        for field, aliases in ((YEAR, years), (DIVISION, divisions), (SHIFT, shifts)):
+            code = aliases.get(_fold(raw.get(field) or ''))
+            if code is None:
+                row_errors.append(RowError(number, field, 'Valor inválido'))
+            course.append(code)
+
+        if row_errors:
+            errors.extend(row_errors)
+        else:
+            cleaned.append(StudentRow(number, names[0], names[1], birthday, tuple(phones), tuple(course)))
+    return cleaned, errors
+
+
+def _read_chunks(path, chunk_size, skip):
+    """Yield lists of (row number, dict) from the CSV, after the first ``skip`` rows."""
+    with open(path, newline='', encoding='utf-8-sig') as source:
+        reader = csv.DictReader(source)
+        missing = set(COLUMNS) - {(name or '').strip().lower() for name in reader.fieldnames or ()}
+        if missing - {PHONES}:
+            raise ValueError('Faltan columnas: %s' % ', '.join(sorted(missing - {PHONES})))
+        chunk = []
+        # Row 1 is the header.
+        for number, raw in enumerate(reader, 2):
+            if number - 2 < skip:
+                continue
+            chunk.append((number, {(key or '').strip().lower(): value for key, value in raw.items()}))
+            if len(chunk) == chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+
+def _cleaned_chunks(chunks, workers):
+    """_clean_chunk over ``chunks``, in a process pool when workers > 1, in order."""
+    if workers <= 1:
+        for chunk in chunks:
+            yield chunk, _clean_chunk(chunk)
+        return
+    with ProcessPoolExecutor(max_workers=workers, initializer=django.setup) as executor:
+        # Keep a bounded number of chunks in flight so huge files aren't read
+        # into memory ahead of the writer.
+        pending = deque()
+        for chunk in chunks:
+            pending.append((chunk, executor.submit(_clean_chunk, chunk)))
+            if len(pending) >= workers * 2:
+                chunk, future = pending.popleft()
+                yield chunk, future.result()
+        while pending:
+            chunk, future = pending.popleft()
+            yield chunk, future.result()
+
+
+def _student_ids(keys, queryset=None):
+    """Alive students by (first name, last name, birthday) for the given keys."""
+    keys = set(keys)
+    found = {}
+    last_names = list({last_name for _, last_name, _ in keys})
+    queryset = Student.objects.all() if queryset is None else queryset
+    for start in range(0, len(last_names), DEFAULT_CHUNK_SIZE):
+        students = queryset.filter(last_name__in=last_names[start:start + DEFAULT_CHUNK_SIZE]).values_list(
+            'id', 'first_name', 'last_name', 'birthday')
+        for pk, first_name, last_name, birthday in students:
+            key = (first_name, last_name, timezone.localtime(birthday).date())
+            if key in keys:
+                found.setdefault(key, pk)
+    return found
+
+
+def _write_chunk(rows, courses, seen, report):
+    """
+    Upsert one chunk of cleaned rows: create the students that don't exist
+    yet, then add the phones and course registrations they're missing.
+    Costs a fixed number of queries per chunk.
+    """
+    students = {}
+    for row in rows:
+        key = (row.first_name, row.last_name, row.birthday)
+        if key in seen:
+            report.errors.append(RowError(row.row, '', 'Alumno repetido en la fila %d' % seen[key]))
+            continue
+        course_id = courses.get(row.course)
+        if course_id is None:
+            report.errors.append(RowError(row.row, YEAR, 'No existe el curso %s %s %s' % row.course))
+            continue
+        seen[key] = row.row
+        students[key] = (row, course_id)
+    if not students:
+        return
+
+    with transaction.atomic():
+        ids = _student_ids(students)
+        existing_ids = list(ids.values())
+        new = [key for key in students if key not in ids]
+        last_id = Student.all_objects.aggregate(last=Max('id'))['last'] or 0
+        created = Student.objects.bulk_create([
+            Student(first_name=first_name, last_name=last_name,
+                    birthday=timezone.make_aware(datetime.combine(birthday, time()), is_dst=False))
+            for first_name, last_name, birthday in new
+        ])
+        if created and created[0].pk is not None:
+            ids.update((key, student.pk) for key, student in zip(new, created))
+        elif new:
+            # bulk_create only sets primary keys on PostgreSQL; read them back
+            # from the rows inserted just now.
+            ids.update(_student_ids(new, Student.objects.filter(id__gt=last_id)))
+        report.created += len(new)
+        report.existing += len(existing_ids)
+
+        # Only students that were already there can have phones or courses.
+        phones = set(Phone.objects.filter(student_id__in=existing_ids).values_list('student_id', 'number'))
+        registered = set(CourseHistory.objects.filter(student_id__in=existing_ids, valid_to=None).values_list(
+            'student_id', 'id_course_id'))
+        today = timezone.localdate()
+        new_phones, new_histories = [], []
+        for key, (row, course_id) in students.items():
+            pk = ids[key]
+            for number in row.phones:
+                if (pk, number) not in phones:
+                    phones.add((pk, number))
+                    new_phones.append(Phone(student_id=pk, number=number))
+            if (pk, course_id) not in registered:
+                new_histories.append(CourseHistory(student_id=pk, id_course_id=course_id, cycle=cycle_of(today),
+                                                   valid_from=today))
+        Phone.objects.bulk_create(new_phones)
+        # Like move_student(): a student moved to another course leaves the ones they were in.
+        moved = {history.student_id for history in new_histories} & set(existing_ids)
+        CourseHistory.objects.filter(student_id__in=moved, valid_to=None).update(valid_to=today)
+        CourseHistory.objects.bulk_create(new_histories)
+        report.phones += len(new_phones)
+        report.course_histories += len(new_histories)
+
+        # bulk_create doesn't send signals. A new student's summary is just
+        # their course; existing ones are recomputed if their course changed.
+        search.index((search.document_id(search.STUDENT, ids[key]), '%s %s' % key[:2]) for key in new)
+        StudentAcademicSummary.objects.bulk_create([
+            StudentAcademicSummary(student_id=ids[key], course_id=students[key][1]) for key in new
+        ])
+        refresh_summaries(moved)
+        phone_owners = {phone.student_id for phone in new_phones}
+        invalidate_rosters(course_ids={history.id_course_id for history in new_histories} | {
+            course_id for student_id, course_id in registered if student_id in phone_owners | moved})
+
+
+def _fingerprint(path):
+    stat = os.stat(path)
+    return [stat.st_size, int(stat.st_mtime)]
+
+
+def _load_checkpoint(checkpoint_path, path):
+    if not checkpoint_path or not os.path.exists(checkpoint_path):
+        return None
+    with open(checkpoint_path) as checkpoint:
+        state = json.load(checkpoint)
+    # A checkpoint for another version of the file is useless.
+    return state if state.get('fingerprint') == _fingerprint(path) else None
+
+
+def _save_checkpoint(checkpoint_path, path, report):
+    temporary = checkpoint_path + '.tmp'
+    with open(temporary, 'w') as checkpoint:
+        json.dump({'fingerprint': _fingerprint(path), 'counts': report.counts()}, checkpoint)
+    os.replace(temporary, checkpoint_path)
+
+
+def import_students(path, chunk_size=DEFAULT_CHUNK_SIZE, workers=4, checkpoint_path=None, on_errors=None):
+    """
+    Import an enrollment CSV: one row per student with nombre, apellido,
+    fecha_nacimiento, telefono (optional, several separated by ; / or ,),
+    anio, division and turno. Students are matched on (first name, last name,
+    birthday), so importing a file again only adds what is missing.
+
+    Rows are validated in ``workers`` processes and written chunk by chunk,
+    each chunk in its own transaction. With ``checkpoint_path``, progress is
+    saved after every chunk and a later call on the same, unchanged file
+    resumes after the last written chunk; repeated students across the
+    resume point then count as existing rather than as errors.
+    ``on_errors`` is called with each chunk's RowErrors before its
+    checkpoint is saved, so an error report can be written as it goes.
+
+    Returns an ImportReport; its ``errors`` are this call's rejected rows.
+    """
+    state = _load_checkpoint(checkpoint_path, path)
+    report = ImportReport(**state['counts']) if state else ImportReport()
+    courses = {
+        (year, division, shift): pk
+        for pk, year, division, shift in Course.objects.values_list('id_course', 'year', 'division', 'shift')
+    }
+    seen = {}
+    for chunk, (rows, errors) in _cleaned_chunks(_read_chunks(path, chunk_size, report.rows), workers):
+        before = len(report.errors)
+        report.errors.extend(errors)
+        _write_chunk(rows, courses, seen, report)
+        report.rows += len(chunk)
+        chunk_errors = sorted(report.errors[before:])
+        report.rejected += len({error.row for error in chunk_errors})
+        if on_errors and chunk_errors:
+            on_errors(chunk_errors)
+        if checkpoint_path:
+            _save_checkpoint(checkpoint_path, path, report)
+    report.errors.sort()
+    return report
@@ -0,0 +1,255 @@
+import json
+import os
+import random
+import socket
+import time
+import traceback
+from concurrent.futures import FIRST_COMPLETED, BrokenExecutor, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from datetime import timedelta
+
+import django
+from django.apps import apps
+from django.db import IntegrityError, close_old_connections, connections, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from . import category_stats
+from .databases import unpin
+from .managers import _is_soft_deletion_model
+from .models import Job, Student
+from .summaries import DEFAULT_CHUNK_SIZE, rebuild_summaries, refresh_summaries
+
+
+# Retries wait BACKOFF_BASE * 2 ** (attempt - 1) seconds, up to BACKOFF_MAX,
+# give or take a random BACKOFF_JITTER share so failed jobs don't retry in step.
+BACKOFF_BASE = 30
+BACKOFF_MAX = 60 * 60
+BACKOFF_JITTER = 0.2
+# Workers refresh the heartbeat of the jobs they run every HEARTBEAT_INTERVAL
+# seconds. Running jobs without one for STALE_AFTER seconds are assumed to
+# have died with their worker, and are queued again or, out of attempts, failed.
+HEARTBEAT_INTERVAL = 30
+STALE_AFTER = 5 * 60
+POLL_INTERVAL = 1.0
+
+JOBS = {}
+
+
+def job(name):
+    """Register a function as the job ``name``. It gets the payload as keyword arguments."""
+    def register(function):
+        JOBS[name] = function
+        return function
+    return register
+
+
+def enqueue(name, priority=0, idempotency_key=None, run_after=None, max_attempts=5, **payload):
+    """
+    Queue the job ``name`` with ``payload`` and return its Job. With an
+    ``idempotency_key``, the job already queued (or run) under that key is
+    returned instead of a new one.
+    """
+    if name not in JOBS:
+        raise ValueError('Unknown job: %s' % name)
+    fields = {
+        'name': name,
+        'payload': json.dumps(payload),
+        'priority': priority,
+        'run_after': run_after or timezone.now(),
+        'max_attempts': max_attempts,
+    }
+    if idempotency_key is None:
+        return Job.objects.create(**fields)
+    try:
+        with transaction.atomic():
+            return Job.objects.get_or_create(idempotency_key=idempotency_key, defaults=fields)[0]
+    except IntegrityError:
+        # Someone enqueued it between our lookup and insert.
+        return Job.objects.get(idempotency_key=idempotency_key)
+
+
+def backoff(attempts):
+    delay = min(BACKOFF_BASE * 2 ** (attempts - 1), BACKOFF_MAX)
+    return delay * random.uniform(1 - BACKOFF_JITTER, 1 + BACKOFF_JITTER)
+
+
+def claim(worker, limit=1):
+    """
+    Mark up to ``limit`` due jobs as running on ``worker`` and return them,
+    highest priority first. Each is taken with a conditional UPDATE, so two
+    workers polling the same queue never run the same job.
+    """
+    now = timezone.now()
+    candidates = Job.objects.filter(status=Job.QUEUED, run_after__lte=now).order_by(
+        '-priority', 'run_after', 'id').values_list('pk', flat=True)[:limit * 4]
+    claimed = []
+    for pk in candidates:
+        if Job.objects.filter(pk=pk, status=Job.QUEUED).update(
+                status=Job.RUNNING, worker=worker, started_at=now, heartbeat_at=now, attempts=F('attempts') + 1):
+            claimed.append(pk)
+            if len(claimed) == limit:
+                break
+    return list(Job.objects.filter(pk__in=claimed).order_by('-priority', 'run_after', 'id'))
+
+
+def heartbeat(pks):
+    """Tell requeue_stale() that the running jobs ``pks`` are still alive."""
+    if pks:
+        Job.objects.filter(pk__in=pks, status=Job.RUNNING).update(heartbeat_at=timezone.now())
+
+
+def requeue_stale(stale_after=STALE_AFTER):
+    """
+    Queue again the jobs left running by a worker that died, i.e. whose
+    heartbeat stopped ``stale_after`` seconds ago, or fail those out of
+    attempts. Returns how many were queued or failed.
+    """
+    now = timezone.now()
+    stale = Job.objects.filter(status=Job.RUNNING, heartbeat_at__lt=now - timedelta(seconds=stale_after))
+    failed = stale.filter(attempts__gte=F('max_attempts')).update(
+        status=Job.FAILED, finished_at=now, worker='', last_error='Worker lost')
+    return failed + stale.update(status=Job.QUEUED, worker='')
+
+
+def run(pk, attempt=None):
+    """
+    Run one claimed job and record the outcome: its JSON result, or the
+    error and either a retry after backoff() or, out of attempts, failure.
+    ``attempt`` is the attempt claim() started, the job's latest by default.
+    The outcome is only written while that attempt still owns the job, so a
+    run whose job was meanwhile requeued and claimed again never overwrites
+    the newer one. Returns the job's new status.
+    """
+    # Whatever this thread wrote before, the job starts reading from the replicas.
+    unpin()
+    job = Job.objects.get(pk=pk)
+    if attempt is None:
+        attempt = job.attempts
+    if job.status != Job.RUNNING or job.attempts != attempt:
+        return job.status
+    try:
+        result = json.dumps(JOBS[job.name](**job.payload_dict()))
+    except Exception:
+        now = timezone.now()
+        fields = {'last_error': traceback.format_exc(), 'worker': ''}
+        if job.attempts < job.max_attempts:
+            fields.update(status=Job.QUEUED, run_after=now + timedelta(seconds=backoff(job.attempts)))
+        else:
+            fields.update(status=Job.FAILED, finished_at=now)
+        return _finish(pk, attempt, **fields)
+    return _finish(pk, attempt, status=Job.DONE, finished_at=timezone.now(), result=result, last_error='')
+
+
+def _finish(pk, attempt, **fields):
+    # Written only if the attempt still owns the job; otherwise the job's status as it now is.
+    if Job.objects.filter(pk=pk, status=Job.RUNNING, attempts=attempt).update(**fields):
+        return fields['status']
+    return Job.objects.values_list('status', flat=True).get(pk=pk)
+
+
+def _run_in_pool(pk, attempt):
+    # Pool threads and processes never see request_started/finished.
+    close_old_connections()
+    try:
+        return run(pk, attempt)
+    finally:
+        connections.close_all()
+
+
+def work(workers=2, processes=False, once=False, poll_interval=POLL_INTERVAL, stale_after=STALE_AFTER,
+         worker=None, stdout=None):
+    """
+    Run queued jobs on a pool of ``workers`` threads, or processes for
+    CPU-bound jobs, until interrupted or, with ``once``, until nothing is
+    due. Returns the number of jobs run.
+    """
+    worker = worker or '%s:%d' % (socket.gethostname(), os.getpid())
+
+    def pool():
+        if processes:
+            # Forked children must not inherit an open connection.
+            connections.close_all()
+            return ProcessPoolExecutor(max_workers=workers, initializer=django.setup)
+        return ThreadPoolExecutor(max_workers=workers, thread_name_prefix='job')
+
+    executor = pool()
+    running = {}
+    done = 0
+    last_heartbeat = time.monotonic()
+    try:
+        requeue_stale(stale_after)
+        while True:
+            if running and time.monotonic() - last_heartbeat >= HEARTBEAT_INTERVAL:
+                heartbeat([job.pk for job in running.values()])
+                last_heartbeat = time.monotonic()
+            if len(running) < workers:
+                for job in claim(worker, workers - len(running)):
+                    running[executor.submit(_run_in_pool, job.pk, job.attempts)] = job
+            if not running:
+                if once:
+                    return done
+                time.sleep(poll_interval)
+                requeue_stale(stale_after)
+                continue
+            finished, _ = wait(running, timeout=poll_interval, return_when=FIRST_COMPLETED)
+            broken = False
+            for future in finished:
+                job = running.pop(future)
+                done += 1
+                try:
+                    status = future.result()
+                except Exception as error:
+                    # run() records the job's own errors; this is the pool
+                    # failing around it, e.g. a worker process that died.
+                    status = _finish(job.pk, job.attempts, status=Job.FAILED, finished_at=timezone.now(),
+                                     worker='', last_error=traceback.format_exc())
+                    broken = broken or isinstance(error, BrokenExecutor)
+                if stdout:
+                    stdout.write('%s #%d: %s' % (job.name, job.pk, status))
+            if broken:
+                # A broken pool fails every job it holds at once and takes
+                # no more; the next jobs get a new one.
+                executor.shutdown(wait=False)
+                executor = pool()
+    finally:
+        executor.shutdown(wait=True)
+
+
+@job('purge_soft_deleted')
+def purge_soft_deleted(days=90, models=None):
+    """
+    Hard-delete what has been soft-deleted for more than ``days`` days, in
+    every soft-deletable model or the given model labels. Returns the rows
+    deleted per model.
+    """
+    if models is None:
+        models = [model for model in apps.get_app_config('managerLibrary').get_models()
+                  if _is_soft_deletion_model(model)]
+    else:
+        models = [apps.get_model(label) for label in models]
+    counts = {}
+    for model in models:
+        for label, count in model.all_objects.purge(days).items():
+            counts[label] = counts.get(label, 0) + count
+    return counts
+
+
+@job('recompute_grade_averages')
+def recompute_grade_averages(student_ids=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Recompute grade averages (with the rest of each student's summary) for
+    ``student_ids``, or rebuild every summary. Returns how many were written.
+    """
+    if student_ids is None:
+        return rebuild_summaries(chunk_size=chunk_size, workers=1)
+    alive = set(Student.objects.filter(id__in=student_ids).values_list('id', flat=True))
+    student_ids = sorted(set(student_ids))
+    for start in range(0, len(student_ids), chunk_size):
+        refresh_summaries(student_ids[start:start + chunk_size])
+    return len(alive)
+
+
+@job('backfill_category_stats')
+def backfill_category_stats(chunk_size=category_stats.DEFAULT_CHUNK_SIZE):
+    """Rebuild the category rollup, e.g. after bulk changes to comments that sent no signals."""
+    return category_stats.backfill(chunk_size=chunk_size)
@@ -0,0 +1,17 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from managerLibrary.category_stats import DEFAULT_CHUNK_SIZE, backfill
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the daily comment counts per category from the comments.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        written = backfill(chunk_size=options['chunk_size'])
+        self.stdout.write('wrote %d category counts in %.2fs' % (written, time.perf_counter() - start))
@@ -0,0 +1,19 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from managerLibrary.timeline import DEFAULT_CHUNK_SIZE, backfill
+
+
+class Command(BaseCommand):
+    help = ('Derives the cycle and validity range of the CourseHistory rows that predate them, '
+            "taking each student's latest row to be in --cycle and every earlier one a cycle before.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--cycle', type=int, help='Cycle of the latest rows; the current one by default.')
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        written = backfill(cycle=options['cycle'], chunk_size=options['chunk_size'])
+        self.stdout.write('derived %d course histories in %.2fs' % (written, time.perf_counter() - start))
@@ -0,0 +1,73 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from managerLibrary.feeds import comment_feed, ORDER_BY_DATE, ORDER_BY_NAME
+from managerLibrary.models import Comment, CustomUser, Student
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Times the comment history feed over a synthetic fixture (rolled back afterwards).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--comments', type=int, default=500000)
+        parser.add_argument('--students', type=int, default=2000)
+        parser.add_argument('--pages', type=int, default=50)
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self._seed(options)
+                for order in (ORDER_BY_DATE, ORDER_BY_NAME):
+                    self._walk(order, options['pages'])
+                raise _Rollback()
+        except _Rollback:
+            pass
+
+    def _seed(self, options):
+        start = time.perf_counter()
+        author = CustomUser.objects.create(email='benchmark@feed.local')
+        Student.objects.bulk_create(
+            [Student(first_name='Alumno%d' % i, last_name='Apellido%05d' % i, birthday=timezone.now())
+             for i in range(options['students'])],
+            batch_size=options['batch_size'],
+        )
+        student_ids = list(Student.objects.values_list('id', flat=True))
+        now = timezone.now()
+        batch = []
+        for i in range(options['comments']):
+            batch.append(Comment(
+                student_id=student_ids[i % len(student_ids)],
+                author=author,
+                description='Nota %d' % i,
+                date=now - timedelta(minutes=i),
+            ))
+            if len(batch) == options['batch_size']:
+                Comment.objects.bulk_create(batch)
+                batch = []
+        Comment.objects.bulk_create(batch)
+        self.stdout.write('seeded %d comments in %.2fs' % (options['comments'], time.perf_counter() - start))
+
+    def _walk(self, order, pages):
+        cursor = None
+        timings = []
+        with CaptureQueriesContext(connection) as queries:
+            for _ in range(pages):
+                start = time.perf_counter()
+                page = comment_feed(order=order, cursor=cursor)
+                timings.append(time.perf_counter() - start)
+                cursor = page.next_cursor
+                if not page.has_next:
+                    break
+        timings.sort()
+        self.stdout.write('%s: %d pages, %d queries, median %.2fms, max %.2fms' % (
+            order, len(timings), len(queries), timings[len(timings) // 2] * 1000, timings[-1] * 1000))
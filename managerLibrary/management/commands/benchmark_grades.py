@@ -0,0 +1,105 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.utils import timezone
+
+from managerLibrary.analytics import db_grade_averages
+from managerLibrary.models import Grades, Student, Subject
+
+
+# The same grades stored as text, queried the way the CharField had to be.
+TEXT_TABLE = 'benchmark_text_grades'
+QUERIES = (
+    ('average per subject',
+     'SELECT subject_id, COUNT(*), AVG(CAST(grade AS INTEGER)), '
+     'SUM(CASE WHEN CAST(grade AS INTEGER) < 6 THEN 1 ELSE 0 END) FROM {table} '
+     "WHERE deleted_at IS NULL AND grade != '0' AND subject_id IS NOT NULL GROUP BY subject_id",
+     lambda subject_id: db_grade_averages('subject')),
+    ('failing in a subject',
+     'SELECT COUNT(*) FROM {table} WHERE deleted_at IS NULL AND subject_id = %s '
+     'AND CAST(grade AS INTEGER) BETWEEN 1 AND 5',
+     lambda subject_id: Grades.objects.filter(subject_id=subject_id, grade__range=(1, 5)).count()),
+    ('best 50 in a subject',
+     'SELECT id FROM {table} WHERE deleted_at IS NULL AND subject_id = %s '
+     'ORDER BY CAST(grade AS INTEGER) DESC, id LIMIT 50',
+     lambda subject_id: list(Grades.objects.filter(subject_id=subject_id).order_by(
+         '-grade', 'id').values_list('id', flat=True)[:50])),
+)
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = ('Times grade aggregates and range queries on the integer column against the same grades '
+            'stored as text, over a synthetic fixture (rolled back afterwards).')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--grades', type=int, default=500000)
+        parser.add_argument('--students', type=int, default=5000)
+        parser.add_argument('--subjects', type=int, default=20)
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                subject_ids = self._seed(options)
+                self._compare(subject_ids, options['repeat'])
+                raise _Rollback()
+        except _Rollback:
+            pass
+
+    def _seed(self, options):
+        start = time.perf_counter()
+        Student.objects.bulk_create(
+            [Student(first_name='Alumno%d' % i, last_name='Apellido%05d' % i, birthday=timezone.now())
+             for i in range(options['students'])],
+            batch_size=options['batch_size'])
+        Subject.objects.bulk_create([Subject(name='Materia %d' % i) for i in range(options['subjects'])])
+        student_ids = list(Student.objects.values_list('id', flat=True))
+        subject_ids = list(Subject.objects.values_list('pk', flat=True))
+        rng = random.Random(0)
+        batch = []
+        for _ in range(options['grades']):
+            batch.append(Grades(student_id=rng.choice(student_ids), subject_id=rng.choice(subject_ids),
+                                grade=rng.randint(1, 10)))
+            if len(batch) == options['batch_size']:
+                Grades.objects.bulk_create(batch)
+                batch = []
+        Grades.objects.bulk_create(batch)
+        with connection.cursor() as cursor:
+            cursor.execute('CREATE TABLE %s AS SELECT id, subject_id, deleted_at, CAST(grade AS TEXT) '
+                           'AS grade FROM %s' % (TEXT_TABLE, Grades._meta.db_table))
+            # The index the text column had.
+            cursor.execute('CREATE INDEX %s_subject ON %s (subject_id)' % (TEXT_TABLE, TEXT_TABLE))
+            # Fresh statistics for both, so the planner can pick the partial indexes.
+            for table in (TEXT_TABLE, Grades._meta.db_table):
+                cursor.execute('ANALYZE %s' % connection.ops.quote_name(table))
+        self.stdout.write('seeded %d grades in %.2fs' % (options['grades'], time.perf_counter() - start))
+        return subject_ids
+
+    def _compare(self, subject_ids, repeat):
+        for name, text_sql, integer in QUERIES:
+            sql = text_sql.format(table=TEXT_TABLE)
+            text_timings, integer_timings = [], []
+            for subject_id in subject_ids[:repeat]:
+                params = [subject_id] if '%s' in sql else []
+                start = time.perf_counter()
+                with connection.cursor() as cursor:
+                    cursor.execute(sql, params)
+                    cursor.fetchall()
+                text_timings.append(time.perf_counter() - start)
+                start = time.perf_counter()
+                integer(subject_id)
+                integer_timings.append(time.perf_counter() - start)
+            text_time, integer_time = _median(text_timings), _median(integer_timings)
+            self.stdout.write('%s: text %.2fms, integer %.2fms (%.1fx)' % (
+                name, text_time * 1000, integer_time * 1000, text_time / integer_time))
+
+
+def _median(timings):
+    return sorted(timings)[len(timings) // 2]
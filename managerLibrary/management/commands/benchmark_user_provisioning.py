@@ -0,0 +1,55 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from managerLibrary.models import Preceptor, Professor
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = ('Compares creating Professor/Preceptor accounts one by one with create_user() against '
+            'bulk_create_users(). Everything is rolled back afterwards.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=200)
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        count = options['users']
+        self.stdout.write('%d accounts, %d hashing workers' % (count, options['workers']))
+        try:
+            with transaction.atomic():
+                serial = self._time(lambda: [
+                    model.objects.create_user(
+                        'serial%d@benchmark.local' % i, 'password%d' % i, first_name='Nombre', last_name='Apellido')
+                    for i, model in self._models(count)])
+                bulk = {}
+                for model in (Professor, Preceptor):
+                    users = [{'email': 'bulk%d@benchmark.local' % i, 'password': 'password%d' % i,
+                              'first_name': 'Nombre', 'last_name': 'Apellido'}
+                             for i, user_model in self._models(count) if user_model is model]
+                    bulk[model] = users
+                parallel = self._time(lambda: [
+                    model.objects.bulk_create_users(users, batch_size=options['batch_size'], workers=options['workers'])
+                    for model, users in bulk.items()])
+                raise _Rollback()
+        except _Rollback:
+            pass
+        for name, seconds in (('create_user', serial), ('bulk_create_users', parallel)):
+            self.stdout.write('%-18s %8.2fs %10.1f users/s' % (name, seconds, count / seconds))
+        self.stdout.write('speedup: %.1fx' % (serial / parallel))
+
+    def _models(self, count):
+        # Half professors, half preceptors, as at the start of the year.
+        return [(i, Professor if i % 2 else Preceptor) for i in range(count)]
+
+    def _time(self, function):
+        start = time.perf_counter()
+        function()
+        return time.perf_counter() - start
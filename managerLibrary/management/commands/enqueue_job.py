@@ -0,0 +1,28 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from managerLibrary.jobs import JOBS, enqueue
+
+
+class Command(BaseCommand):
+    help = ('Queues a background job, e.g. from cron: '
+            'enqueue_job purge_soft_deleted --payload \'{"days": 90}\' --key purge-2026-01-31')
+
+    def add_arguments(self, parser):
+        parser.add_argument('name', choices=sorted(JOBS))
+        parser.add_argument('--payload', default='{}', help='Keyword arguments of the job, as a JSON object.')
+        parser.add_argument('--priority', type=int, default=0)
+        parser.add_argument('--key', help='Idempotency key; a job already queued under it is not queued again.')
+        parser.add_argument('--max-attempts', type=int, default=5)
+
+    def handle(self, *args, **options):
+        try:
+            payload = json.loads(options['payload'])
+        except ValueError:
+            raise CommandError('Invalid JSON payload')
+        if not isinstance(payload, dict):
+            raise CommandError('The payload must be a JSON object')
+        job = enqueue(options['name'], priority=options['priority'], idempotency_key=options['key'],
+                      max_attempts=options['max_attempts'], **payload)
+        self.stdout.write('job #%d %s (%s)' % (job.pk, job.name, job.status))
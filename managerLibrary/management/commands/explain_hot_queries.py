@@ -0,0 +1,57 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+
+from managerLibrary.models import Comment, CourseHistory, Grades, Presence, Student
+
+
+# Substrings that show up in the EXPLAIN output when a plan reads through an index.
+INDEX_MARKERS = {
+    'sqlite': ('USING INDEX', 'USING COVERING INDEX', 'USING INTEGER PRIMARY KEY', 'USING PRIMARY KEY'),
+    'postgresql': ('Index Scan', 'Index Only Scan', 'Bitmap Index Scan'),
+}
+
+
+def hot_queries():
+    """The manager queries the views run most often, with placeholder lookup values."""
+    now = timezone.now()
+    return [
+        ('comment feed', Comment.objects.order_by('-date', '-id')[:21]),
+        ('comments of student', Comment.objects.filter(student_id=1).order_by('-date')),
+        ('grades of student', Grades.objects.filter(student_id=1, subject_id=1)),
+        ('grades of subject', Grades.objects.filter(subject_id=1)),
+        ('course roster', CourseHistory.objects.filter(id_course_id=1)),
+        ('student lookup', Student.objects.filter(last_name='Perez').order_by('last_name', 'first_name')),
+        ('presence by date', Presence.objects.filter(date__gte=timezone.localdate() - timedelta(days=1))),
+        ('course roll call', Presence.objects.filter(student_id__in=[1, 2], date=timezone.localdate())),
+        ('purge candidates', Comment.all_objects.filter(deleted_at__lt=now - timedelta(days=90))),
+        ('deleted students', Student.all_objects.filter(deleted_at__isnull=False)),
+    ]
+
+
+class Command(BaseCommand):
+    help = 'Runs EXPLAIN on the hot SoftDeletionManager queries and checks that each one uses an index.'
+
+    def handle(self, *args, **options):
+        markers = INDEX_MARKERS.get(connection.vendor)
+        if markers is None:
+            raise CommandError('EXPLAIN checks are not supported on %s' % connection.vendor)
+        if connection.vendor == 'postgresql':
+            # Tiny development tables make the planner prefer sequential scans;
+            # we want to know whether an index is available, not whether it's cheaper.
+            with connection.cursor() as cursor:
+                cursor.execute('SET enable_seqscan = off')
+
+        missing = []
+        for label, queryset in hot_queries():
+            plan = queryset.explain()
+            uses_index = any(marker in plan for marker in markers)
+            self.stdout.write('%s %s' % ('OK  ' if uses_index else 'SCAN', label))
+            if options['verbosity'] > 1:
+                self.stdout.write('    ' + plan.replace('\n', '\n    '))
+            if not uses_index:
+                missing.append(label)
+        if missing:
+            raise CommandError('Queries without an index: %s' % ', '.join(missing))
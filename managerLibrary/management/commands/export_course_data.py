@@ -0,0 +1,54 @@
+import gzip
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from managerLibrary.exports import CSV, EXPORTS, XLSX, export_stream
+
+
+class Command(BaseCommand):
+    help = ('Writes the grades, comments and attendance exports to OUTPUT_DIR for archiving: '
+            'gzipped CSV, or XLSX (already compressed) with --format xlsx.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('output_dir')
+        parser.add_argument('--kind', choices=sorted(EXPORTS), action='append',
+                            help='Export to write; repeat for several. Defaults to all of them.')
+        parser.add_argument('--format', choices=[CSV, XLSX], default=CSV)
+        parser.add_argument('--year')
+        parser.add_argument('--division')
+        parser.add_argument('--shift')
+        parser.add_argument('--start', help='YYYY-MM-DD, inclusive.')
+        parser.add_argument('--end', help='YYYY-MM-DD, inclusive.')
+
+    def handle(self, *args, **options):
+        filters = {name: options[name] for name in ('year', 'division', 'shift')}
+        for name in ('start', 'end'):
+            if options[name]:
+                try:
+                    filters[name] = parse_date(options[name])
+                except ValueError:
+                    # Well formed but impossible, such as 2023-02-30.
+                    filters[name] = None
+                if filters[name] is None:
+                    raise CommandError('Invalid date: %s' % options[name])
+        os.makedirs(options['output_dir'], exist_ok=True)
+        stamp = timezone.localdate().isoformat()
+
+        for kind in options['kind'] or sorted(EXPORTS):
+            start = time.perf_counter()
+            chunks = export_stream(kind, options['format'], **filters)
+            if options['format'] == CSV:
+                path = os.path.join(options['output_dir'], '%s-%s.csv.gz' % (kind, stamp))
+                with gzip.open(path, 'wt', encoding='utf-8', newline='') as output:
+                    for chunk in chunks:
+                        output.write(chunk)
+            else:
+                path = os.path.join(options['output_dir'], '%s-%s.xlsx' % (kind, stamp))
+                with open(path, 'wb') as output:
+                    for chunk in chunks:
+                        output.write(chunk)
+            self.stdout.write('wrote %s in %.2fs' % (path, time.perf_counter() - start))
@@ -0,0 +1,53 @@
+import csv
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from managerLibrary.imports import DEFAULT_CHUNK_SIZE, import_students
+
+
+class Command(BaseCommand):
+    help = ('Imports students, their phones and course registrations from an enrollment CSV. '
+            'Progress is checkpointed next to the file, so an interrupted import picks up where it stopped.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+        parser.add_argument('--workers', type=int, default=4)
+        parser.add_argument('--errors', help='Where to write the rejected rows (CSV). Defaults to PATH.errors.csv.')
+        parser.add_argument('--restart', action='store_true', help='Ignore an existing checkpoint.')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        if not os.path.exists(path):
+            raise CommandError('No such file: %s' % path)
+        checkpoint_path = path + '.checkpoint'
+        errors_path = options['errors'] or path + '.errors.csv'
+        resuming = os.path.exists(checkpoint_path) and not options['restart']
+        if not resuming and os.path.exists(checkpoint_path):
+            os.remove(checkpoint_path)
+
+        start = time.perf_counter()
+        with open(errors_path, 'a' if resuming else 'w', newline='', encoding='utf-8') as output:
+            writer = csv.writer(output)
+            if output.tell() == 0:
+                writer.writerow(['fila', 'campo', 'error'])
+
+            def write_errors(errors):
+                writer.writerows(errors)
+                output.flush()
+
+            try:
+                report = import_students(path, chunk_size=options['chunk_size'], workers=options['workers'],
+                                         checkpoint_path=checkpoint_path, on_errors=write_errors)
+            except ValueError as error:
+                raise CommandError(str(error))
+        if os.path.exists(checkpoint_path):
+            os.remove(checkpoint_path)
+
+        self.stdout.write(
+            '%(rows)d rows: %(created)d students created, %(existing)d already existed, '
+            '%(phones)d phones and %(course_histories)d course registrations added, %(rejected)d rows rejected'
+            % report.counts())
+        self.stdout.write('errors in %s; took %.2fs' % (errors_path, time.perf_counter() - start))
@@ -0,0 +1,82 @@
+import asyncio
+import time
+from urllib.parse import urlsplit
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = (
+        'Latency of running servers under many concurrent users, e.g. the WSGI and the ASGI entry points: '
+        'load_test wsgi=http://127.0.0.1:8000 asgi=http://127.0.0.1:8001 --path / --path /asistencia/1/resumen/'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('targets', nargs='+', help='Base URLs, optionally labelled as name=url.')
+        parser.add_argument('--path', action='append', dest='paths',
+                            help='Page to request, may be repeated; requests cycle through them. Defaults to /.')
+        parser.add_argument('--users', type=int, default=500, help='Concurrent users.')
+        parser.add_argument('--requests', type=int, default=5000, help='Requests per target.')
+        parser.add_argument('--timeout', type=float, default=30.0)
+        parser.add_argument('--cookie',
+                            help='Cookie header to send, e.g. a logged in sessionid; the school pages need one.')
+        parser.add_argument('--percentiles', default='50,95,99')
+
+    def handle(self, *args, **options):
+        percentiles = [float(p) for p in options['percentiles'].split(',')]
+        paths = options['paths'] or ['/']
+        self.stdout.write('%-10s %8s %7s %8s' % ('target', 'requests', 'errors', 'req/s') + ''.join(
+            ' %10s' % ('p%g ms' % p) for p in percentiles))
+        for target in options['targets']:
+            name, _, url = target.partition('=') if '=' in target.split('://')[0] else ('', '', target)
+            parsed = urlsplit(url)
+            if parsed.scheme != 'http' or not parsed.hostname:
+                raise CommandError('Only http:// targets are supported: %s' % url)
+            latencies, errors, elapsed = asyncio.run(self.run_target(
+                parsed.hostname, parsed.port or 80, parsed.path.rstrip('/'), paths, options))
+            cells = np.percentile(latencies, percentiles) if latencies else [float('nan')] * len(percentiles)
+            self.stdout.write('%-10s %8d %7d %8.1f' % (
+                name or parsed.netloc, options['requests'], errors, options['requests'] / elapsed,
+            ) + ''.join(' %10.1f' % cell for cell in cells))
+
+    async def run_target(self, host, port, prefix, paths, options):
+        latencies, errors = [], 0
+        pending = iter(range(options['requests']))
+
+        async def user():
+            nonlocal errors
+            # The users share one iterator, so they stop together once it runs out.
+            for number in pending:
+                try:
+                    status, latency = await fetch(host, port, prefix + paths[number % len(paths)],
+                                                  options['cookie'], options['timeout'])
+                except (OSError, asyncio.TimeoutError, ValueError, IndexError):
+                    errors += 1
+                    continue
+                if status >= 400:
+                    errors += 1
+                else:
+                    latencies.append(latency)
+
+        start = time.perf_counter()
+        await asyncio.gather(*[user() for _ in range(options['users'])])
+        return latencies, errors, time.perf_counter() - start
+
+
+async def fetch(host, port, path, cookie, timeout):
+    """GET one page on a new connection. Returns the status and the latency in ms."""
+    start = time.perf_counter()
+    reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+    try:
+        request = 'GET %s HTTP/1.1\r\nHost: %s:%d\r\nConnection: close\r\n' % (path, host, port)
+        if cookie:
+            request += 'Cookie: %s\r\n' % cookie
+        writer.write((request + '\r\n').encode('latin1'))
+        await writer.drain()
+        status_line = await asyncio.wait_for(reader.readline(), timeout)
+        # The whole response counts, not just the first byte.
+        await asyncio.wait_for(reader.read(), timeout)
+    finally:
+        writer.close()
+    return int(status_line.split()[1]), (time.perf_counter() - start) * 1000
@@ -0,0 +1,14 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from managerLibrary.attendance_bitmaps import rebuild_bitmaps
+
+
+class Command(BaseCommand):
+    help = 'Recomputes every AttendanceBitmap from the Presence rows.'
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        written = rebuild_bitmaps()
+        self.stdout.write('rebuilt %d attendance bitmaps in %.2fs' % (written, time.perf_counter() - start))
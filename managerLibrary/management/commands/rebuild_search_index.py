@@ -0,0 +1,14 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from managerLibrary import search
+
+
+class Command(BaseCommand):
+    help = 'Reindexes every alive student, comment and category for full-text search.'
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        indexed = search.rebuild()
+        self.stdout.write('indexed %d documents in %.2fs' % (indexed, time.perf_counter() - start))
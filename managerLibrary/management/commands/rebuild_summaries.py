@@ -0,0 +1,18 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from managerLibrary.summaries import DEFAULT_CHUNK_SIZE, rebuild_summaries
+
+
+class Command(BaseCommand):
+    help = 'Recomputes every StudentAcademicSummary row in parallel chunks.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+        parser.add_argument('--workers', type=int, default=4)
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        written = rebuild_summaries(chunk_size=options['chunk_size'], workers=options['workers'])
+        self.stdout.write('rebuilt %d summaries in %.2fs' % (written, time.perf_counter() - start))
@@ -0,0 +1,52 @@
+import json
+import os
+from collections import defaultdict, deque
+
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+METRICS = ('queries', 'duplicates', 'db', 'template', 'total')
+
+
+class Command(BaseCommand):
+    help = 'Percentiles of the per-view request metrics logged by InstrumentationMiddleware.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--log', default=getattr(settings, 'REQUEST_METRICS_LOG', None))
+        parser.add_argument('--window', type=int, default=1000,
+                            help='Only the most recent requests of each view are counted.')
+        parser.add_argument('--percentiles', default='50,95,99')
+
+    def handle(self, *args, **options):
+        path = options['log']
+        if not path or not os.path.exists(path):
+            raise CommandError('No request metrics log at %s' % path)
+        percentiles = [float(p) for p in options['percentiles'].split(',')]
+
+        # Rotated files are older, so read them first: .2, .1, then the live log.
+        paths = ['%s.%d' % (path, i) for i in (2, 1)] + [path]
+        requests = defaultdict(lambda: deque(maxlen=options['window']))
+        for name in paths:
+            if not os.path.exists(name):
+                continue
+            with open(name) as log:
+                for line in log:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue
+                    requests[entry['view']].append([entry[metric] for metric in METRICS])
+
+        budgets = getattr(settings, 'QUERY_BUDGETS', {})
+        header = '%-20s %7s' % ('view', 'count') + ''.join(
+            ' %15s' % ('%s p%g' % (metric, p)) for metric in METRICS for p in percentiles)
+        self.stdout.write(header)
+        for view in sorted(requests, key=str):
+            values = np.array(requests[view], dtype=float)
+            cells = np.percentile(values, percentiles, axis=0).T.ravel()
+            line = '%-20s %7d' % (view, len(values)) + ''.join(' %15.1f' % cell for cell in cells)
+            if view in budgets and values[:, 0].max() > budgets[view]:
+                line += '  over budget (%d)' % budgets[view]
+            self.stdout.write(line)
@@ -0,0 +1,48 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from managerLibrary import benchmarks
+
+
+class Command(BaseCommand):
+    help = ('Times manager queries, view and template renders and bulk writes against the current database '
+            '(see seed_benchmark) and writes the results as JSON. With --compare, fails listing what got slower '
+            'than in an earlier run.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=benchmarks.DEFAULT_REPEAT)
+        parser.add_argument('--group', action='append', dest='groups',
+                            choices=(benchmarks.QUERY, benchmarks.VIEW, benchmarks.TEMPLATE, benchmarks.BULK),
+                            help='Only run this group, may be repeated.')
+        parser.add_argument('--benchmark', action='append', dest='names', help='Only run this one, may be repeated.')
+        parser.add_argument('--output', help='Where to write the results; benchmarks-<time>.json by default.')
+        parser.add_argument('--compare', help='Results of an earlier run to check for regressions.')
+        parser.add_argument('--tolerance', type=float, default=0.2,
+                            help='How much slower (a share of the earlier median) counts as a regression.')
+
+    def handle(self, *args, **options):
+        baseline = None
+        if options['compare']:
+            with open(options['compare']) as f:
+                baseline = json.load(f)
+        start = time.perf_counter()
+        self.stdout.write('%-48s %10s %10s %6s' % ('benchmark', 'median ms', 'p95 ms', 'queries'))
+        try:
+            report = benchmarks.run(options['repeat'], options['groups'], options['names'], stdout=self.stdout)
+        except ValueError as e:
+            raise CommandError(str(e))
+        output = options['output'] or 'benchmarks-%s.json' % time.strftime('%Y%m%d-%H%M%S')
+        with open(output, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+        self.stdout.write('wrote %s in %.2fs' % (output, time.perf_counter() - start))
+
+        if baseline is not None:
+            regressions = benchmarks.compare(baseline, report, options['tolerance'])
+            if regressions:
+                raise CommandError('Slower than %s:\n%s' % (options['compare'], '\n'.join(
+                    '%s: %.2fms -> %.2fms, %d -> %d queries' % (
+                        name, before['median_ms'], after['median_ms'], before['queries'], after['queries'])
+                    for name, before, after in regressions)))
+            self.stdout.write('no regressions against %s' % options['compare'])
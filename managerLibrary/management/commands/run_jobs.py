@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from managerLibrary.jobs import POLL_INTERVAL, STALE_AFTER, work
+
+
+class Command(BaseCommand):
+    help = 'Runs queued background jobs (see managerLibrary/jobs.py) until interrupted.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=2)
+        parser.add_argument('--processes', action='store_true',
+                            help='Run jobs in worker processes instead of threads, for CPU-bound jobs.')
+        parser.add_argument('--once', action='store_true', help='Exit once no job is due.')
+        parser.add_argument('--poll-interval', type=float, default=POLL_INTERVAL)
+        parser.add_argument('--stale-after', type=int, default=STALE_AFTER,
+                            help='Seconds without a heartbeat after which a running job is assumed lost and queued again.')
+
+    def handle(self, *args, **options):
+        done = work(workers=options['workers'], processes=options['processes'], once=options['once'],
+                    poll_interval=options['poll_interval'], stale_after=options['stale_after'], stdout=self.stdout)
+        self.stdout.write('ran %d jobs' % done)
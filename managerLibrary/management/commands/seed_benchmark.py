@@ -0,0 +1,35 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from managerLibrary.models import Student
+from managerLibrary.seeding import DEFAULT_CHUNK_SIZE, DEFAULT_CYCLE, SCALES, seed
+
+
+class Command(BaseCommand):
+    help = ('Fills an empty database with a reproducible synthetic school for run_benchmarks: '
+            'seed_benchmark --scale 100k, or --students N.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', choices=sorted(SCALES), default='10k')
+        parser.add_argument('--students', type=int, help='Overrides --scale.')
+        parser.add_argument('--grades', type=int, default=6, help='Grades per student.')
+        parser.add_argument('--comments', type=int, default=2, help='Comments per student.')
+        parser.add_argument('--days', type=int, default=20, help='School days of attendance.')
+        parser.add_argument('--cycle', type=int, default=DEFAULT_CYCLE, help='School year of the data.')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+        parser.add_argument('--skip-derived', action='store_true',
+                            help="Don't rebuild summaries, attendance bitmaps, category counts and the search index.")
+
+    def handle(self, *args, **options):
+        if Student.all_objects.exists():
+            raise CommandError('The database already has students; seed an empty one.')
+        start = time.perf_counter()
+        counts = seed(
+            options['students'] or SCALES[options['scale']], grades=options['grades'], comments=options['comments'],
+            days=options['days'], cycle=options['cycle'], seed=options['seed'], chunk_size=options['chunk_size'],
+            derived=not options['skip_derived'], stdout=self.stdout if options['verbosity'] > 1 else None)
+        for label, count in counts.items():
+            self.stdout.write('%-32s %10d' % (label, count))
+        self.stdout.write('seeded in %.2fs' % (time.perf_counter() - start))
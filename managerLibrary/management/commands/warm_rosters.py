@@ -0,0 +1,14 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from managerLibrary.rosters import warm_rosters
+
+
+class Command(BaseCommand):
+    help = 'Builds and caches every course roster, e.g. at deploy time.'
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        cached = warm_rosters()
+        self.stdout.write('cached %d rosters in %.2fs' % (cached, time.perf_counter() - start))
@@ -1,8 +1,20 @@
+import os
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timedelta
+
+import django
 from django.contrib.auth.base_user import BaseUserManager
+from django.contrib.auth.hashers import make_password
 from django.db.models import QuerySet
 from django.utils import timezone
 from django.utils.translation import ugettext_lazy as _
-from django.db import models
+from django.db import connections, models, transaction
+
+from . import caching
+
+
+DEFAULT_BATCH_SIZE = 500
 
 
 class CustomUserManager(BaseUserManager):
@@ -16,6 +28,75 @@ class CustomUserManager(BaseUserManager):
         user.save()
         return user
 
+    def bulk_create_users(self, users, batch_size=DEFAULT_BATCH_SIZE, workers=None):
+        """
+        Create many users at once from dicts holding ``email``, ``password``
+        and any other field of the model, which may be a multi-table child
+        such as Professor or Preceptor. Passwords are hashed in ``workers``
+        processes (as many as CPUs by default; 1 hashes in this process).
+        Each batch of parent and child rows is inserted in one transaction.
+        Like bulk_create(), no signals are sent. Returns the saved users.
+        """
+        users = [dict(user) for user in users]
+        emails = set()
+        for user in users:
+            if not user.get('email'):
+                raise ValueError(_('The Email must be set'))
+            user['email'] = self.normalize_email(user['email'])
+            if user['email'] in emails:
+                raise ValueError(_('Duplicate email: %s') % user['email'])
+            emails.add(user['email'])
+
+        passwords = [user.pop('password', None) for user in users]
+        workers = workers or os.cpu_count() or 1
+        if workers == 1 or len(users) < 2:
+            hashes = [make_password(password) for password in passwords]
+        else:
+            with ProcessPoolExecutor(max_workers=workers, initializer=django.setup) as executor:
+                chunk_size = max(1, len(passwords) // (workers * 4))
+                hashes = list(executor.map(make_password, passwords, chunksize=chunk_size))
+
+        created = []
+        for start in range(0, len(users), batch_size):
+            batch = [self.model(password=hashed, **user)
+                     for user, hashed in zip(users[start:start + batch_size], hashes[start:start + batch_size])]
+            with transaction.atomic(using=self.db):
+                self._insert_with_parents(batch)
+            created.extend(batch)
+        return created
+
+    def _insert_with_parents(self, objs):
+        # bulk_create() refuses multi-table models, so insert the root rows,
+        # read their keys back and then insert each child table's columns.
+        opts = self.model._meta
+        lineage = list(reversed(opts.get_parent_list())) + [opts.concrete_model]
+        root, children = lineage[0], lineage[1:]
+        manager = root._base_manager.using(self.db)
+        if not children:
+            manager.bulk_create(objs)
+            return
+
+        rows = [root(**{field.attname: getattr(obj, field.attname) for field in root._meta.concrete_fields})
+                for obj in objs]
+        manager.bulk_create(rows)
+        if rows[0].pk is None:
+            # Only PostgreSQL returns the new keys; the email is unique.
+            keys = dict(manager.filter(email__in=[row.email for row in rows]).values_list('email', 'pk'))
+        else:
+            keys = {row.email: row.pk for row in rows}
+        for obj in objs:
+            setattr(obj, root._meta.pk.attname, keys[obj.email])
+            for model in children:
+                for link in model._meta.parents.values():
+                    setattr(obj, link.attname, keys[obj.email])
+
+        connection = connections[self.db]
+        for model in children:
+            fields = model._meta.local_concrete_fields
+            size = connection.ops.bulk_batch_size(fields, objs) or len(objs)
+            for start in range(0, len(objs), size):
+                model._base_manager.using(self.db)._insert(objs[start:start + size], fields=fields)
+
     def create_staff_user(self, email, password, **extra_fields):
         extra_fields.setdefault('is_staff', True)
         extra_fields.setdefault('is_superuser', False)
@@ -52,14 +133,140 @@ class SoftDeletionManager(models.Manager):
     def hard_delete(self):
         return self.get_queryset().hard_delete()
 
+    def purge(self, days, **kwargs):
+        return SoftDeletionQuerySet(self.model).purge(days, **kwargs)
+
+
+def _is_soft_deletion_model(model):
+    return isinstance(getattr(model, 'all_objects', None), SoftDeletionManager)
+
+
+def _cascading_relations(model):
+    """
+    Yield (related model, fk name) for every soft-deletable model that points
+    at ``model`` and follows it: foreign keys with on_delete=CASCADE, plus the
+    ones the related model lists in ``soft_delete_parents``.
+    """
+    for relation in model._meta.related_objects:
+        if relation.many_to_many or not _is_soft_deletion_model(relation.related_model):
+            continue
+        field = relation.field
+        if field.remote_field.on_delete is models.CASCADE or \
+                field.name in getattr(relation.related_model, 'soft_delete_parents', ()):
+            yield relation.related_model, field.name
+
+
+def _collect(model, queryset, seen=frozenset()):
+    """
+    Return the (model, queryset) pairs of the object graph below ``queryset``,
+    children before their parents and ``queryset`` itself last.
+    """
+    steps = []
+    seen = seen | {model}
+    for related, field_name in _cascading_relations(model):
+        if related in seen:
+            continue
+        children = related.all_objects.filter(**{'%s__in' % field_name: queryset.values('pk')})
+        steps.extend(_collect(related, children, seen))
+    steps.append((model, queryset))
+    return steps
+
 
 class SoftDeletionQuerySet(QuerySet):
     def delete(self):
-        return super(SoftDeletionQuerySet, self).update(deleted_at=timezone.now())
+        return self.update(deleted_at=timezone.now())
+
+    # Set-based writes send no signals, so they mark cached reports stale here.
+
+    def update(self, **kwargs):
+        caching.bump(self.model)
+        return super(SoftDeletionQuerySet, self).update(**kwargs)
+
+    def bulk_create(self, objs, *args, **kwargs):
+        caching.bump(self.model)
+        return super(SoftDeletionQuerySet, self).bulk_create(objs, *args, **kwargs)
+
+    def bulk_update(self, objs, fields, batch_size=None):
+        caching.bump(self.model)
+        return super(SoftDeletionQuerySet, self).bulk_update(objs, fields, batch_size=batch_size)
 
     def hard_delete(self):
         return super(SoftDeletionQuerySet, self).delete()
 
+    def soft_delete(self, cascade=True, dry_run=False, batch_size=DEFAULT_BATCH_SIZE):
+        """
+        Soft-delete these rows and, with ``cascade``, every alive row that
+        depends on them. Runs one UPDATE per table and batch, all in one
+        transaction, and returns the number of rows per model label.
+        """
+        now = timezone.now()
+
+        def run(model, queryset, root_pks):
+            queryset = queryset.filter(deleted_at=None)
+            return queryset.count() if dry_run else queryset.update(deleted_at=now)
+
+        return self._walk(run, cascade, dry_run, batch_size)
+
+    def restore(self, cascade=True, dry_run=False, batch_size=DEFAULT_BATCH_SIZE):
+        """
+        Undo soft_delete(). Dependent rows are only restored if they were
+        deleted together with their parent, so rows that had been deleted on
+        their own stay deleted.
+        """
+        model = self.model
+
+        def run(related, queryset, root_pks):
+            if related is model:
+                stamps = None
+            else:
+                stamps = set(model.all_objects.filter(pk__in=root_pks).exclude(
+                    deleted_at=None).values_list('deleted_at', flat=True))
+            queryset = queryset.exclude(deleted_at=None)
+            if stamps is not None:
+                queryset = queryset.filter(deleted_at__in=stamps)
+            return queryset.count() if dry_run else queryset.update(deleted_at=None)
+
+        return self._walk(run, cascade, dry_run, batch_size)
+
+    def purge(self, days, cascade=True, dry_run=False, batch_size=DEFAULT_BATCH_SIZE):
+        """
+        Hard-delete the rows that have been soft-deleted for more than ``days``
+        days, together with everything that depends on them.
+        """
+        cutoff = timezone.now() - timedelta(days=days)
+
+        def run(model, queryset, root_pks):
+            if dry_run:
+                return queryset.count()
+            _, deleted = QuerySet.delete(queryset)
+            return deleted.get(model._meta.label, 0)
+
+        return self.filter(deleted_at__lt=cutoff)._walk(run, cascade, dry_run, batch_size)
+
+    def cascade_pks(self, cascade=True):
+        """
+        The pks of these rows and, with ``cascade``, of every row that
+        depends on them, as {model: set of pks}: the rows soft_delete() and
+        restore() may write. Costs one query per table.
+        """
+        pks = {}
+        root = self.model.all_objects.using(self.db).filter(pk__in=self.values('pk'))
+        for model, queryset in _collect(self.model, root) if cascade else [(self.model, root)]:
+            pks.setdefault(model, set()).update(queryset.values_list('pk', flat=True))
+        return pks
+
+    def _walk(self, run, cascade, dry_run, batch_size):
+        counts = Counter()
+        pks = list(self.values_list('pk', flat=True))
+        with transaction.atomic(using=self.db):
+            for start in range(0, len(pks), batch_size):
+                batch = pks[start:start + batch_size]
+                root = self.model.all_objects.using(self.db).filter(pk__in=batch)
+                steps = _collect(self.model, root) if cascade else [(self.model, root)]
+                for model, queryset in steps:
+                    counts[model._meta.label] += run(model, queryset, batch)
+        return dict(counts)
+
     def alive(self):
         return self.filter(deleted_at=None)
 
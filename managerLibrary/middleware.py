@@ -0,0 +1,191 @@
+import json
+import logging
+import threading
+import time
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.db import connections
+from django.template.base import Template
+
+from .databases import has_written, pin_primary, unpin
+
+
+logger = logging.getLogger('managerLibrary.requests')
+budget_logger = logging.getLogger('managerLibrary.budgets')
+
+_state = threading.local()
+
+
+class RequestMetrics(object):
+    """What one request cost. Times are in milliseconds."""
+
+    def __init__(self, method):
+        self.method = method
+        self.view = None
+        self.queries = 0
+        self.duplicates = 0
+        self.db_time = 0.0
+        self.template_time = 0.0
+        self.total_time = 0.0
+        self._statements = Counter()
+        self._template_depth = 0
+        # Queries may be recorded from worker threads; see concurrency.gather.
+        self._lock = threading.Lock()
+
+    @property
+    def key(self):
+        """The view name, prefixed with the method for anything but GET."""
+        return self.view if self.method in ('GET', 'HEAD') else '%s %s' % (self.method, self.view)
+
+    def record_query(self, sql, duration):
+        with self._lock:
+            self.queries += 1
+            self.db_time += duration
+            self._statements[sql] += 1
+
+    def finish(self, total_time):
+        self.total_time = total_time
+        # The same statement run again with other parameters is the usual
+        # N+1 shape: a query per row of something fetched earlier.
+        self.duplicates = sum(count - 1 for count in self._statements.values())
+
+    def most_repeated(self):
+        return self._statements.most_common(1)[0] if self._statements else (None, 0)
+
+    def as_dict(self):
+        return {
+            'view': self.key,
+            'queries': self.queries,
+            'duplicates': self.duplicates,
+            'db': round(self.db_time, 3),
+            'template': round(self.template_time, 3),
+            'total': round(self.total_time, 3),
+        }
+
+    def server_timing(self):
+        return ', '.join([
+            'db;dur=%.1f;desc="%d queries, %d duplicated"' % (self.db_time, self.queries, self.duplicates),
+            'tpl;dur=%.1f' % self.template_time,
+            'total;dur=%.1f' % self.total_time,
+        ])
+
+
+def _time_query(execute, sql, params, many, context):
+    metrics = getattr(_state, 'metrics', None)
+    if metrics is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.record_query(sql, (time.perf_counter() - start) * 1000)
+
+
+def current_metrics():
+    """The RequestMetrics of the request this thread is serving, if any."""
+    return getattr(_state, 'metrics', None)
+
+
+@contextmanager
+def track_queries(metrics):
+    """Record this thread's queries and template renders into ``metrics``."""
+    previous, _state.metrics = getattr(_state, 'metrics', None), metrics
+    try:
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(_time_query))
+            yield metrics
+    finally:
+        _state.metrics = previous
+
+
+def _timed_render(render):
+    # {% extends %} and {% include %} render nested templates through the same
+    # method, so only the outermost call is timed.
+    def _render(self, context):
+        metrics = getattr(_state, 'metrics', None)
+        if metrics is None or metrics._template_depth:
+            return render(self, context)
+        metrics._template_depth += 1
+        start = time.perf_counter()
+        try:
+            return render(self, context)
+        finally:
+            metrics._template_depth -= 1
+            metrics.template_time += (time.perf_counter() - start) * 1000
+    _render.timed = True
+    return _render
+
+
+def install_template_timer():
+    if not getattr(Template._render, 'timed', False):
+        Template._render = _timed_render(Template._render)
+
+
+class InstrumentationMiddleware(object):
+    """
+    Measure every request: query count, repeated statements, DB time,
+    template render time and total latency. The numbers go out as a
+    Server-Timing header, onto ``response.metrics`` and, one JSON line per
+    request, to the ``managerLibrary.requests`` logger, which the
+    request_timings command reads back. Views over their entry in
+    ``settings.QUERY_BUDGETS`` (keyed by URL name, or by "METHOD name" when
+    a method other than GET needs its own budget) are logged as warnings on
+    ``managerLibrary.budgets``.
+
+    Should come first in MIDDLEWARE so the other middleware's queries count.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.budgets = getattr(settings, 'QUERY_BUDGETS', {})
+        install_template_timer()
+
+    def __call__(self, request):
+        metrics = request.metrics = RequestMetrics(request.method)
+        start = time.perf_counter()
+        with track_queries(metrics):
+            response = self.get_response(request)
+        metrics.finish((time.perf_counter() - start) * 1000)
+
+        response['Server-Timing'] = metrics.server_timing()
+        response.metrics = metrics
+        logger.info(json.dumps(metrics.as_dict()))
+        budget = self.budgets.get(metrics.key, self.budgets.get(metrics.view))
+        if budget is not None and metrics.queries > budget:
+            budget_logger.warning('%s ran %d queries, over its budget of %d (most repeated: %r)',
+                                  metrics.key, metrics.queries, budget, metrics.most_repeated()[0])
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.metrics.view = request.resolver_match.url_name or view_func.__name__
+
+
+PIN_COOKIE = 'primary'
+
+
+class PrimaryPinningMiddleware(object):
+    """
+    Keep a client reading from the primary database for
+    ``settings.REPLICA_PIN_SECONDS`` after a request of theirs wrote to it,
+    so replication lag never hides their own changes. Requests other than
+    GET and HEAD read from the primary from the start.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.pin_seconds = getattr(settings, 'REPLICA_PIN_SECONDS', 15)
+
+    def __call__(self, request):
+        unpin()
+        if request.method not in ('GET', 'HEAD') or PIN_COOKIE in request.COOKIES:
+            pin_primary()
+        try:
+            response = self.get_response(request)
+            if has_written():
+                response.set_cookie(PIN_COOKIE, '1', max_age=self.pin_seconds, httponly=True)
+        finally:
+            unpin()
+        return response
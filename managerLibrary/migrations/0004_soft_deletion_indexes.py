@@ -0,0 +1,108 @@
+# Generated by Django 2.2.28 on 2026-10-18 10:28
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('managerLibrary', '0003_auto_20190514_1609'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='comment',
+            name='date',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AlterField(
+            model_name='presence',
+            name='date',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddIndex(
+            model_name='academichistory',
+            index=models.Index(condition=models.Q(deleted_at=None), fields=['id_course', 'cycle'], name='academichist_course_alive'),
+        ),
+        migrations.AddIndex(
+            model_name='academichistory',
+            index=models.Index(condition=models.Q(deleted_at__isnull=False), fields=['deleted_at'], name='academichistory_deleted'),
+        ),
+        migrations.AddIndex(
+            model_name='category',
+            index=models.Index(condition=models.Q(deleted_at__isnull=False), fields=['deleted_at'], name='category_deleted'),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(condition=models.Q(deleted_at=None), fields=['student', 'date'], name='comment_student_date_alive'),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(condition=models.Q(deleted_at=None), fields=['date', 'id'], name='comment_date_alive'),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(condition=models.Q(deleted_at__isnull=False), fields=['deleted_at'], name='comment_deleted'),
+        ),
+        migrations.AddIndex(
+            model_name='course',
+            index=models.Index(condition=models.Q(deleted_at__isnull=False), fields=['deleted_at'], name='course_deleted'),
+        ),
+        migrations.AddIndex(
+            model_name='coursehistory',
+            index=models.Index(condition=models.Q(deleted_at=None), fields=['id_course', 'student'], name='coursehistory_course_alive'),
+        ),
+        migrations.AddIndex(
+            model_name='coursehistory',
+            index=models.Index(condition=models.Q(deleted_at__isnull=False), fields=['deleted_at'], name='coursehistory_deleted'),
+        ),
+        migrations.AddIndex(
+            model_name='grades',
+            index=models.Index(condition=models.Q(deleted_at=None), fields=['student', 'subject'], name='grades_student_subject_alive'),
+        ),
+        migrations.AddIndex(
+            model_name='grades',
+            index=models.Index(condition=models.Q(deleted_at__isnull=False), fields=['deleted_at'], name='grades_deleted'),
+        ),
+        migrations.AddIndex(
+            model_name='phone',
+            index=models.Index(condition=models.Q(deleted_at__isnull=False), fields=['deleted_at'], name='phone_deleted'),
+        ),
+        migrations.AddIndex(
+            model_name='preceptor',
+            index=models.Index(condition=models.Q(deleted_at__isnull=False), fields=['deleted_at'], name='preceptor_deleted'),
+        ),
+        migrations.AddIndex(
+            model_name='presence',
+            index=models.Index(condition=models.Q(deleted_at=None), fields=['date'], name='presence_date_alive'),
+        ),
+        migrations.AddIndex(
+            model_name='presence',
+            index=models.Index(condition=models.Q(deleted_at__isnull=False), fields=['deleted_at'], name='presence_deleted'),
+        ),
+        migrations.AddIndex(
+            model_name='principal',
+            index=models.Index(condition=models.Q(deleted_at__isnull=False), fields=['deleted_at'], name='principal_deleted'),
+        ),
+        migrations.AddIndex(
+            model_name='professor',
+            index=models.Index(condition=models.Q(deleted_at__isnull=False), fields=['deleted_at'], name='professor_deleted'),
+        ),
+        migrations.AddIndex(
+            model_name='student',
+            index=models.Index(condition=models.Q(deleted_at=None), fields=['last_name', 'first_name'], name='student_name_alive'),
+        ),
+        migrations.AddIndex(
+            model_name='student',
+            index=models.Index(condition=models.Q(deleted_at__isnull=False), fields=['deleted_at'], name='student_deleted'),
+        ),
+        migrations.AddIndex(
+            model_name='subject',
+            index=models.Index(condition=models.Q(deleted_at=None), fields=['name'], name='subject_name_alive'),
+        ),
+        migrations.AddIndex(
+            model_name='subject',
+            index=models.Index(condition=models.Q(deleted_at__isnull=False), fields=['deleted_at'], name='subject_deleted'),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 2.2.28 on 2026-10-18 10:32
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('managerLibrary', '0004_soft_deletion_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StudentAcademicSummary',
+            fields=[
+                ('student', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='summary', serialize=False, to='managerLibrary.Student')),
+                ('grade_average', models.FloatField(null=True)),
+                ('subject_averages', models.TextField(default='{}')),
+                ('attendance_rate', models.FloatField(null=True)),
+                ('comment_count', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('course', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, to='managerLibrary.Course')),
+            ],
+        ),
+    ]
@@ -0,0 +1,78 @@
+from collections import defaultdict
+from datetime import datetime, time
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+BATCH_SIZE = 500
+
+
+def copy_dates_to_days(apps, schema_editor):
+    Presence = apps.get_model('managerLibrary', 'Presence')
+    by_day = defaultdict(list)
+    for pk, date in Presence.objects.exclude(date=None).values_list('id', 'date').iterator():
+        by_day[django.utils.timezone.localtime(date).date()].append(pk)
+    for day, pks in by_day.items():
+        for start in range(0, len(pks), BATCH_SIZE):
+            Presence.objects.filter(id__in=pks[start:start + BATCH_SIZE]).update(day=day)
+
+
+def copy_days_to_dates(apps, schema_editor):
+    Presence = apps.get_model('managerLibrary', 'Presence')
+    for day in Presence.objects.exclude(day=None).values_list('day', flat=True).distinct():
+        moment = django.utils.timezone.make_aware(datetime.combine(day, time()))
+        Presence.objects.filter(day=day).update(date=moment)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('managerLibrary', '0005_student_academic_summary'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='presence',
+            name='presence_date_alive',
+        ),
+        migrations.AddField(
+            model_name='presence',
+            name='day',
+            field=models.DateField(null=True),
+        ),
+        migrations.RunPython(copy_dates_to_days, copy_days_to_dates),
+        migrations.RemoveField(
+            model_name='presence',
+            name='date',
+        ),
+        migrations.RenameField(
+            model_name='presence',
+            old_name='day',
+            new_name='date',
+        ),
+        migrations.AlterField(
+            model_name='presence',
+            name='date',
+            field=models.DateField(default=django.utils.timezone.localdate),
+        ),
+        migrations.AlterField(
+            model_name='presence',
+            name='preceptor',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='presences', to='managerLibrary.Preceptor'),
+        ),
+        migrations.AlterField(
+            model_name='presence',
+            name='student',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='presences', to='managerLibrary.Student'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='presence',
+            unique_together={('student', 'date')},
+        ),
+        migrations.AddIndex(
+            model_name='presence',
+            index=models.Index(condition=models.Q(deleted_at=None), fields=['date'], name='presence_date_alive'),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 2.2.28 on 2026-10-18 10:35
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('managerLibrary', '0006_presence_per_day'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AttendanceBitmap',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('year', models.PositiveSmallIntegerField()),
+                ('present', models.BinaryField()),
+                ('absent', models.BinaryField()),
+                ('student', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='attendance_bitmaps', to='managerLibrary.Student')),
+            ],
+            options={
+                'unique_together': {('student', 'year')},
+            },
+        ),
+    ]
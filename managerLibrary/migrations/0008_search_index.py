@@ -0,0 +1,32 @@
+from django.db import migrations
+
+
+TABLE = 'managerLibrary_searchindex'
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        schema_editor.execute(
+            "CREATE VIRTUAL TABLE %s USING fts5(kind, body, tokenize='unicode61 remove_diacritics 2', prefix='2 3 4')"
+            % TABLE)
+    elif vendor == 'postgresql':
+        schema_editor.execute(
+            'CREATE TABLE %s (id bigint PRIMARY KEY, body text NOT NULL, document tsvector NOT NULL)' % TABLE)
+        schema_editor.execute('CREATE INDEX %s_document ON %s USING GIN (document)' % (TABLE, TABLE))
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor in ('sqlite', 'postgresql'):
+        schema_editor.execute('DROP TABLE IF EXISTS %s' % TABLE)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('managerLibrary', '0007_attendance_bitmap'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
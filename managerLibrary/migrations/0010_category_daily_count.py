@@ -0,0 +1,37 @@
+# Generated by Django 2.2.28 on 2026-10-18 11:13
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('managerLibrary', '0009_job_queue'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CategoryDailyCount',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('count', models.PositiveIntegerField()),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_counts', to='managerLibrary.Category')),
+                ('course', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, to='managerLibrary.Course')),
+                ('student', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='category_daily_counts', to='managerLibrary.Student')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='categorydailycount',
+            index=models.Index(fields=['category', 'day'], name='categorycount_category_day'),
+        ),
+        migrations.AddIndex(
+            model_name='categorydailycount',
+            index=models.Index(fields=['course', 'day'], name='categorycount_course_day'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='categorydailycount',
+            unique_together={('student', 'day', 'category')},
+        ),
+    ]
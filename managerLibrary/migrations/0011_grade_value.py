@@ -0,0 +1,22 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    """
+    First of three steps turning Grades.grade into an integer without
+    downtime: add the new column. 0012 fills it in batches while the old
+    code keeps serving; 0013, deployed with the new code, copies what was
+    written meanwhile and swaps the columns.
+    """
+
+    dependencies = [
+        ('managerLibrary', '0010_category_daily_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='grades',
+            name='grade_value',
+            field=models.PositiveSmallIntegerField(null=True),
+        ),
+    ]
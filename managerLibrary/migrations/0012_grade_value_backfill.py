@@ -0,0 +1,43 @@
+from django.db import migrations, models
+from django.db.models import Max, Min
+from django.db.models.functions import Cast
+
+CHUNK_SIZE = 5000
+VALID_GRADES = [str(grade) for grade in range(1, 11)]
+
+
+def copy_grades(Grades, chunk_size=CHUNK_SIZE):
+    """
+    Fill grade_value from the text grade, one primary key range of
+    ``chunk_size`` rows per UPDATE. Outside a transaction each UPDATE
+    commits on its own, so the table is never locked for longer than a
+    chunk and writers carry on in between. Only rows not yet copied are
+    touched, so an interrupted run just starts again where it stopped.
+    Returns the number of rows copied.
+    """
+    to_copy = Grades.objects.filter(grade_value=None, grade__in=VALID_GRADES)
+    bounds = to_copy.aggregate(first=Min('pk'), last=Max('pk'))
+    if bounds['first'] is None:
+        return 0
+    copied = 0
+    for start in range(bounds['first'], bounds['last'] + 1, chunk_size):
+        copied += to_copy.filter(pk__gte=start, pk__lt=start + chunk_size).update(
+            grade_value=Cast('grade', models.IntegerField()))
+    return copied
+
+
+def copy_grade_values(apps, schema_editor):
+    copy_grades(apps.get_model('managerLibrary', 'Grades'))
+
+
+class Migration(migrations.Migration):
+    # Every batch commits on its own; see copy_grades().
+    atomic = False
+
+    dependencies = [
+        ('managerLibrary', '0011_grade_value'),
+    ]
+
+    operations = [
+        migrations.RunPython(copy_grade_values, migrations.RunPython.noop),
+    ]
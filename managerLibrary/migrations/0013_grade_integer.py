@@ -0,0 +1,57 @@
+from django.db import migrations, models
+from django.db.models import Q
+from django.db.models.functions import Cast
+
+import managerLibrary.models
+
+VALID_GRADES = [str(grade) for grade in range(1, 11)]
+
+
+def copy_new_grade_values(apps, schema_editor):
+    # Grades the old code wrote or edited since 0012 ran. They are few, and
+    # this runs in the same transaction as the column swap below.
+    Grades = apps.get_model('managerLibrary', 'Grades')
+    value = Cast('grade', models.IntegerField())
+    Grades.objects.filter(Q(grade_value=None) | Q(grade_value__lt=value) | Q(grade_value__gt=value),
+                          grade__in=VALID_GRADES).update(grade_value=value)
+    Grades.objects.exclude(grade__in=VALID_GRADES).exclude(grade_value=None).update(grade_value=None)
+
+
+def copy_grade_values_back(apps, schema_editor):
+    Grades = apps.get_model('managerLibrary', 'Grades')
+    Grades.objects.exclude(grade_value=None).update(grade=Cast('grade_value', models.CharField(max_length=2)))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('managerLibrary', '0012_grade_value_backfill'),
+    ]
+
+    operations = [
+        migrations.RunPython(copy_new_grade_values, copy_grade_values_back),
+        migrations.RemoveField(
+            model_name='grades',
+            name='grade',
+        ),
+        migrations.RenameField(
+            model_name='grades',
+            old_name='grade_value',
+            new_name='grade',
+        ),
+        migrations.AlterField(
+            model_name='grades',
+            name='grade',
+            field=managerLibrary.models.GradeField(blank=True, choices=[(1, '1'), (2, '2'), (3, '3'), (4, '4'), (5, '5'), (6, '6'), (7, '7'), (8, '8'), (9, '9'), (10, '10')], null=True),
+        ),
+        # Built inside this migration's transaction, so writes to the table
+        # wait for it; on a large table deploy 0013 when writes are few.
+        migrations.AddIndex(
+            model_name='grades',
+            index=models.Index(condition=models.Q(deleted_at=None), fields=['subject', 'grade'], name='grades_subject_grade_alive'),
+        ),
+        migrations.AddConstraint(
+            model_name='grades',
+            constraint=models.CheckConstraint(check=models.Q(models.Q(('grade__gte', 1), ('grade__lte', 10)), ('grade', None), _connector='OR'), name='grades_grade_range'),
+        ),
+    ]
@@ -0,0 +1,51 @@
+from django.db import migrations, models
+import django.utils.timezone
+
+import managerLibrary.models
+
+
+class Migration(migrations.Migration):
+    """
+    Existing rows are left without a cycle or range, to be derived by
+    backfill_course_timeline; only rows created from now on get the defaults.
+    """
+
+    dependencies = [
+        ('managerLibrary', '0013_grade_integer'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='coursehistory',
+            name='cycle',
+            field=models.PositiveSmallIntegerField(null=True),
+        ),
+        migrations.AddField(
+            model_name='coursehistory',
+            name='valid_from',
+            field=models.DateField(null=True),
+        ),
+        migrations.AddField(
+            model_name='coursehistory',
+            name='valid_to',
+            field=models.DateField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='coursehistory',
+            name='cycle',
+            field=models.PositiveSmallIntegerField(default=managerLibrary.models.current_cycle, null=True),
+        ),
+        migrations.AlterField(
+            model_name='coursehistory',
+            name='valid_from',
+            field=models.DateField(default=django.utils.timezone.localdate, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='coursehistory',
+            index=models.Index(condition=models.Q(deleted_at=None), fields=['id_course', 'cycle'], name='coursehistory_course_cycle'),
+        ),
+        migrations.AddIndex(
+            model_name='coursehistory',
+            index=models.Index(condition=models.Q(deleted_at=None), fields=['student', 'cycle'], name='coursehistory_student_cycle'),
+        ),
+    ]
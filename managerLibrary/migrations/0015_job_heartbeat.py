@@ -0,0 +1,33 @@
+# Generated by Django 2.2.28 on 2026-10-18 11:58
+
+from django.db import migrations, models
+
+
+def start_heartbeats(apps, schema_editor):
+    # Jobs running now count as last seen when they started.
+    Job = apps.get_model('managerLibrary', 'Job')
+    Job.objects.filter(status='running').update(heartbeat_at=models.F('started_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('managerLibrary', '0014_course_timeline'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='job',
+            name='job_running_idx',
+        ),
+        migrations.AddField(
+            model_name='job',
+            name='heartbeat_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunPython(start_heartbeats, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='job',
+            index=models.Index(condition=models.Q(status='running'), fields=['heartbeat_at'], name='job_heartbeat_idx'),
+        ),
+    ]
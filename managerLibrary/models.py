@@ -1,6 +1,9 @@
+import json
+
 from django.contrib.auth.base_user import AbstractBaseUser
 from django.contrib.auth.models import PermissionsMixin
 from django.db import models
+from django.db.models import Q
 from django.contrib.auth import get_user_model
 from django.utils import timezone
 from .managers import SoftDeletionManager, CustomUserManager
@@ -21,12 +24,67 @@ class CustomUser(AbstractBaseUser, PermissionsMixin):
         return self.email
 
 
+def alive_index(fields, name):
+    """
+    Partial index restricted to rows the default SoftDeletionManager returns.
+
+    Backends without partial index support (MySQL) skip it entirely.
+    """
+    return models.Index(fields=fields, name=name, condition=Q(deleted_at=None))
+
+
+def deleted_index(name):
+    """
+    Partial index over soft-deleted rows only, used by dead() and purges.
+
+    It stays small and can never be picked for the alive-only filter.
+    """
+    return models.Index(fields=['deleted_at'], name=name, condition=Q(deleted_at__isnull=False))
+
+
+MIN_GRADE = 1
+MAX_GRADE = 10
+
+
+def current_cycle():
+    """The school year of today, which in this school is the calendar year."""
+    return timezone.localdate().year
+
+
+class GradeField(models.PositiveSmallIntegerField):
+    """
+    An integer grade from MIN_GRADE to MAX_GRADE, NULL until graded. Still takes the strings the old
+    CharField did: "8" from forms, fixtures and callers, "0" for no grade.
+    """
+    NO_GRADE = ('', '0')
+
+    def to_python(self, value):
+        if value in self.NO_GRADE:
+            return None
+        return super(GradeField, self).to_python(value)
+
+    def get_prep_value(self, value):
+        if value in self.NO_GRADE:
+            value = None
+        return super(GradeField, self).get_prep_value(value)
+
+    def pre_save(self, model_instance, add):
+        # Saved instances hold the integer, as if loaded from the database.
+        value = self.to_python(getattr(model_instance, self.attname))
+        setattr(model_instance, self.attname, value)
+        return value
+
+
 class SoftDeletionModel(models.Model):
     deleted_at = models.DateTimeField(blank=True, null=True)
 
     objects = SoftDeletionManager()
     all_objects = SoftDeletionManager(alive_only=False)
 
+    # Nullable foreign keys whose target's soft delete should also soft delete
+    # this row. Foreign keys with on_delete=CASCADE are always followed.
+    soft_delete_parents = ()
+
     class Meta:
         abstract = True
 
@@ -102,6 +160,7 @@ class Course(SoftDeletionModel):
     )
 
     class Meta:
+        indexes = [deleted_index('course_deleted')]
         unique_together = ("year", "division", "shift")
 
     def __str__(self):
@@ -112,6 +171,12 @@ class Subject(SoftDeletionModel):
     id_subject = models.AutoField(primary_key = True)
     name = models.CharField(max_length = 254)
 
+    class Meta:
+        indexes = [
+            alive_index(['name'], 'subject_name_alive'),
+            deleted_index('subject_deleted'),
+        ]
+
     def __str__(self):
         return self.name
 
@@ -120,6 +185,9 @@ class Principal(CustomUser, SoftDeletionModel):
     first_name = models.CharField(max_length = 50, null = False, blank = False)
     last_name = models.CharField(max_length = 50, null=False, blank=False)
 
+    class Meta:
+        indexes = [deleted_index('principal_deleted')]
+
     def __str__(self):
         return "Director: " + self.first_name + " " + self.last_name
 
@@ -128,6 +196,9 @@ class Preceptor(CustomUser, SoftDeletionModel):
     first_name = models.CharField(max_length=50, null=False, blank=False)
     last_name = models.CharField(max_length=50, null=False, blank=False)
 
+    class Meta:
+        indexes = [deleted_index('preceptor_deleted')]
+
     def __str__(self):
         return "Preceptor: " + self.first_name + " " + self.last_name
 
@@ -139,6 +210,9 @@ class Professor(CustomUser, SoftDeletionModel):
         Subject,
         related_name = "subjects")
 
+    class Meta:
+        indexes = [deleted_index('professor_deleted')]
+
     def __str__(self):
         return "Profesor: " +  self.first_name + " " + self.last_name
 
@@ -155,6 +229,12 @@ class Student(SoftDeletionModel):
         null = False)
     birthday = models.DateTimeField()
 
+    class Meta:
+        indexes = [
+            alive_index(['last_name', 'first_name'], 'student_name_alive'),
+            deleted_index('student_deleted'),
+        ]
+
     def __str__(self):
         return "%s %s" % (self.first_name, self.last_name)
 
@@ -164,6 +244,9 @@ class Category(SoftDeletionModel):
     name = models.CharField(max_length = 200)
     description = models.TextField()
 
+    class Meta:
+        indexes = [deleted_index('category_deleted')]
+
     def __str__(self):
         return self.name
 
@@ -185,6 +268,13 @@ class Comment(SoftDeletionModel):
     description = models.TextField()
     date = models.DateTimeField(default = timezone.now)
 
+    class Meta:
+        indexes = [
+            alive_index(['student', 'date'], 'comment_student_date_alive'),
+            alive_index(['date', 'id'], 'comment_date_alive'),
+            deleted_index('comment_deleted'),
+        ]
+
     def __str__(self):
         return str(self.id)
 
@@ -194,6 +284,9 @@ class Phone(SoftDeletionModel):
     number = models.CharField(max_length=50, blank = False, null = False)
     student = models.ForeignKey(Student, on_delete = models.CASCADE, related_name = "phone")
 
+    class Meta:
+        indexes = [deleted_index('phone_deleted')]
+
     def __str__(self):
         return self.number
 
@@ -202,6 +295,20 @@ class CourseHistory(SoftDeletionModel):
     id = models.AutoField(primary_key=True)
     id_course = models.ForeignKey(Course, null = True, on_delete = models.SET_NULL)
     student = models.ForeignKey(Student, on_delete = models.CASCADE, related_name = "courseHistory")
+    # The student was in the course from valid_from until the day before
+    # valid_to, or until now while it is NULL. Rows from before these
+    # columns existed have no cycle until backfill_course_timeline runs.
+    cycle = models.PositiveSmallIntegerField(null = True, default = current_cycle)
+    valid_from = models.DateField(null = True, default = timezone.localdate)
+    valid_to = models.DateField(null = True, blank = True)
+
+    class Meta:
+        indexes = [
+            alive_index(['id_course', 'student'], 'coursehistory_course_alive'),
+            alive_index(['id_course', 'cycle'], 'coursehistory_course_cycle'),
+            alive_index(['student', 'cycle'], 'coursehistory_student_cycle'),
+            deleted_index('coursehistory_deleted'),
+        ]
 
     def __str__(self):
         return str(self.id)
@@ -213,23 +320,23 @@ class AcademicHistory(SoftDeletionModel):
     subject = models.ForeignKey(Subject, null = True, on_delete = models.SET_NULL)
     cycle = models.IntegerField()
 
+    class Meta:
+        indexes = [
+            alive_index(['id_course', 'cycle'], 'academichist_course_alive'),
+            deleted_index('academichistory_deleted'),
+        ]
+
     def __str__(self):
         return str(self.id)
 
 
 class Grades(SoftDeletionModel):
-    GRADE_CHOICES = (
-        ("1", "1"),
-        ("2", "2"),
-        ("3", "3"),
-        ("4", "4"),
-        ("5", "5"),
-        ("6", "6"),
-        ("7", "7"),
-        ("8", "8"),
-        ("9", "9"),
-        ("10", "10"),
-    )
+    GRADE_CHOICES = tuple((grade, str(grade)) for grade in range(MIN_GRADE, MAX_GRADE + 1))
+    # Graded rows, as a range rather than IS NOT NULL: SQLite then reads
+    # aggregates from the (subject, grade) index alone.
+    GRADED = Q(grade__range=(MIN_GRADE, MAX_GRADE))
+
+    soft_delete_parents = ('student',)
 
     id = models.AutoField(primary_key=True)
     professor = models.ForeignKey(
@@ -244,28 +351,179 @@ class Grades(SoftDeletionModel):
         Subject,
         null = True,
         on_delete = models.SET_NULL)
-    grade = models.CharField(
-        max_length = 2,
+    grade = GradeField(
         choices = GRADE_CHOICES,
-        default = "0",
+        null = True,
+        blank = True,
     )
 
+    class Meta:
+        indexes = [
+            alive_index(['student', 'subject'], 'grades_student_subject_alive'),
+            alive_index(['subject', 'grade'], 'grades_subject_grade_alive'),
+            deleted_index('grades_deleted'),
+        ]
+        constraints = [
+            models.CheckConstraint(check=Q(grade__gte=MIN_GRADE, grade__lte=MAX_GRADE) | Q(grade=None),
+                                   name='grades_grade_range'),
+        ]
+
     def __str__(self):
-        return self.grade
+        return str(self.grade) if self.grade is not None else '-'
 
 
 class Presence(SoftDeletionModel):
+    soft_delete_parents = ('student',)
+
     id = models.AutoField(primary_key=True)
-    date = models.DateTimeField(default = timezone.now)
-    student = models.OneToOneField(
+    date = models.DateField(default = timezone.localdate)
+    student = models.ForeignKey(
         Student,
         null = True,
-        on_delete = models.SET_NULL)
-    preceptor = models.OneToOneField(
+        on_delete = models.SET_NULL,
+        related_name = "presences")
+    preceptor = models.ForeignKey(
         Preceptor,
         null = True,
-        on_delete = models.SET_NULL)
+        on_delete = models.SET_NULL,
+        related_name = "presences")
     presence = models.NullBooleanField()
 
+    class Meta:
+        # The unique index on (student, date) also serves per-student lookups.
+        unique_together = ("student", "date")
+        indexes = [
+            alive_index(['date'], 'presence_date_alive'),
+            deleted_index('presence_deleted'),
+        ]
+
+    def __str__(self):
+        return "%s %s %s" % (self.date, self.student, self.presence)
+
+
+class StudentAcademicSummary(models.Model):
+    """
+    Denormalized per-student figures for the profile and progress pages.
+
+    Rows are derived data: signals in summaries.py keep them current and the
+    rebuild_summaries command recomputes them from scratch.
+    """
+    student = models.OneToOneField(
+        Student,
+        primary_key = True,
+        on_delete = models.CASCADE,
+        related_name = "summary")
+    course = models.ForeignKey(Course, null = True, on_delete = models.SET_NULL)
+    grade_average = models.FloatField(null = True)
+    # JSON object mapping subject id to that subject's grade average.
+    subject_averages = models.TextField(default = "{}")
+    attendance_rate = models.FloatField(null = True)
+    comment_count = models.IntegerField(default = 0)
+    updated_at = models.DateTimeField(auto_now = True)
+
+    def subject_average_map(self):
+        return {int(subject): average for subject, average in json.loads(self.subject_averages).items()}
+
+    def __str__(self):
+        return str(self.student_id)
+
+
+class AttendanceBitmap(models.Model):
+    """
+    One school year of a student's attendance packed into two bitsets, one
+    bit per day of the year: ``present`` for days marked present and
+    ``absent`` for recorded absences. Derived from Presence rows, see
+    attendance_bitmaps.py.
+    """
+    student = models.ForeignKey(
+        Student,
+        on_delete = models.CASCADE,
+        related_name = "attendance_bitmaps")
+    year = models.PositiveSmallIntegerField()
+    present = models.BinaryField()
+    absent = models.BinaryField()
+
+    class Meta:
+        unique_together = ("student", "year")
+
+    def __str__(self):
+        return "%s %s" % (self.student_id, self.year)
+
+
+class CategoryDailyCount(models.Model):
+    """
+    How many alive comments of a category a student got on one (local) day,
+    with the course the student is in. Derived from Comment.categories and
+    kept current by signals; see category_stats.py.
+    """
+    category = models.ForeignKey(
+        Category,
+        on_delete = models.CASCADE,
+        related_name = "daily_counts")
+    course = models.ForeignKey(Course, null = True, on_delete = models.SET_NULL)
+    student = models.ForeignKey(
+        Student,
+        on_delete = models.CASCADE,
+        related_name = "category_daily_counts")
+    day = models.DateField()
+    count = models.PositiveIntegerField()
+
+    class Meta:
+        unique_together = ("student", "day", "category")
+        indexes = [
+            models.Index(fields = ["category", "day"], name = "categorycount_category_day"),
+            models.Index(fields = ["course", "day"], name = "categorycount_course_day"),
+        ]
+
+    def __str__(self):
+        return "%s %s %s: %d" % (self.category_id, self.student_id, self.day, self.count)
+
+
+class Job(models.Model):
+    """
+    A unit of background work, run by the run_jobs command; see jobs.py.
+
+    ``name`` picks the registered job function and ``payload`` holds its
+    keyword arguments as JSON. Higher priorities run first. A job with an
+    ``idempotency_key`` is only ever enqueued once.
+    """
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    STATUS_CHOICES = [
+        (QUEUED, "En cola"),
+        (RUNNING, "En ejecución"),
+        (DONE, "Terminado"),
+        (FAILED, "Fallido"),
+    ]
+    name = models.CharField(max_length = 100)
+    payload = models.TextField(default = "{}")
+    priority = models.SmallIntegerField(default = 0)
+    status = models.CharField(max_length = 10, choices = STATUS_CHOICES, default = QUEUED)
+    idempotency_key = models.CharField(max_length = 200, unique = True, null = True, blank = True)
+    attempts = models.PositiveSmallIntegerField(default = 0)
+    max_attempts = models.PositiveSmallIntegerField(default = 5)
+    run_after = models.DateTimeField(default = timezone.now)
+    created_at = models.DateTimeField(default = timezone.now)
+    started_at = models.DateTimeField(null = True, blank = True)
+    # Refreshed by the worker while the job runs; see jobs.requeue_stale().
+    heartbeat_at = models.DateTimeField(null = True, blank = True)
+    finished_at = models.DateTimeField(null = True, blank = True)
+    worker = models.CharField(max_length = 100, blank = True)
+    result = models.TextField(blank = True)
+    last_error = models.TextField(blank = True)
+
+    class Meta:
+        indexes = [
+            # The worker's "next job" query, over queued rows only.
+            models.Index(fields = ["-priority", "run_after", "id"], name = "job_queue_idx",
+                         condition = Q(status = "queued")),
+            models.Index(fields = ["heartbeat_at"], name = "job_heartbeat_idx", condition = Q(status = "running")),
+        ]
+
+    def payload_dict(self):
+        return json.loads(self.payload)
+
     def __str__(self):
-        return "%s %s %s" % (self.date, self.student, self.presence)
\ No newline at end of file
+        return "%s #%s (%s)" % (self.name, self.pk, self.status)
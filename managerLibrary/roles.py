@@ -0,0 +1,60 @@
+from collections import namedtuple
+
+from django.core.cache import cache
+
+from .models import CustomUser
+
+
+PRINCIPAL = 'principal'
+PRECEPTOR = 'preceptor'
+PROFESSOR = 'professor'
+ROLES = (PRINCIPAL, PRECEPTOR, PROFESSOR)
+
+CACHE_KEY = 'role:%s'
+CACHE_TIMEOUT = 60 * 60
+
+# ``subjects`` holds (id, name) pairs and is only filled in for professors.
+Role = namedtuple('Role', ['user_id', 'name', 'first_name', 'last_name', 'subjects'])
+
+
+def _fetch_role(user_id):
+    """Probe the three child tables and the professor's subjects in one query."""
+    fields = ['professor__subjects', 'professor__subjects__name', 'professor__subjects__deleted_at']
+    for role in ROLES:
+        fields += [role, role + '__first_name', role + '__last_name', role + '__deleted_at']
+    rows = list(CustomUser.objects.filter(pk=user_id).values(*fields))
+
+    row = rows[0] if rows else {}
+    for role in ROLES:
+        if row.get(role) is not None and row[role + '__deleted_at'] is None:
+            subjects = ()
+            if role == PROFESSOR:
+                subjects = tuple(sorted(
+                    {(r['professor__subjects'], r['professor__subjects__name'])
+                     for r in rows
+                     if r['professor__subjects'] is not None and r['professor__subjects__deleted_at'] is None},
+                    key=lambda subject: subject[1]))
+            return Role(user_id, role, row[role + '__first_name'], row[role + '__last_name'], subjects)
+    return Role(user_id, None, '', '', ())
+
+
+def resolve_role(user_id):
+    """The role of a user, from the shared cache or one query on a miss."""
+    key = CACHE_KEY % user_id
+    role = cache.get(key)
+    if role is None:
+        role = _fetch_role(user_id)
+        cache.set(key, role, CACHE_TIMEOUT)
+    return role
+
+
+def role_for_request(request):
+    """resolve_role() memoized on the request; None for anonymous users."""
+    if not hasattr(request, '_role'):
+        user = getattr(request, 'user', None)
+        request._role = resolve_role(user.pk) if user is not None and user.is_authenticated else None
+    return request._role
+
+
+def invalidate_role(user_id):
+    cache.delete(CACHE_KEY % user_id)
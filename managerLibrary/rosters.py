@@ -0,0 +1,154 @@
+import operator
+import time
+from collections import defaultdict, namedtuple
+from functools import reduce
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Course, CourseHistory, Phone
+from .timeline import valid_on
+
+
+# Rosters are cached under (year, division, shift), the Course's
+# unique_together, with a version number per course. Invalidating bumps the
+# version, so a roster being rebuilt concurrently can only ever be written
+# under a version nobody reads anymore.
+ROSTER_KEY = 'roster:%s:%s:%s:v%d'
+VERSION_KEY = 'roster-version:%s:%s:%s'
+COURSE_KEY = 'roster-course:%d'
+CACHE_TIMEOUT = 24 * 60 * 60
+
+# Cached in place of a roster for a (year, division, shift) with no course.
+NO_COURSE = ()
+
+RosterStudent = namedtuple('RosterStudent', ['id', 'first_name', 'last_name', 'phones'])
+Roster = namedtuple('Roster', ['course_id', 'year', 'division', 'shift', 'students'])
+
+
+def build_rosters(keys=None):
+    """
+    Rosters of the alive courses matching ``keys`` ((year, division, shift)
+    tuples), or of every course, by key: the students in them today, as
+    timeline.roster_at() has them. Costs three queries.
+    """
+    today = timezone.localdate()
+    courses = Course.objects.all()
+    if keys is not None:
+        if not keys:
+            return {}
+        courses = courses.filter(reduce(operator.or_, (
+            Q(year=year, division=division, shift=shift) for year, division, shift in keys)))
+    courses = {row[0]: row[1:] for row in courses.values_list('id_course', 'year', 'division', 'shift')}
+
+    phones = defaultdict(list)
+    for student_id, number in Phone.objects.filter(
+            valid_on(today, 'student__courseHistory__'),
+            student__courseHistory__id_course__in=courses,
+            student__courseHistory__deleted_at=None,
+    ).order_by('student_id', 'number').values_list('student_id', 'number').distinct():
+        phones[student_id].append(number)
+
+    students = defaultdict(list)
+    seen = set()
+    for course_id, student_id, first_name, last_name in CourseHistory.objects.filter(
+            valid_on(today),
+            id_course__in=courses,
+            student__deleted_at=None,
+    ).order_by('student__last_name', 'student__first_name', 'student_id').values_list(
+            'id_course_id', 'student_id', 'student__first_name', 'student__last_name'):
+        if (course_id, student_id) not in seen:
+            seen.add((course_id, student_id))
+            students[course_id].append(RosterStudent(student_id, first_name, last_name, tuple(phones[student_id])))
+
+    return {
+        key: Roster(course_id, key[0], key[1], key[2], tuple(students[course_id]))
+        for course_id, key in courses.items()
+    }
+
+
+def _new_version():
+    # Versions start from the clock, so a version key that was evicted can't
+    # come back with a number an older, still cached roster was stored under.
+    return int(time.time() * 1000)
+
+
+def _versions(keys):
+    found = cache.get_many([VERSION_KEY % key for key in keys])
+    versions = {}
+    for key in keys:
+        version = found.get(VERSION_KEY % key)
+        if version is None:
+            cache.add(VERSION_KEY % key, _new_version(), None)
+            version = cache.get(VERSION_KEY % key)
+        versions[key] = version
+    return versions
+
+
+def get_roster(year, division, shift):
+    """The course's Roster, or None if there is no such course. Costs no query once cached."""
+    key = (year, division, shift)
+    cache_key = ROSTER_KEY % (key + (_versions([key])[key],))
+    roster = cache.get(cache_key)
+    if roster is None:
+        roster = build_rosters([key]).get(key, NO_COURSE)
+        cache.set(cache_key, roster, CACHE_TIMEOUT)
+    return roster or None
+
+
+def _course_keys(course_ids):
+    """(year, division, shift) of each course id, cached; deleted courses included."""
+    course_ids = set(course_ids) - {None}
+    found = cache.get_many([COURSE_KEY % pk for pk in course_ids])
+    keys = {pk: tuple(found[COURSE_KEY % pk]) for pk in course_ids if COURSE_KEY % pk in found}
+    missing = course_ids - set(keys)
+    if missing:
+        for pk, year, division, shift in Course.all_objects.filter(pk__in=missing).values_list(
+                'id_course', 'year', 'division', 'shift'):
+            keys[pk] = (year, division, shift)
+        cache.set_many({COURSE_KEY % pk: keys[pk] for pk in missing if pk in keys}, CACHE_TIMEOUT)
+    return keys
+
+
+def get_course_roster(course_id):
+    """get_roster() for a course id."""
+    key = _course_keys([course_id]).get(course_id)
+    return get_roster(*key) if key else None
+
+
+def _bump(keys):
+    for key in keys:
+        try:
+            cache.incr(VERSION_KEY % key)
+        except ValueError:
+            # No version yet means nothing was cached under it.
+            pass
+
+
+def invalidate_rosters(course_ids=(), keys=()):
+    """
+    Drop the cached rosters of the given course ids and (year, division,
+    shift) keys. Versions are bumped again on commit, since another request
+    may rebuild a roster from the data as it was before this transaction.
+    """
+    keys = set(keys) | set(_course_keys(course_ids).values())
+    if keys:
+        _bump(keys)
+        transaction.on_commit(lambda: _bump(keys))
+
+
+def forget_course(course_id):
+    """Forget a course's cached (year, division, shift), e.g. after it changed."""
+    cache.delete(COURSE_KEY % course_id)
+
+
+def warm_rosters():
+    """Build and cache every course's roster. Returns how many were cached."""
+    rosters = build_rosters()
+    versions = _versions(list(rosters))
+    cache.set_many({ROSTER_KEY % (key + (versions[key],)): roster for key, roster in rosters.items()},
+                   CACHE_TIMEOUT)
+    cache.set_many({COURSE_KEY % roster.course_id: key for key, roster in rosters.items()}, CACHE_TIMEOUT)
+    return len(rosters)
@@ -0,0 +1,170 @@
+import re
+import unicodedata
+
+from django.db import connection, transaction
+from django.db.models import Q
+
+from .models import Category, Comment, Student
+
+
+TABLE = 'managerLibrary_searchindex'
+
+# Every indexed object gets one document whose id packs the object's primary
+# key with its kind, so documents can be replaced by id without a scan.
+STUDENT, COMMENT, CATEGORY = 1, 2, 3
+KIND_BITS = 2
+KIND_MASK = (1 << KIND_BITS) - 1
+KIND_NAMES = {STUDENT: 'student', COMMENT: 'comment', CATEGORY: 'category'}
+MODELS = {Student: STUDENT, Comment: COMMENT, Category: CATEGORY}
+
+BATCH_SIZE = 500
+
+
+def normalize(text):
+    """Lowercase and strip accents so "Pérez" and "perez" index the same way."""
+    decomposed = unicodedata.normalize('NFKD', text)
+    return ''.join(c for c in decomposed if not unicodedata.combining(c)).lower()
+
+
+def document_text(instance):
+    if isinstance(instance, Student):
+        return '%s %s' % (instance.first_name, instance.last_name)
+    if isinstance(instance, Comment):
+        return instance.description
+    return instance.name
+
+
+def document_id(kind, pk):
+    return pk << KIND_BITS | kind
+
+
+def is_supported():
+    return connection.vendor in ('sqlite', 'postgresql')
+
+
+def remove(document_ids):
+    document_ids = list(document_ids)
+    if not document_ids or not is_supported():
+        return
+    with connection.cursor() as cursor:
+        for start in range(0, len(document_ids), BATCH_SIZE):
+            batch = document_ids[start:start + BATCH_SIZE]
+            cursor.execute('DELETE FROM %s WHERE %s IN (%s)' % (
+                TABLE, 'rowid' if connection.vendor == 'sqlite' else 'id', ', '.join(['%s'] * len(batch))), batch)
+
+
+def index(documents):
+    """Insert or replace (document id, text) pairs."""
+    documents = [(doc_id, normalize(text)) for doc_id, text in documents]
+    if not documents or not is_supported():
+        return
+    with transaction.atomic(), connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            remove(doc_id for doc_id, _ in documents)
+            cursor.executemany(
+                'INSERT INTO %s (rowid, kind, body) VALUES (%%s, %%s, %%s)' % TABLE,
+                [(doc_id, KIND_NAMES[doc_id & KIND_MASK], text) for doc_id, text in documents])
+        else:
+            cursor.executemany(
+                "INSERT INTO %s (id, body, document) VALUES (%%s, %%s, to_tsvector('spanish', %%s)) "
+                "ON CONFLICT (id) DO UPDATE SET body = EXCLUDED.body, document = EXCLUDED.document" % TABLE,
+                [(doc_id, text, text) for doc_id, text in documents])
+
+
+def sync(instance, deleted=False):
+    """Bring one object's document in line with the object."""
+    doc_id = document_id(MODELS[type(instance)], instance.pk)
+    if deleted or instance.deleted_at is not None:
+        remove([doc_id])
+    else:
+        index([(doc_id, document_text(instance))])
+
+
+def rebuild():
+    """Reindex every alive student, comment and category. Returns the document count."""
+    if not is_supported():
+        return 0
+    with connection.cursor() as cursor:
+        cursor.execute('DELETE FROM %s' % TABLE)
+    total = 0
+    for model, kind in MODELS.items():
+        batch = []
+        for instance in model.objects.order_by('pk').iterator(chunk_size=BATCH_SIZE):
+            batch.append((document_id(kind, instance.pk), document_text(instance)))
+            if len(batch) == BATCH_SIZE:
+                index(batch)
+                total += len(batch)
+                batch = []
+        index(batch)
+        total += len(batch)
+    return total
+
+
+def _match(terms, kinds, limit):
+    # Only the last word is still being typed, so only it is a prefix; the
+    # others match whole words, which is much cheaper on common words.
+    # Results come newest first, which lets the index stop after ``limit``
+    # matches instead of ranking all of them.
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            expression = 'body : (%s)' % ' '.join(['"%s"' % term for term in terms[:-1]] + ['"%s"*' % terms[-1]])
+            if kinds:
+                expression += ' AND kind : (%s)' % ' OR '.join(KIND_NAMES[kind] for kind in kinds)
+            cursor.execute(
+                'SELECT rowid FROM %s WHERE %s MATCH %%s ORDER BY rowid DESC LIMIT %%s' % (TABLE, TABLE),
+                [expression, limit])
+        else:
+            kind_filter = ''
+            if kinds:
+                kind_filter = ' AND (id & %d) IN (%s)' % (KIND_MASK, ', '.join(str(int(k)) for k in kinds))
+            cursor.execute(
+                "SELECT id FROM %s WHERE document @@ to_tsquery('spanish', %%s)%s ORDER BY id DESC LIMIT %%s"
+                % (TABLE, kind_filter),
+                [' & '.join(terms[:-1] + [terms[-1] + ':*']), limit])
+        return [row[0] for row in cursor.fetchall()]
+
+
+def _fallback_match(terms, kinds, limit):
+    """Unindexed icontains search for backends without full-text support."""
+    doc_ids = []
+    for model, kind in MODELS.items():
+        if kinds and kind not in kinds:
+            continue
+        queryset = model.objects.all()
+        field = {STUDENT: None, COMMENT: 'description', CATEGORY: 'name'}[kind]
+        for term in terms:
+            if field:
+                queryset = queryset.filter(**{field + '__icontains': term})
+            else:
+                queryset = queryset.filter(Q(first_name__icontains=term) | Q(last_name__icontains=term))
+        doc_ids += [document_id(kind, pk) for pk in queryset.values_list('pk', flat=True)[:limit]]
+    return doc_ids[:limit]
+
+
+def search(query, kinds=None, limit=10):
+    """
+    Typeahead search over student names, comment descriptions and category
+    names. Every word of ``query`` must appear in the document, the last one
+    as a prefix, ignoring case and accents. Returns dicts with kind, id and
+    text, newest first.
+    """
+    terms = re.findall(r'\w+', normalize(query))
+    if not terms:
+        return []
+    doc_ids = (_match if is_supported() else _fallback_match)(terms, kinds, limit)
+
+    by_kind = {}
+    for doc_id in doc_ids:
+        by_kind.setdefault(doc_id & KIND_MASK, []).append(doc_id >> KIND_BITS)
+    objects = {}
+    for model, kind in MODELS.items():
+        if kind in by_kind:
+            for pk, instance in model.objects.in_bulk(by_kind[kind]).items():
+                objects[kind, pk] = instance
+
+    results = []
+    for doc_id in doc_ids:
+        instance = objects.get((doc_id & KIND_MASK, doc_id >> KIND_BITS))
+        if instance is not None:
+            results.append({'kind': KIND_NAMES[doc_id & KIND_MASK], 'id': instance.pk, 'text': document_text(instance)})
+    return results
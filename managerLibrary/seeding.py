@@ -0,0 +1,154 @@
+import random
+from datetime import date, datetime, time, timedelta
+from itertools import product
+
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from . import category_stats, search
+from .attendance_bitmaps import rebuild_bitmaps
+from .models import (
+    Category, Comment, Course, CourseHistory, Grades, MAX_GRADE, MIN_GRADE, Phone, Preceptor, Presence, Principal,
+    Professor, Student, Subject,
+)
+from .summaries import rebuild_summaries
+
+
+SCALES = {'10k': 10000, '100k': 100000, '1m': 1000000}
+DEFAULT_CHUNK_SIZE = 2000
+# Django picks the largest batch each backend allows.
+BATCH_SIZE = None
+
+FIRST_NAMES = (
+    'Juan', 'María', 'Sofía', 'Mateo', 'Valentina', 'Santiago', 'Camila', 'Benjamín', 'Martina', 'Lucas',
+    'Isabella', 'Tomás', 'Emilia', 'Joaquín', 'Catalina', 'Thiago', 'Lucía', 'Agustín', 'Julieta', 'Facundo',
+)
+LAST_NAMES = (
+    'González', 'Rodríguez', 'Gómez', 'Fernández', 'López', 'Díaz', 'Martínez', 'Pérez', 'García', 'Sánchez',
+    'Romero', 'Sosa', 'Álvarez', 'Torres', 'Ruiz', 'Ramírez', 'Flores', 'Acosta', 'Benítez', 'Medina',
+)
+SUBJECTS = (
+    'Matemática', 'Lengua', 'Historia', 'Geografía', 'Biología', 'Física', 'Química', 'Inglés',
+    'Educación Física', 'Música', 'Plástica', 'Formación Ética',
+)
+CATEGORIES = (
+    'Conducta', 'Mérito', 'Inasistencia', 'Tarea', 'Salud', 'Reunión con padres', 'Convivencia', 'Deporte',
+)
+COMMENTS = (
+    'Participa en clase', 'No trajo la tarea', 'Muy buen trabajo en grupo', 'Llegó tarde',
+    'Se retiró temprano', 'Excelente examen', 'Conversa durante la clase', 'Ayudó a un compañero',
+)
+# Heavier around 7, as real report cards are.
+GRADE_WEIGHTS = (1, 2, 3, 5, 8, 12, 16, 14, 9, 5)
+ATTENDANCE_RATE = 0.9
+# Students are 12 in the first year, 13 in the second...
+FIRST_YEAR_AGE = 12
+# The school year of the data, fixed so that a seed always gives the same rows.
+DEFAULT_CYCLE = 2024
+
+
+def school_days(cycle, count):
+    """The first ``count`` weekdays of the cycle, which starts on March 1st."""
+    day, days = date(cycle, 3, 1), []
+    while len(days) < count:
+        if day.weekday() < 5:
+            days.append(day)
+        day += timedelta(days=1)
+    return days
+
+
+def _staff(model, prefix, count):
+    # No usable password: hashing would dominate the seeding time.
+    return model.objects.bulk_create_users([
+        {'email': '%s%d@benchmark.local' % (prefix, i), 'password': None,
+         'first_name': FIRST_NAMES[i % len(FIRST_NAMES)], 'last_name': LAST_NAMES[i % len(LAST_NAMES)]}
+        for i in range(count)
+    ], workers=1)
+
+
+def seed(students, grades=6, comments=2, days=20, cycle=DEFAULT_CYCLE, seed=0, chunk_size=DEFAULT_CHUNK_SIZE,
+         derived=True, stdout=None):
+    """
+    Fill an empty database with ``students`` students spread over every
+    Course (year, division, shift), each with phones, a course registration
+    for ``cycle``, ``grades`` grades, ``comments`` comments and ``days``
+    days of attendance, plus the staff and catalogues they refer to. The
+    same arguments always produce the same data. Everything goes through
+    bulk_create, ``chunk_size`` students per transaction; with ``derived``
+    the summaries, bitmaps, category counts and search index are rebuilt
+    afterwards. Returns the number of rows per model.
+    """
+    rng = random.Random(seed)
+    start = timezone.make_aware(datetime.combine(date(cycle, 3, 1), time(8)))
+    calendar = school_days(cycle, days)
+
+    with transaction.atomic():
+        Course.objects.bulk_create([
+            Course(year=year, division=division, shift=shift) for (year, _), (division, _), (shift, _) in product(
+                Course.YEAR_IN_SCHOOL_CHOICES, Course.DIVISION_IN_SCHOOL_CHOICES, Course.SHIFT_IN_SCHOOL_CHOICES)])
+        Subject.objects.bulk_create([Subject(name=name) for name in SUBJECTS])
+        Category.objects.bulk_create([Category(name=name, description='') for name in CATEGORIES])
+        Principal.objects.bulk_create_users([{'email': 'director@benchmark.local', 'password': None,
+                                              'first_name': 'Ana', 'last_name': 'Directora'}], workers=1)
+        preceptor_ids = [user.pk for user in _staff(Preceptor, 'preceptor', max(5, students // 500))]
+        professor_ids = [user.pk for user in _staff(Professor, 'profesor', max(10, students // 200))]
+    courses = list(Course.objects.order_by('pk').values_list('pk', 'year'))
+    ages = {code: FIRST_YEAR_AGE + i for i, (code, _) in enumerate(Course.YEAR_IN_SCHOOL_CHOICES)}
+    subject_ids = list(Subject.objects.order_by('pk').values_list('pk', flat=True))
+    category_ids = list(Category.objects.order_by('pk').values_list('pk', flat=True))
+    grade_values = list(range(MIN_GRADE, MAX_GRADE + 1))
+
+    for offset in range(0, students, chunk_size):
+        count = min(chunk_size, students - offset)
+        with transaction.atomic():
+            last_id = Student.all_objects.aggregate(last=Max('id'))['last'] or 0
+            registrations = [courses[(offset + i) % len(courses)] for i in range(count)]
+            Student.objects.bulk_create([
+                Student(first_name=rng.choice(FIRST_NAMES), last_name=rng.choice(LAST_NAMES),
+                        birthday=start - timedelta(days=365 * ages[year] + rng.randrange(365)))
+                for _, year in registrations], batch_size=BATCH_SIZE)
+            student_ids = list(Student.all_objects.filter(id__gt=last_id).order_by('id').values_list('id', flat=True))
+
+            CourseHistory.objects.bulk_create([
+                CourseHistory(student_id=student_id, id_course_id=course_id, cycle=cycle, valid_from=calendar[0])
+                for student_id, (course_id, _) in zip(student_ids, registrations)], batch_size=BATCH_SIZE)
+            Phone.objects.bulk_create([
+                Phone(student_id=student_id, number='11%08d' % rng.randrange(10 ** 8))
+                for student_id in student_ids for _ in range(rng.randint(1, 2))], batch_size=BATCH_SIZE)
+            Grades.objects.bulk_create([
+                Grades(student_id=student_id, subject_id=rng.choice(subject_ids),
+                       professor_id=rng.choice(professor_ids),
+                       grade=rng.choices(grade_values, GRADE_WEIGHTS)[0])
+                for student_id in student_ids for _ in range(grades)], batch_size=BATCH_SIZE)
+            Presence.objects.bulk_create([
+                Presence(student_id=student_id, date=day, preceptor_id=rng.choice(preceptor_ids),
+                         presence=rng.random() < ATTENDANCE_RATE)
+                for student_id in student_ids for day in calendar], batch_size=BATCH_SIZE)
+
+            last_comment = Comment.all_objects.aggregate(last=Max('id'))['last'] or 0
+            Comment.objects.bulk_create([
+                Comment(student_id=student_id, author_id=rng.choice(preceptor_ids),
+                        description=rng.choice(COMMENTS), date=start + timedelta(minutes=rng.randrange(60 * 24 * days)))
+                for student_id in student_ids for _ in range(comments)], batch_size=BATCH_SIZE)
+            comment_ids = Comment.all_objects.filter(id__gt=last_comment).order_by('id').values_list('id', flat=True)
+            Comment.categories.through.objects.bulk_create([
+                Comment.categories.through(comment_id=comment_id, category_id=category_id)
+                for comment_id in comment_ids for category_id in rng.sample(category_ids, rng.randint(0, 2))],
+                batch_size=BATCH_SIZE)
+        if stdout:
+            stdout.write('%d/%d students' % (offset + count, students))
+
+    if derived:
+        # Worker threads can't see rows a surrounding transaction hasn't committed.
+        rebuild_summaries(workers=1 if connection.in_atomic_block else 4)
+        rebuild_bitmaps()
+        category_stats.backfill()
+        search.rebuild()
+    return counts()
+
+
+def counts():
+    models = (Course, Subject, Category, Principal, Preceptor, Professor, Student, CourseHistory, Phone, Grades,
+              Presence, Comment)
+    return {model._meta.label: model.all_objects.count() for model in models}
@@ -0,0 +1,261 @@
+from django.apps import apps
+from django.core.signals import request_finished, request_started
+from django.db.backends.signals import connection_created
+from django.db.models.signals import m2m_changed, post_delete, post_init, post_save, pre_delete
+from django.utils import timezone
+
+from . import caching, category_stats, search
+from .databases import check_connections, configure_sqlite, unpin_after_request
+from .attendance_bitmaps import set_days
+from .models import (
+    Category, Comment, Course, CourseHistory, CustomUser, Grades, Phone, Preceptor, Presence, Principal, Professor,
+    SoftDeletionModel, Student, Subject,
+)
+from .roles import invalidate_role
+from .rosters import forget_course, invalidate_rosters
+from .summaries import refresh_summaries
+
+
+def remember_summary_student(sender, instance, **kwargs):
+    # The student the row belonged to when loaded, so moving it to another
+    # student also refreshes the summary it left.
+    instance._summary_student_id = instance.__dict__.get('student_id')
+
+
+def refresh_student_summary(sender, instance, **kwargs):
+    # SoftDeletionModel.delete() goes through save(), so post_save also
+    # covers soft deletes; post_delete covers hard deletes.
+    if sender is Student:
+        refresh_summaries([instance.pk])
+        return
+    refresh_summaries({getattr(instance, '_summary_student_id', None), instance.student_id})
+    instance._summary_student_id = instance.student_id
+
+
+for model in (Student, Grades, Presence, Comment, CourseHistory):
+    if model is not Student:
+        post_init.connect(remember_summary_student, sender=model, dispatch_uid='summary_init_%s' % model.__name__)
+    post_save.connect(refresh_student_summary, sender=model, dispatch_uid='summary_%s' % model.__name__)
+    post_delete.connect(refresh_student_summary, sender=model, dispatch_uid='summary_delete_%s' % model.__name__)
+
+
+def sync_attendance_bitmap(sender, instance, **kwargs):
+    deleted = instance.deleted_at is not None or kwargs.get('signal') is post_delete
+    set_days([(instance.student_id, instance.date, None if deleted else instance.presence)])
+
+
+post_save.connect(sync_attendance_bitmap, sender=Presence, dispatch_uid='attendance_bitmap')
+post_delete.connect(sync_attendance_bitmap, sender=Presence, dispatch_uid='attendance_bitmap_delete')
+
+
+def invalidate_user_role(sender, instance, **kwargs):
+    invalidate_role(instance.pk)
+
+
+def invalidate_professor_subjects(sender, instance, action, reverse, pk_set, **kwargs):
+    if not action.startswith('post_'):
+        return
+    if not reverse:
+        invalidate_role(instance.pk)
+    else:
+        # Changed from the Subject side: pk_set holds professors, or is None on clear.
+        for professor_id in pk_set or Professor.all_objects.values_list('pk', flat=True):
+            invalidate_role(professor_id)
+
+
+def _subject_professors(subject):
+    through = Professor.subjects.through
+    return list(through.objects.filter(subject_id=subject.pk).values_list('professor_id', flat=True))
+
+
+def remember_subject_professors(sender, instance, **kwargs):
+    # A hard delete removes the subject's professor links before post_delete.
+    instance._role_professor_ids = _subject_professors(instance)
+
+
+def invalidate_subject_professors(sender, instance, **kwargs):
+    professor_ids = getattr(instance, '_role_professor_ids', None)
+    for professor_id in _subject_professors(instance) if professor_ids is None else professor_ids:
+        invalidate_role(professor_id)
+
+
+for model in (CustomUser, Principal, Preceptor, Professor):
+    post_save.connect(invalidate_user_role, sender=model, dispatch_uid='role_%s' % model.__name__)
+    post_delete.connect(invalidate_user_role, sender=model, dispatch_uid='role_delete_%s' % model.__name__)
+m2m_changed.connect(invalidate_professor_subjects, sender=Professor.subjects.through, dispatch_uid='role_subjects')
+post_save.connect(invalidate_subject_professors, sender=Subject, dispatch_uid='role_subject_name')
+pre_delete.connect(remember_subject_professors, sender=Subject, dispatch_uid='role_subject_pre_delete')
+post_delete.connect(invalidate_subject_professors, sender=Subject, dispatch_uid='role_subject_delete')
+
+
+def sync_search_index(sender, instance, **kwargs):
+    search.sync(instance, deleted=kwargs.get('signal') is post_delete)
+
+
+for model in (Student, Comment, Category):
+    post_save.connect(sync_search_index, sender=model, dispatch_uid='search_%s' % model.__name__)
+    post_delete.connect(sync_search_index, sender=model, dispatch_uid='search_delete_%s' % model.__name__)
+
+
+def remember_roster_course(sender, instance, **kwargs):
+    # What the row pointed at when loaded, so moving a student or renaming a
+    # course also invalidates the roster it left. Read from __dict__ so
+    # deferred fields aren't fetched.
+    if sender is Course:
+        instance._roster_key = tuple(instance.__dict__.get(field) for field in ('year', 'division', 'shift'))
+    else:
+        instance._roster_course_id = instance.__dict__.get('id_course_id')
+
+
+def invalidate_course_roster(sender, instance, **kwargs):
+    if sender is Course:
+        forget_course(instance.pk)
+        keys = {getattr(instance, '_roster_key', None), (instance.year, instance.division, instance.shift)}
+        invalidate_rosters(keys=keys - {None, (None, None, None)})
+    else:
+        invalidate_rosters(course_ids={getattr(instance, '_roster_course_id', None), instance.id_course_id})
+
+
+def invalidate_student_rosters(sender, instance, **kwargs):
+    student_id = instance.pk if sender is Student else instance.student_id
+    invalidate_rosters(course_ids=CourseHistory.objects.filter(student_id=student_id).values_list(
+        'id_course_id', flat=True))
+
+
+for model in (Course, CourseHistory):
+    post_init.connect(remember_roster_course, sender=model, dispatch_uid='roster_init_%s' % model.__name__)
+    post_save.connect(invalidate_course_roster, sender=model, dispatch_uid='roster_%s' % model.__name__)
+    post_delete.connect(invalidate_course_roster, sender=model, dispatch_uid='roster_delete_%s' % model.__name__)
+for model in (Student, Phone):
+    post_save.connect(invalidate_student_rosters, sender=model, dispatch_uid='roster_%s' % model.__name__)
+    post_delete.connect(invalidate_student_rosters, sender=model, dispatch_uid='roster_delete_%s' % model.__name__)
+
+
+def bump_generation(sender, instance, **kwargs):
+    # A Professor's cached reports may depend on CustomUser; bump the parents too.
+    caching.bump(sender, *sender._meta.get_parent_list())
+
+
+def bump_comment_generation(sender, action, **kwargs):
+    if action.startswith('post_'):
+        caching.bump(Comment)
+
+
+for model in apps.get_app_config('managerLibrary').get_models():
+    if issubclass(model, (SoftDeletionModel, CustomUser)):
+        post_save.connect(bump_generation, sender=model, dispatch_uid='generation_%s' % model.__name__)
+        post_delete.connect(bump_generation, sender=model, dispatch_uid='generation_delete_%s' % model.__name__)
+m2m_changed.connect(bump_comment_generation, sender=Comment.categories.through, dispatch_uid='generation_categories')
+
+
+connection_created.connect(configure_sqlite, dispatch_uid='sqlite_pragmas')
+request_started.connect(check_connections, dispatch_uid='connection_health_checks')
+request_finished.connect(unpin_after_request, dispatch_uid='replica_unpin')
+
+
+def remember_comment_bucket(sender, instance, **kwargs):
+    # Where the comment was counted when loaded, so moving it to another
+    # student or day also recounts the bucket it left.
+    instance._category_bucket = category_stats.comment_bucket(instance)
+
+
+def refresh_comment_buckets(sender, instance, **kwargs):
+    bucket = category_stats.comment_bucket(instance)
+    category_stats.refresh_buckets({getattr(instance, '_category_bucket', bucket), bucket})
+    instance._category_bucket = bucket
+
+
+def refresh_category_buckets(sender, instance, action, reverse, pk_set, **kwargs):
+    if reverse and action == 'pre_clear':
+        # Changed from the Category side: post_clear gets no pk_set, so keep the comments now.
+        instance._cleared_comment_ids = list(category_stats.CommentCategory.objects.filter(
+            category_id=instance.pk).values_list('comment_id', flat=True))
+    if not action.startswith('post_'):
+        return
+    if not reverse:
+        category_stats.refresh_buckets([category_stats.comment_bucket(instance)])
+    else:
+        comment_ids = pk_set if pk_set is not None else getattr(instance, '_cleared_comment_ids', ())
+        category_stats.refresh_buckets(
+            (student_id, timezone.localdate(date))
+            for student_id, date in Comment.all_objects.filter(pk__in=comment_ids).values_list('student_id', 'date'))
+
+
+def refresh_written_rows(rows):
+    """
+    Refresh what the handlers above keep in step with the database for rows
+    written with set-based update() calls, which send no signals: a
+    cascading soft delete or restore. ``rows`` maps each model to the pks
+    written, as SoftDeletionQuerySet.cascade_pks() returns them. Costs a
+    fixed number of queries per model.
+    """
+    user_ids, student_ids, roster_student_ids, course_ids, roster_keys = set(), set(), set(), set(), set()
+    moved_student_ids, days, buckets = set(), [], set()
+    for model, pks in rows.items():
+        if not pks:
+            continue
+        written = model.all_objects.filter(pk__in=pks)
+        if issubclass(model, CustomUser):
+            user_ids.update(pks)
+        elif model is Subject:
+            user_ids.update(Professor.subjects.through.objects.filter(subject_id__in=pks).values_list(
+                'professor_id', flat=True))
+        elif model is Course:
+            for pk in pks:
+                forget_course(pk)
+            roster_keys.update(written.values_list('year', 'division', 'shift'))
+
+        if model in search.MODELS:
+            documents = list(written)
+            search.remove([search.document_id(search.MODELS[model], document.pk)
+                           for document in documents if document.deleted_at is not None])
+            search.index([(search.document_id(search.MODELS[model], document.pk), search.document_text(document))
+                          for document in documents if document.deleted_at is None])
+
+        if model is Student:
+            student_ids.update(pks)
+            roster_student_ids.update(pks)
+        elif model in (Grades, Presence, Comment, CourseHistory, Phone):
+            written_student_ids = set(written.values_list('student_id', flat=True))
+            if model is Phone:
+                roster_student_ids.update(written_student_ids)
+            else:
+                student_ids.update(written_student_ids)
+        if model is CourseHistory:
+            course_ids.update(written.values_list('id_course_id', flat=True))
+            moved_student_ids.update(written.values_list('student_id', flat=True))
+        elif model is Presence:
+            days.extend((student_id, date, None if deleted_at is not None else presence)
+                        for student_id, date, presence, deleted_at in written.values_list(
+                            'student_id', 'date', 'presence', 'deleted_at'))
+        elif model is Comment:
+            buckets.update((student_id, timezone.localdate(date))
+                           for student_id, date in written.values_list('student_id', 'date'))
+
+    for user_id in user_ids:
+        invalidate_role(user_id)
+    if roster_student_ids:
+        # Deleted registrations too: soft-deleting a student cascades to them.
+        course_ids.update(CourseHistory.all_objects.filter(student_id__in=roster_student_ids).values_list(
+            'id_course_id', flat=True))
+    invalidate_rosters(course_ids=course_ids, keys=roster_keys)
+    if student_ids:
+        refresh_summaries(student_ids)
+    if days:
+        set_days(days)
+    category_stats.refresh_buckets(buckets)
+    if moved_student_ids:
+        category_stats.move_students(moved_student_ids)
+
+
+def move_student_category_counts(sender, instance, **kwargs):
+    category_stats.move_students([instance.student_id])
+
+
+post_init.connect(remember_comment_bucket, sender=Comment, dispatch_uid='category_counts_init')
+post_save.connect(refresh_comment_buckets, sender=Comment, dispatch_uid='category_counts')
+post_delete.connect(refresh_comment_buckets, sender=Comment, dispatch_uid='category_counts_delete')
+m2m_changed.connect(refresh_category_buckets, sender=Comment.categories.through,
+                    dispatch_uid='category_counts_categories')
+post_save.connect(move_student_category_counts, sender=CourseHistory, dispatch_uid='category_counts_course')
+post_delete.connect(move_student_category_counts, sender=CourseHistory, dispatch_uid='category_counts_course_delete')
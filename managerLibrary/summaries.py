@@ -0,0 +1,107 @@
+import json
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from django.db import connections, transaction
+from django.db.models import Case, Count, IntegerField, Sum, When
+
+from .caching import bump
+from .models import Comment, Grades, Presence, Student, StudentAcademicSummary
+from .timeline import current_enrolments
+
+
+DEFAULT_CHUNK_SIZE = 500
+
+
+def build_summaries(student_ids):
+    """
+    Compute unsaved StudentAcademicSummary rows for ``student_ids``. The
+    course is the one each student is in today, by the course timeline.
+
+    Costs four grouped queries however many students are passed in.
+    """
+    student_ids = list(student_ids)
+
+    courses = dict(current_enrolments().filter(student_id__in=student_ids).values_list('student_id', 'id_course_id'))
+
+    subject_totals = defaultdict(dict)
+    grades = Grades.objects.filter(Grades.GRADED, student_id__in=student_ids).exclude(subject=None).values(
+        'student_id', 'subject_id').annotate(count=Count('id'), total=Sum('grade')).order_by()
+    for row in grades:
+        subject_totals[row['student_id']][row['subject_id']] = (row['count'], row['total'])
+
+    attendance = {
+        row['student_id']: row['present'] / row['recorded']
+        for row in Presence.objects.filter(student_id__in=student_ids).exclude(presence=None).values(
+            'student_id').annotate(
+            recorded=Count('id'),
+            present=Sum(Case(When(presence=True, then=1), default=0, output_field=IntegerField())),
+        ).order_by()
+    }
+
+    comments = dict(
+        Comment.objects.filter(student_id__in=student_ids).values('student_id').annotate(
+            count=Count('id')).order_by().values_list('student_id', 'count'))
+
+    summaries = []
+    for student_id in student_ids:
+        totals = subject_totals.get(student_id, {})
+        count = sum(count for count, _ in totals.values())
+        summaries.append(StudentAcademicSummary(
+            student_id=student_id,
+            course_id=courses.get(student_id),
+            grade_average=sum(total for _, total in totals.values()) / count if count else None,
+            subject_averages=json.dumps({subject: total / n for subject, (n, total) in totals.items()}),
+            attendance_rate=attendance.get(student_id),
+            comment_count=comments.get(student_id, 0),
+        ))
+    return summaries
+
+
+def _write(student_ids, summaries):
+    with transaction.atomic():
+        StudentAcademicSummary.objects.filter(student_id__in=student_ids).delete()
+        StudentAcademicSummary.objects.bulk_create(summaries)
+    bump(StudentAcademicSummary)
+
+
+def refresh_summaries(student_ids):
+    """
+    Recompute the summaries of a few students, e.g. from a signal handler.
+    Soft-deleted students lose their summary.
+    """
+    student_ids = set(student_ids) - {None}
+    alive = Student.objects.filter(id__in=student_ids).values_list('id', flat=True)
+    _write(student_ids, build_summaries(alive))
+
+
+def _build_chunk(student_ids):
+    try:
+        return build_summaries(student_ids)
+    finally:
+        # Worker threads open their own connections; don't leak them.
+        connections.close_all()
+
+
+def rebuild_summaries(chunk_size=DEFAULT_CHUNK_SIZE, workers=4):
+    """
+    Rebuild every summary. Chunks are computed in parallel worker threads
+    and written from the calling thread, so SQLite never sees two writers.
+    With one worker everything runs in the calling thread.
+    Returns the number of summaries written.
+    """
+    student_ids = list(Student.objects.order_by('id').values_list('id', flat=True))
+    chunks = [student_ids[i:i + chunk_size] for i in range(0, len(student_ids), chunk_size)]
+    with transaction.atomic():
+        StudentAcademicSummary.objects.exclude(student_id__in=Student.objects.values('id')).delete()
+    executor = ThreadPoolExecutor(max_workers=workers) if workers > 1 else None
+    results = executor.map(_build_chunk, chunks) if executor else map(build_summaries, chunks)
+    written = 0
+    try:
+        for chunk, summaries in zip(chunks, results):
+            _write(chunk, summaries)
+            written += len(summaries)
+    finally:
+        if executor:
+            executor.shutdown()
+    return written
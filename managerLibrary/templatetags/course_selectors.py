@@ -0,0 +1,35 @@
+from django import template
+
+from ..models import Course
+
+
+register = template.Library()
+
+# (field, label, ((value, button text, title), ...)) for each selector. The
+# choices are constants of the model, so they are worked out once, here.
+SELECTORS = (
+    ('year', 'Año', tuple((value, str(number), title) for number, (value, title) in enumerate(
+        Course.YEAR_IN_SCHOOL_CHOICES, 1))),
+    ('division', 'Curso', tuple((value, value, title) for value, title in Course.DIVISION_IN_SCHOOL_CHOICES)),
+    ('shift', 'Turno', tuple((value, title.split()[-1].capitalize(), title)
+                             for value, title in Course.SHIFT_IN_SCHOOL_CHOICES)),
+)
+
+
+@register.inclusion_tag('course_selector.html')
+def course_selector(course=None, fields='year division', select=False):
+    """
+    The year, division and shift button groups, one column each, with the
+    values of ``course`` (a Course, a Roster, anything with those fields)
+    highlighted. ``fields`` picks which selectors to show. Inside a form,
+    ``select`` renders them as <select> fields instead, which the form
+    submits.
+
+        {% course_selector Course "year division shift" %}
+        {% course_selector Course select=True %}
+    """
+    fields = fields.split()
+    return {'Select': select, 'Selectors': [
+        (field, label, choices, getattr(course, field, None))
+        for field, label, choices in SELECTORS if field in fields
+    ]}
@@ -0,0 +1,43 @@
+from django import template
+from django.apps import apps
+from django.utils.safestring import mark_safe
+
+from .. import caching
+
+
+register = template.Library()
+
+
+class CachedFragmentNode(template.Node):
+    def __init__(self, nodelist, name, models, vary_on):
+        self.nodelist = nodelist
+        self.name = name
+        self.models = models
+        self.vary_on = vary_on
+
+    def render(self, context):
+        models = [apps.get_model(label) for label in self.models.resolve(context).split()]
+        key = caching.make_key('fragment', self.name, [value.resolve(context) for value in self.vary_on])
+        return mark_safe(caching.cached(key, lambda: self.nodelist.render(context), models))
+
+
+@register.tag
+def cachedfragment(parser, token):
+    """
+    Cache a piece of template until one of the given models is written to.
+
+        {% cachedfragment "summaries" "managerLibrary.StudentAcademicSummary managerLibrary.Student" Course %}
+            ...
+        {% endcachedfragment %}
+
+    The first argument names the fragment, the second lists the models it
+    is built from and the rest are values it varies on. Querysets used only
+    inside the fragment are never evaluated while it stays cached.
+    """
+    bits = token.split_contents()
+    if len(bits) < 3:
+        raise template.TemplateSyntaxError("'%s' takes a name and a list of models" % bits[0])
+    nodelist = parser.parse(('endcachedfragment',))
+    parser.delete_first_token()
+    return CachedFragmentNode(nodelist, bits[1], parser.compile_filter(bits[2]),
+                              [parser.compile_filter(bit) for bit in bits[3:]])
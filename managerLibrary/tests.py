@@ -1,5 +1,77 @@
-from django.test import TestCase
+import asyncio
+import gzip
+import json
+import os
+import tempfile
+import threading
+import time
+import zipfile
+from concurrent.futures import BrokenExecutor, ThreadPoolExecutor
+from datetime import date, timedelta
+from importlib import import_module
+from io import BytesIO, StringIO
+from unittest import mock
+from xml.etree import ElementTree
+
+from django.conf import settings
+from django.test import RequestFactory, TestCase, TransactionTestCase
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.core.signals import request_finished
+from django.db import IntegrityError, connection, connections, router, transaction
+from django.db.migrations.executor import MigrationExecutor
+from django.forms import modelform_factory
+from django.template import Context, Template, loader
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from .admin import ESTIMATED_COUNT_THRESHOLD
+from .analytics import db_grade_averages, grade_report
+from .attendance import record_roll_call
+from .benchmarks import compare, rolled_back, run as run_benchmarks
+from .cache_backend import SQLiteCache
+from .caching import LOCK_KEY, _PendingBumps, cached, generations
+from .category_stats import backfill, category_stats
+from .concurrency import gather
+from .databases import ReplicaRouter, has_written, is_pinned, unpin
+from .attendance_bitmaps import (
+    EMPTY_BITMAP, _pack, _unpack, attendance_counts, course_attendance, longest_absence_streaks, rebuild_bitmaps,
+    set_days,
+)
+from .feeds import comment_feed, ORDER_BY_DATE, ORDER_BY_NAME
+from .imports import import_students
+from .jobs import JOBS, claim, enqueue, heartbeat, requeue_stale, run as run_job, work
+from .models import (
+    AttendanceBitmap, Category, CategoryDailyCount, Comment, Course, CourseHistory, Grades, Job, Phone, Preceptor,
+    Presence, Principal, Professor, Student, StudentAcademicSummary, Subject,
+)
+from .roles import PROFESSOR, resolve_role
+from .rosters import get_course_roster, get_roster, warm_rosters
+from .search import STUDENT, rebuild as rebuild_search_index, search
+from .seeding import seed
+from .summaries import rebuild_summaries
+from .timeline import backfill as backfill_timeline, course_path, cycle_roster, move_student, roster_at
+from asgiref.wsgi import WsgiToAsgi
+from mylibrary.asgi import application as asgi_application, close_after_response
+from .views import asistencia, exportar, historialnotas, perfil, progreso_academico, ver_asistencia
+
+
+def commit_bumps():
+    """Run the cache generation bumps waiting for a commit, which a TestCase never reaches."""
+    pending = [entry for entry in connection.run_on_commit if isinstance(entry[1], _PendingBumps)]
+    connection.run_on_commit = [entry for entry in connection.run_on_commit if entry not in pending]
+    for _, callback in pending:
+        callback()
+
+
+def staff_request(path, data=None):
+    """A GET request from a preceptor whose role is already cached, as after their first request."""
+    user, _ = Preceptor.objects.get_or_create(email='staff@school.com')
+    resolve_role(user.pk)
+    request = RequestFactory().get(path, data)
+    request.user = user
+    return request
 
 
 class UsersManagersTests(TestCase):
@@ -24,6 +96,21 @@ class UsersManagersTests(TestCase):
         with self.assertRaises(ValueError):
             User.objects.create_user(email='', password="foo")
 
+    def test_bulk_create_users(self):
+        users = Professor.objects.bulk_create_users([
+            {'email': 'Ana@School.COM', 'password': 'foo', 'first_name': 'Ana', 'last_name': 'Ruiz'},
+            {'email': 'luis@school.com', 'password': 'bar', 'first_name': 'Luis', 'last_name': 'Paz'},
+        ], batch_size=1, workers=2)
+        self.assertEqual([user.email for user in users], ['Ana@school.com', 'luis@school.com'])
+        professor = Professor.objects.get(email='Ana@school.com')
+        self.assertEqual((professor.pk, professor.last_name), (users[0].pk, 'Ruiz'))
+        self.assertTrue(professor.check_password('foo'))
+        self.assertTrue(get_user_model().objects.get(pk=users[1].pk).check_password('bar'))
+        cache.clear()
+        self.assertEqual(resolve_role(users[1].pk).name, PROFESSOR)
+        with self.assertRaises(ValueError):
+            get_user_model().objects.bulk_create_users([{'email': 'a@b.com'}, {'email': 'a@b.com'}], workers=1)
+
     def test_create_superuser(self):
         User = get_user_model()
         admin_user = User.objects.create_superuser('super@user.com', 'foo')
@@ -39,4 +126,1471 @@ class UsersManagersTests(TestCase):
             pass
         with self.assertRaises(ValueError):
             User.objects.create_superuser(
-                email='super@user.com', password='foo', is_superuser=False)
\ No newline at end of file
+                email='super@user.com', password='foo', is_superuser=False)
+
+
+class CommentFeedTests(TestCase):
+
+    def setUp(self):
+        author = get_user_model().objects.create_user(email='preceptor@school.com', password='foo')
+        category = Category.objects.create(name='Conducta', description='')
+        now = timezone.now()
+        for i in range(12):
+            student = Student.objects.create(
+                first_name='Alumno', last_name='Apellido%02d' % (11 - i), birthday=now)
+            comment = Comment.objects.create(
+                student=student, author=author, description='Nota %d' % i,
+                date=now - timedelta(days=i // 2))
+            comment.categories.add(category)
+
+    def test_page_query_count_is_constant(self):
+        with self.assertNumQueries(2):
+            page = comment_feed(page_size=5)
+            for comment in page.object_list:
+                str(comment.student), str(comment.author), list(comment.categories.all())
+        with self.assertNumQueries(2):
+            page = comment_feed(page_size=5, cursor=page.next_cursor)
+            for comment in page.object_list:
+                str(comment.student), str(comment.author), list(comment.categories.all())
+
+    def test_keyset_walk_matches_full_ordering(self):
+        expected = {
+            ORDER_BY_DATE: list(Comment.objects.order_by('-date', '-id').values_list('id', flat=True)),
+            ORDER_BY_NAME: list(Comment.objects.order_by(
+                'student__last_name', 'student__first_name', 'id').values_list('id', flat=True)),
+        }
+        for order, ids in expected.items():
+            seen, cursor = [], None
+            while True:
+                page = comment_feed(order=order, cursor=cursor, page_size=5)
+                seen.extend(comment.id for comment in page.object_list)
+                cursor = page.next_cursor
+                if not page.has_next:
+                    break
+            self.assertEqual(seen, ids)
+
+    def test_view_rejects_invalid_cursor(self):
+        response = historialnotas(staff_request('/', {'cursor': 'not-a-cursor'}))
+        self.assertEqual(response.status_code, 400)
+        response = historialnotas(staff_request('/', {'orden': 'alfabetico'}))
+        self.assertEqual(response.status_code, 200)
+
+
+class SoftDeletionIndexTests(TestCase):
+
+    def test_hot_queries_use_an_index(self):
+        out = StringIO()
+        call_command('explain_hot_queries', stdout=out)
+        self.assertNotIn('SCAN', out.getvalue())
+
+
+class SoftDeletionCascadeTests(TestCase):
+
+    def setUp(self):
+        self.author = get_user_model().objects.create_user(email='preceptor@school.com', password='foo')
+        self.students = [
+            Student.objects.create(first_name='Alumno', last_name=str(i), birthday=timezone.now())
+            for i in range(3)]
+        for student in self.students:
+            Comment.objects.create(student=student, author=self.author, description='Nota')
+            Phone.objects.create(student=student, number='123')
+            Grades.objects.create(student=student, grade='7')
+
+    def test_soft_delete_cascades_in_one_update_per_table(self):
+        graduating = Student.objects.filter(pk__in=[s.pk for s in self.students[:2]])
+        # One SELECT for the keys, one UPDATE per table and the savepoint pair.
+        with self.assertNumQueries(9):
+            counts = graduating.soft_delete(batch_size=10)
+        self.assertEqual(counts['managerLibrary.Student'], 2)
+        self.assertEqual(counts['managerLibrary.Comment'], 2)
+        self.assertEqual(counts['managerLibrary.Grades'], 2)
+        self.assertEqual(Student.objects.count(), 1)
+        self.assertEqual(Comment.objects.count(), 1)
+        self.assertEqual(Phone.objects.count(), 1)
+        self.assertEqual(Grades.objects.count(), 1)
+
+    def test_dry_run_does_not_write(self):
+        counts = Student.objects.all().soft_delete(dry_run=True)
+        self.assertEqual(counts['managerLibrary.Phone'], 3)
+        self.assertEqual(Phone.objects.count(), 3)
+
+    def test_restore_keeps_rows_deleted_on_their_own(self):
+        student = self.students[0]
+        Comment.objects.create(student=student, author=self.author, description='Borrada').delete()
+        Student.objects.filter(pk=student.pk).soft_delete()
+        counts = Student.all_objects.filter(pk=student.pk).restore()
+        self.assertEqual(counts['managerLibrary.Comment'], 1)
+        self.assertEqual(Comment.objects.filter(student=student).count(), 1)
+        self.assertEqual(Comment.all_objects.filter(student=student).count(), 2)
+
+    def test_purge_hard_deletes_old_rows_and_dependents(self):
+        Student.objects.filter(pk=self.students[0].pk).soft_delete()
+        Student.all_objects.exclude(deleted_at=None).update(deleted_at=timezone.now() - timedelta(days=100))
+        Student.objects.filter(pk=self.students[1].pk).soft_delete()
+        counts = Student.all_objects.purge(90)
+        self.assertEqual(counts['managerLibrary.Student'], 1)
+        self.assertFalse(Student.all_objects.filter(pk=self.students[0].pk).exists())
+        self.assertEqual(Comment.all_objects.count(), 2)
+        self.assertEqual(Grades.all_objects.count(), 2)
+
+
+class GradeAnalyticsTests(TestCase):
+
+    def setUp(self):
+        self.course = Course.objects.create()
+        self.subject = Subject.objects.create(name='Matemática')
+        self.students = []
+        for i, grades in enumerate((['4', '8', '9'], ['6', '10'])):
+            student = Student.objects.create(first_name='Alumno', last_name=str(i), birthday=timezone.now())
+            CourseHistory.objects.create(student=student, id_course=self.course)
+            for grade in grades:
+                Grades.objects.create(student=student, subject=self.subject, grade=grade)
+            self.students.append(student)
+        Grades.objects.create(student=self.students[0], subject=self.subject)
+
+    def test_numpy_report(self):
+        report = grade_report()
+        students = report['student']
+        self.assertEqual(list(students.keys), [s.pk for s in self.students])
+        self.assertEqual(list(students.count), [3, 2])
+        self.assertEqual(list(students.mean), [7.0, 8.0])
+        self.assertEqual(list(students.median), [8.0, 8.0])
+        self.assertAlmostEqual(students.failure_rate[0], 1 / 3.0)
+        self.assertEqual(list(report['course'].keys), [self.course.pk])
+        self.assertEqual(report['course'].percentiles[25][0], 6.0)
+        self.assertEqual(len(report['professor'].keys), 0)
+
+    def test_db_path_matches_numpy_report(self):
+        report = grade_report()
+        for dimension in ('student', 'subject', 'course'):
+            stats = report[dimension]
+            db = db_grade_averages(dimension)
+            self.assertEqual(sorted(db), list(stats.keys))
+            for i, key in enumerate(stats.keys):
+                count, mean, failure_rate = db[key]
+                self.assertEqual(count, stats.count[i])
+                self.assertAlmostEqual(mean, stats.mean[i])
+                self.assertAlmostEqual(failure_rate, stats.failure_rate[i])
+
+    def test_course_is_the_current_enrolment(self):
+        first, second = self.students
+        other, dropped = Course.objects.create(division='B'), Course.objects.create(division='C')
+        move_student(first.pk, other.pk)
+        CourseHistory.objects.create(student=second, id_course=dropped).delete()
+        # Filled in later, so the newest row is an old one.
+        CourseHistory.objects.create(student=first, id_course=dropped, cycle=2022, valid_from=date(2022, 3, 1),
+                                     valid_to=date(2023, 3, 1))
+        report = grade_report()['course']
+        self.assertEqual(list(report.keys), sorted([self.course.pk, other.pk]))
+        self.assertEqual(db_grade_averages('course'), {
+            key: (count, mean, failure_rate)
+            for key, count, mean, failure_rate in zip(report.keys, report.count, report.mean, report.failure_rate)})
+        self.assertEqual(db_grade_averages('course')[other.pk][0], 3)
+
+
+class StudentAcademicSummaryTests(TestCase):
+
+    def setUp(self):
+        self.author = get_user_model().objects.create_user(email='preceptor@school.com', password='foo')
+        self.course = Course.objects.create()
+        self.math = Subject.objects.create(name='Matemática')
+        self.student = Student.objects.create(first_name='Ana', last_name='Perez', birthday=timezone.now())
+
+    def summary(self):
+        return StudentAcademicSummary.objects.get(student=self.student)
+
+    def test_signals_keep_summary_current(self):
+        CourseHistory.objects.create(student=self.student, id_course=self.course)
+        Grades.objects.create(student=self.student, subject=self.math, grade='6')
+        grade = Grades.objects.create(student=self.student, subject=self.math, grade='9')
+        Comment.objects.create(student=self.student, author=self.author, description='Nota')
+        Presence.objects.create(student=self.student, presence=True)
+        summary = self.summary()
+        self.assertEqual(summary.course, self.course)
+        self.assertEqual(summary.grade_average, 7.5)
+        self.assertEqual(summary.subject_average_map(), {self.math.pk: 7.5})
+        self.assertEqual(summary.attendance_rate, 1.0)
+        self.assertEqual(summary.comment_count, 1)
+
+        grade.delete()
+        self.assertEqual(self.summary().grade_average, 6.0)
+
+        # A grade moved to another student leaves the first one's summary too.
+        other = Student.objects.create(first_name='Luis', last_name='Diaz', birthday=timezone.now())
+        moved = Grades.objects.get(student=self.student)
+        moved.student = other
+        moved.save()
+        self.assertIsNone(self.summary().grade_average)
+        self.assertEqual(StudentAcademicSummary.objects.get(student=other).grade_average, 6.0)
+        self.student.delete()
+        self.assertFalse(StudentAcademicSummary.objects.filter(student=self.student).exists())
+
+    def test_course_is_the_current_enrolment(self):
+        CourseHistory.objects.create(student=self.student, id_course=self.course)
+        other = Course.objects.create(division='B')
+        move_student(self.student.pk, other.pk)
+        # Filled in later, so the newest row is an old one.
+        CourseHistory.objects.create(student=self.student, id_course=self.course, cycle=2022,
+                                     valid_from=date(2022, 3, 1), valid_to=date(2023, 3, 1))
+        self.assertEqual(self.summary().course, other)
+
+    def test_rebuild_and_single_query_read(self):
+        CourseHistory.objects.create(student=self.student, id_course=self.course)
+        StudentAcademicSummary.objects.all().delete()
+        self.assertEqual(rebuild_summaries(chunk_size=1, workers=1), 1)
+        self.assertEqual(self.summary().course, self.course)
+        request = staff_request('/progreso/', {'curso': self.course.pk})
+        with self.assertNumQueries(1):
+            response = progreso_academico(request)
+        self.assertContains(response, 'Ana Perez')
+
+
+class RollCallTests(TestCase):
+
+    def setUp(self):
+        self.preceptor = Preceptor.objects.create(email='preceptor@school.com', first_name='Marta', last_name='Diaz')
+
+    def post(self, course, data):
+        request = RequestFactory().post('/asistencia/%d/' % course.pk, data)
+        request.user = self.preceptor
+        return asistencia(request, course.pk)
+
+    def enroll(self, course, count):
+        students = []
+        for i in range(count):
+            student = Student.objects.create(first_name='Alumno', last_name=str(i), birthday=timezone.now())
+            CourseHistory.objects.create(student=student, id_course=course)
+            students.append(student)
+        return students
+
+    def test_query_count_does_not_depend_on_course_size(self):
+        small, large = Course.objects.create(division='A'), Course.objects.create(division='B')
+        few = self.enroll(small, 2)
+        students = self.enroll(large, 30)
+        with CaptureQueriesContext(connection) as small_queries:
+            record_roll_call(small.pk, [few[0].pk])
+        with CaptureQueriesContext(connection) as large_queries:
+            record_roll_call(large.pk, [s.pk for s in students[:10]])
+        self.assertEqual(len(small_queries), len(large_queries))
+        self.assertEqual(Presence.objects.filter(presence=True).count(), 11)
+        self.assertEqual(Presence.objects.filter(presence=False).count(), 21)
+
+    def test_resubmission_overwrites_the_day(self):
+        course = Course.objects.create()
+        student, = self.enroll(course, 1)
+        record_roll_call(course.pk, [student.pk])
+        Presence.objects.get(student=student).delete()
+        response = self.post(course, {'presentes': []})
+        self.assertEqual(response.status_code, 200)
+        presence = Presence.objects.get(student=student)
+        self.assertFalse(presence.presence)
+        self.assertEqual(presence.preceptor_id, self.preceptor.pk)
+        self.assertEqual(presence.date, timezone.localdate())
+        self.assertEqual(StudentAcademicSummary.objects.get(student=student).attendance_rate, 0.0)
+
+    def test_moved_students_keep_their_new_course_roll_call(self):
+        first, second = Course.objects.create(division='A'), Course.objects.create(division='B')
+        student, = self.enroll(first, 1)
+        move_student(student.pk, second.pk)
+        record_roll_call(second.pk, [student.pk])
+        self.assertEqual(record_roll_call(first.pk, []), 0)
+        self.assertTrue(Presence.objects.get(student=student).presence)
+
+    def test_only_school_staff_record_roll_calls(self):
+        course = Course.objects.create()
+        student, = self.enroll(course, 1)
+        request = RequestFactory().post('/asistencia/%d/' % course.pk, {'presentes': [student.pk]})
+        request.user = get_user_model().objects.create_user(email='alumno@school.com', password='foo')
+        self.assertEqual(asistencia(request, course.pk).status_code, 403)
+        self.assertFalse(Presence.objects.exists())
+
+    def test_impossible_date_is_a_bad_request(self):
+        course = Course.objects.create()
+        self.assertEqual(self.post(course, {'fecha': '2023-02-30'}).status_code, 400)
+        self.assertFalse(Presence.objects.exists())
+
+
+class AttendanceBitmapTests(TestCase):
+
+    def setUp(self):
+        self.course = Course.objects.create()
+        self.students = []
+        for i in range(2):
+            student = Student.objects.create(first_name='Alumno', last_name=str(i), birthday=timezone.now())
+            CourseHistory.objects.create(student=student, id_course=self.course, cycle=2023,
+                                         valid_from=date(2023, 3, 1))
+            self.students.append(student)
+        first, second = self.students
+        # Friday to Tuesday across a weekend; the second student misses three school days in a row.
+        self.days = [date(2023, 3, 3), date(2023, 3, 6), date(2023, 3, 7)]
+        record_roll_call(self.course.pk, [first.pk], date=date(2023, 3, 2))
+        for day in self.days:
+            record_roll_call(self.course.pk, [first.pk], date=day)
+
+    def test_range_counts_and_streaks(self):
+        with self.assertNumQueries(1):
+            attendance = course_attendance(self.course.pk, date(2023, 3, 1), date(2023, 3, 31))
+        self.assertEqual(list(attendance.student_ids), [s.pk for s in self.students])
+        present, absent = attendance_counts(attendance)
+        self.assertEqual(list(present), [4, 0])
+        self.assertEqual(list(absent), [0, 4])
+        self.assertEqual(list(longest_absence_streaks(attendance)), [0, 4])
+        request = staff_request('/', {'desde': '2023-03-01', 'hasta': '2023-03-31'})
+        self.assertContains(ver_asistencia(request, self.course.pk), 'width: 100%')
+
+    def test_bitmaps_follow_presence_rows(self):
+        Presence.objects.get(student=self.students[1], date=self.days[1]).delete()
+        attendance = course_attendance(self.course.pk, date(2023, 3, 1), date(2023, 3, 31))
+        self.assertEqual(list(attendance_counts(attendance)[1]), [0, 3])
+        self.assertEqual(list(longest_absence_streaks(attendance)), [0, 2])
+
+        AttendanceBitmap.objects.all().delete()
+        self.assertEqual(rebuild_bitmaps(), 2)
+        rebuilt = course_attendance(self.course.pk, date(2023, 3, 1), date(2023, 3, 31))
+        self.assertTrue((rebuilt.absent == attendance.absent).all())
+
+    def test_students_count_only_while_in_the_course(self):
+        other = Course.objects.create(division='B')
+        move_student(self.students[1].pk, other.pk, date(2023, 3, 6))
+        attendance = course_attendance(self.course.pk, date(2023, 3, 1), date(2023, 3, 31))
+        self.assertEqual(list(attendance.student_ids), [s.pk for s in self.students])
+        self.assertEqual(list(attendance_counts(attendance)[1]), [0, 2])
+        attendance = course_attendance(other.pk, date(2023, 3, 1), date(2023, 3, 31))
+        self.assertEqual(list(attendance.student_ids), [self.students[1].pk])
+        self.assertEqual(list(attendance_counts(attendance)[1]), [2])
+        self.assertEqual(len(course_attendance(other.pk, date(2023, 3, 1), date(2023, 3, 5)).student_ids), 0)
+
+    def test_summary_rejects_impossible_and_long_ranges(self):
+        for params in ({'desde': '2023-02-30'}, {'desde': '2000-01-01', 'hasta': '2023-03-31'}):
+            request = staff_request('/', params)
+            self.assertEqual(ver_asistencia(request, self.course.pk).status_code, 400)
+
+    def test_first_roll_call_of_the_year_racing_another(self):
+        student = self.students[0]
+        other_day = date(2024, 3, 4)
+        present = _unpack([EMPTY_BITMAP])[0]
+        present[other_day.timetuple().tm_yday - 1] = True
+        insert = AttendanceBitmap.objects.bulk_create
+
+        def concurrent_insert(objs, **kwargs):
+            # Another roll call creates the student's 2024 bitmap first.
+            AttendanceBitmap.objects.create(student=student, year=2024, present=_pack(present), absent=EMPTY_BITMAP)
+            return insert(objs, **kwargs)
+
+        with mock.patch.object(AttendanceBitmap.objects, 'bulk_create', concurrent_insert):
+            set_days([(student.pk, date(2024, 3, 5), True)])
+        attendance = course_attendance(self.course.pk, other_day, date(2024, 3, 5))
+        self.assertEqual(list(attendance_counts(attendance)[0]), [2])
+
+
+class RoleResolutionTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.professor = Professor.objects.create(
+            email='profe@school.com', first_name='Laura', last_name='Gomez')
+        self.math = Subject.objects.create(name='Matemática')
+        self.professor.subjects.add(self.math)
+
+    def test_one_query_on_miss_and_none_on_hit(self):
+        with self.assertNumQueries(1):
+            role = resolve_role(self.professor.pk)
+        self.assertEqual(role.name, PROFESSOR)
+        self.assertEqual(role.subjects, ((self.math.pk, 'Matemática'),))
+        with self.assertNumQueries(0):
+            self.assertEqual(resolve_role(self.professor.pk), role)
+
+    def test_cache_is_invalidated(self):
+        resolve_role(self.professor.pk)
+        history = Subject.objects.create(name='Historia')
+        self.professor.subjects.add(history)
+        self.assertEqual(len(resolve_role(self.professor.pk).subjects), 2)
+        history.hard_delete()
+        self.assertEqual(resolve_role(self.professor.pk).subjects, ((self.math.pk, 'Matemática'),))
+        self.professor.delete()
+        self.assertIsNone(resolve_role(self.professor.pk).name)
+
+    def test_profile_page_reads_the_role(self):
+        request = RequestFactory().get('/perfil/')
+        request.user = self.professor
+        resolve_role(self.professor.pk)
+        with self.assertNumQueries(0):
+            response = perfil(request)
+        self.assertContains(response, 'Laura Gomez')
+        self.assertContains(response, 'Matemática')
+
+
+class SearchTests(TestCase):
+
+    def setUp(self):
+        author = get_user_model().objects.create_user(email='preceptor@school.com', password='foo')
+        self.student = Student.objects.create(first_name='José', last_name='Pérez', birthday=timezone.now())
+        self.comment = Comment.objects.create(
+            student=self.student, author=author, description='Llegó tarde a la clase de educación física')
+        self.category = Category.objects.create(name='Conducta', description='')
+
+    def test_prefix_search_ignores_case_and_accents(self):
+        self.assertEqual(search('jose PER'), [{'kind': 'student', 'id': self.student.pk, 'text': 'José Pérez'}])
+        self.assertEqual([r['id'] for r in search('educacion fis')], [self.comment.pk])
+        self.assertEqual([r['kind'] for r in search('cond')], ['category'])
+        self.assertEqual(search('cond', kinds=[STUDENT]), [])
+
+    def test_index_follows_updates_and_soft_deletes(self):
+        self.comment.description = 'Excelente participación'
+        self.comment.save()
+        self.assertEqual(search('tarde'), [])
+        self.assertEqual(len(search('particip')), 1)
+        self.comment.delete()
+        self.assertEqual(search('particip'), [])
+        self.assertEqual(rebuild_search_index(), 2)
+        self.assertEqual(search('particip'), [])
+        self.assertEqual(len(search('perez')), 1)
+
+
+class QueryBudgetTests(TestCase):
+    """Every budgeted view, through the full middleware stack, must stay within settings.QUERY_BUDGETS."""
+
+    def setUp(self):
+        cache.clear()
+        self.preceptor = Preceptor.objects.create(email='preceptor@school.com', first_name='Marta', last_name='Diaz')
+        self.course = Course.objects.create()
+        category = Category.objects.create(name='Conducta', description='')
+        math = Subject.objects.create(name='Matemática')
+        students = []
+        for i in range(10):
+            student = Student.objects.create(first_name='Alumno', last_name='Apellido%d' % i, birthday=timezone.now())
+            CourseHistory.objects.create(student=student, id_course=self.course)
+            Grades.objects.create(student=student, subject=math, grade='7')
+            comment = Comment.objects.create(student=student, author=self.preceptor, description='Participa en clase')
+            comment.categories.add(category)
+            students.append(student)
+        record_roll_call(self.course.pk, [s.pk for s in students[:5]])
+        self.present = [s.pk for s in students[5:]]
+        self.student = students[0]
+        warm_rosters()
+        self.client.force_login(self.preceptor)
+        resolve_role(self.preceptor.pk)
+
+    def requests(self):
+        course = self.course.pk
+        return [
+            ('comment_list', 'get', '/', {}),
+            ('profile', 'get', '/perfil/', {}),
+            ('student_profile', 'get', '/alumno/%d/' % self.student.pk, {}),
+            ('search', 'get', '/buscar/', {'q': 'particip'}),
+            ('academic_progress', 'get', '/progreso/', {'curso': course}),
+            ('assistance', 'get', '/asistencia/%d/' % course, {}),
+            ('POST assistance', 'post', '/asistencia/%d/' % course, {'presentes': self.present}),
+            ('see_assistance', 'get', '/asistencia/%d/resumen/' % course, {}),
+            ('api', 'get', '/api/comentarios/', {'fields': 'student,categories'}),
+        ]
+
+    def test_views_stay_within_their_query_budget(self):
+        for budget, method, url, data in self.requests():
+            with self.subTest(budget):
+                response = getattr(self.client, method)(url, data)
+                self.assertEqual(response.status_code, 200)
+                metrics = response.metrics
+                self.assertLessEqual(metrics.queries, settings.QUERY_BUDGETS[budget])
+                # The same statement three times or more is an N+1.
+                statement, count = metrics.most_repeated()
+                self.assertLess(count, 3, statement)
+                self.assertIn('db;dur=', response['Server-Timing'])
+
+    def test_school_data_needs_a_school_role(self):
+        self.client.logout()
+        for budget, method, url, data in self.requests():
+            if budget != 'profile':
+                with self.subTest(budget):
+                    self.assertEqual(getattr(self.client, method)(url, data).status_code, 403)
+
+    def test_timings_report(self):
+        self.client.get('/')
+        out = StringIO()
+        call_command('request_timings', stdout=out)
+        self.assertIn('comment_list', out.getvalue())
+
+
+class ExportTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.principal = Principal.objects.create(email='director@school.com', first_name='Ana', last_name='Ruiz')
+        math = Subject.objects.create(name='Matemática')
+        for division, name in (('A', 'Pérez'), ('B', 'Gómez')):
+            course = Course.objects.create(division=division)
+            student = Student.objects.create(first_name='Juan', last_name=name, birthday=timezone.now())
+            CourseHistory.objects.create(student=student, id_course=course, cycle=2023, valid_from=date(2023, 1, 1))
+            Grades.objects.create(student=student, subject=math, grade='8')
+            Presence.objects.create(student=student, date=date(2023, 3, 1), presence=True)
+            Presence.objects.create(student=student, date=date(2023, 4, 1), presence=False)
+        self.client.force_login(self.principal)
+
+    def test_csv_filters_by_course_and_date(self):
+        response = self.client.get('/exportar/notas/', {'division': 'A'})
+        content = b''.join(response.streaming_content).decode('utf-8-sig')
+        self.assertEqual(content.splitlines(), [
+            'Año,División,Turno,Apellido,Nombre,Materia,Nota',
+            'Primer Año,A,Turno mañana,Pérez,Juan,Matemática,8',
+        ])
+        response = self.client.get('/exportar/asistencia/', {'desde': '2023-03-15'})
+        rows = b''.join(response.streaming_content).decode('utf-8-sig').splitlines()[1:]
+        self.assertEqual([row.rsplit(',', 2)[1:] for row in rows], [['2023-04-01', 'Ausente']] * 2)
+
+    def test_rows_go_under_the_course_of_their_day_once(self):
+        second = Course.objects.create(year=Course.SECOND_YEAR, division='A')
+        student = Student.objects.get(last_name='Pérez')
+        move_student(student.pk, second.pk, date(2023, 3, 15))
+        Comment.objects.create(student=student, author=self.principal, description='=HYPERLINK("http://x")',
+                               date=timezone.make_aware(timezone.datetime(2023, 3, 2, 10)))
+        response = self.client.get('/exportar/asistencia/', {'division': 'A'})
+        rows = b''.join(response.streaming_content).decode('utf-8-sig').splitlines()[1:]
+        self.assertEqual(rows, [
+            'Primer Año,A,Turno mañana,Pérez,Juan,2023-03-01,Presente',
+            'Segundo Año,A,Turno mañana,Pérez,Juan,2023-04-01,Ausente',
+        ])
+        response = self.client.get('/exportar/notas/', {'division': 'A'})
+        rows = b''.join(response.streaming_content).decode('utf-8-sig').splitlines()[1:]
+        self.assertEqual(rows, ['Segundo Año,A,Turno mañana,Pérez,Juan,Matemática,8'])
+        response = self.client.get('/exportar/comentarios/')
+        row, = b''.join(response.streaming_content).decode('utf-8-sig').splitlines()[1:]
+        self.assertTrue(row.startswith('Primer Año,A,'))
+        self.assertTrue(row.endswith(',"\'=HYPERLINK(""http://x"")"'))
+
+    def test_xlsx_is_a_valid_workbook(self):
+        response = self.client.get('/exportar/asistencia/', {'formato': 'xlsx', 'division': 'B'})
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="asistencia.xlsx"')
+        with zipfile.ZipFile(BytesIO(b''.join(response.streaming_content))) as workbook:
+            self.assertIn('xl/workbook.xml', workbook.namelist())
+            sheet = ElementTree.fromstring(workbook.read('xl/worksheets/sheet1.xml'))
+        namespace = '{http://schemas.openxmlformats.org/spreadsheetml/2006/main}'
+        rows = sheet.findall('.//%srow' % namespace)
+        self.assertEqual(len(rows), 3)
+        self.assertEqual(rows[1].findtext('.//%st' % namespace), 'Primer Año')
+        # 2023-03-01 as an Excel date serial.
+        self.assertEqual(rows[1].findall('%sc' % namespace)[5].findtext('%sv' % namespace), '44986')
+
+    def test_only_principals_can_export(self):
+        self.client.force_login(get_user_model().objects.create_user(email='otro@school.com', password='foo'))
+        self.assertEqual(self.client.get('/exportar/notas/').status_code, 403)
+
+    def test_impossible_date_is_a_bad_request(self):
+        self.assertEqual(self.client.get('/exportar/asistencia/', {'hasta': '2023-02-30'}).status_code, 400)
+
+    def test_archive_command_writes_gzip(self):
+        with tempfile.TemporaryDirectory() as directory:
+            call_command('export_course_data', directory, kind=['notas'], stdout=StringIO())
+            name, = os.listdir(directory)
+            with gzip.open(os.path.join(directory, name), 'rt', encoding='utf-8-sig') as archive:
+                self.assertEqual(len(archive.read().splitlines()), 3)
+        with self.assertRaisesMessage(CommandError, 'Invalid date: 2023-02-30'):
+            call_command('export_course_data', directory, start='2023-02-30', stdout=StringIO())
+
+
+class StudentImportTests(TestCase):
+
+    def setUp(self):
+        self.course = Course.objects.create(year=Course.SECOND_YEAR, division='B', shift=Course.EVENING_SHIFT)
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'alumnos.csv')
+        with open(self.path, 'w', encoding='utf-8') as source:
+            source.write(
+                'Nombre,Apellido,Fecha_Nacimiento,Telefono,Anio,Division,Turno\n'
+                'Ana,Pérez,2010-05-01,351 555-1234,SEC,B,ES\n'
+                'Juan,Gómez,02/03/2010,351 555-0000 / 351 555-1111,Segundo Año,b,tarde\n'
+                'Ana,Pérez,2010-05-01,,SEC,B,ES\n'
+                'Luis,Díaz,2010-13-01,,SEC,B,ES\n'
+                'Eva,Sosa,2010-01-01,,FIR,A,MS\n')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_import_upserts_and_reports_rejected_rows(self):
+        existing = Student.objects.create(
+            first_name='Juan', last_name='Gómez', birthday=timezone.make_aware(timezone.datetime(2010, 3, 2)))
+        report = import_students(self.path, chunk_size=2, workers=1)
+        self.assertEqual(report.counts(), {
+            'rows': 5, 'rejected': 3, 'created': 1, 'existing': 1, 'phones': 3, 'course_histories': 2})
+        self.assertEqual(
+            [(error.row, error.field) for error in report.errors], [(4, ''), (5, 'fecha_nacimiento'), (6, 'anio')])
+        self.assertEqual(set(existing.phone.values_list('number', flat=True)), {'351 555-0000', '351 555-1111'})
+        self.assertEqual(StudentAcademicSummary.objects.get(student=existing).course, self.course)
+        self.assertEqual(search('ana per')[0]['text'], 'Ana Pérez')
+
+        again = import_students(self.path, chunk_size=2, workers=1)
+        self.assertEqual((again.created, again.existing, again.phones, again.course_histories), (0, 2, 0, 0))
+
+    def test_import_moves_students_out_of_their_course(self):
+        juan = Student.objects.create(
+            first_name='Juan', last_name='Gómez', birthday=timezone.make_aware(timezone.datetime(2010, 3, 2)))
+        third_a = Course.objects.create(year=Course.THIRD_YEAR, division='A')
+        CourseHistory.objects.create(student=juan, id_course=third_a, cycle=2022, valid_from=date(2022, 3, 1))
+        # Still open from an earlier cycle, so still in the course.
+        self.assertEqual([student.id for student in roster_at(third_a.pk)], [juan.pk])
+        import_students(self.path, chunk_size=2, workers=1)
+        self.assertEqual(roster_at(third_a.pk), [])
+        self.assertEqual([student.first_name for student in roster_at(self.course.pk)], ['Juan', 'Ana'])
+        self.assertEqual(StudentAcademicSummary.objects.get(student=juan).course, self.course)
+
+    def test_checkpoint_resumes_after_written_rows(self):
+        checkpoint = self.path + '.checkpoint'
+        import_students(self.path, chunk_size=2, workers=1, checkpoint_path=checkpoint)
+        with CaptureQueriesContext(connection) as queries:
+            report = import_students(self.path, chunk_size=2, workers=1, checkpoint_path=checkpoint)
+        self.assertEqual(report.rows, 5)
+        self.assertEqual(report.created, 2)
+        # Only the course lookup runs; every row was already written.
+        self.assertEqual(len(queries), 1)
+
+    def test_command_writes_error_report(self):
+        out = StringIO()
+        call_command('import_students', self.path, workers=2, stdout=out)
+        self.assertIn('2 students created', out.getvalue())
+        with open(self.path + '.errors.csv', encoding='utf-8') as errors:
+            self.assertEqual(len(errors.read().splitlines()), 4)
+        self.assertFalse(os.path.exists(self.path + '.checkpoint'))
+
+
+class RosterTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.course = Course.objects.create(year=Course.THIRD_YEAR, division='C', shift=Course.MORNING_SHIFT)
+        self.other = Course.objects.create(year=Course.THIRD_YEAR, division='D', shift=Course.MORNING_SHIFT)
+        self.ana = Student.objects.create(first_name='Ana', last_name='Zapata', birthday=timezone.now())
+        self.luis = Student.objects.create(first_name='Luis', last_name='Alvarez', birthday=timezone.now())
+        self.history = CourseHistory.objects.create(student=self.ana, id_course=self.course)
+        CourseHistory.objects.create(student=self.luis, id_course=self.course)
+        Phone.objects.create(student=self.ana, number='351 555-1234')
+
+    def names(self):
+        return [student.last_name for student in get_roster('THI', 'C', 'MS').students]
+
+    def test_warm_rosters_cost_no_queries(self):
+        self.assertEqual(warm_rosters(), 2)
+        self.assertIsNone(get_roster('FIR', 'E', 'NS'))
+        with self.assertNumQueries(0):
+            roster = get_roster('THI', 'C', 'MS')
+            self.assertEqual(get_course_roster(self.other.pk).students, ())
+            self.assertIsNone(get_roster('FIR', 'E', 'NS'))
+        self.assertEqual(roster.course_id, self.course.pk)
+        self.assertEqual([(s.last_name, s.phones) for s in roster.students],
+                         [('Alvarez', ()), ('Zapata', ('351 555-1234',))])
+        request = staff_request('/asistencia/%d/' % self.course.pk)
+        with self.assertNumQueries(0):
+            response = asistencia(request, self.course.pk)
+        self.assertContains(response, 'Zapata')
+
+    def test_signals_invalidate_rosters(self):
+        warm_rosters()
+        self.luis.last_name = 'Benitez'
+        self.luis.save()
+        self.assertEqual(self.names(), ['Benitez', 'Zapata'])
+        Phone.objects.create(student=self.luis, number='351 555-0000')
+        self.assertEqual(get_roster('THI', 'C', 'MS').students[0].phones, ('351 555-0000',))
+
+        self.history.id_course = self.other
+        self.history.save()
+        self.assertEqual(self.names(), ['Benitez'])
+        self.assertEqual(len(get_course_roster(self.other.pk).students), 1)
+
+        self.course.delete()
+        self.assertIsNone(get_roster('THI', 'C', 'MS'))
+
+    def test_rosters_follow_the_timeline(self):
+        CourseHistory.objects.create(student=self.luis, id_course=self.other, cycle=2022, valid_from=date(2022, 3, 1),
+                                     valid_to=date(2023, 3, 1))
+        move_student(self.ana.pk, self.other.pk)
+        warm_rosters()
+        self.assertEqual(self.names(), ['Alvarez'])
+        self.assertEqual([student.last_name for student in get_course_roster(self.other.pk).students], ['Zapata'])
+        self.assertEqual(get_course_roster(self.other.pk).students[0].phones, ('351 555-1234',))
+
+
+class ReportCacheTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.course = Course.objects.create()
+        self.student = Student.objects.create(first_name='Ana', last_name='Perez', birthday=timezone.now())
+        CourseHistory.objects.create(student=self.student, id_course=self.course, cycle=2023,
+                                     valid_from=date(2023, 3, 1))
+        self.math = Subject.objects.create(name='Matemática')
+        Grades.objects.create(student=self.student, subject=self.math, grade='8')
+
+    def test_sqlite_backend_is_atomic_and_expires(self):
+        with tempfile.TemporaryDirectory() as directory:
+            backend = SQLiteCache(os.path.join(directory, 'cache.sqlite3'), {})
+            self.assertTrue(backend.add('lock', 1, 60))
+            self.assertFalse(backend.add('lock', 2, 60))
+            backend.set('counter', 1)
+            self.assertEqual(backend.incr('counter', 5), 6)
+            with self.assertRaises(ValueError):
+                backend.incr('missing')
+            backend.set('old', 'x', 0.05)
+            time.sleep(0.1)
+            self.assertIsNone(backend.get('old'))
+            self.assertTrue(backend.add('old', 'y'))
+            self.assertEqual(backend.get_many(['lock', 'old', 'missing']), {'lock': 1, 'old': 'y'})
+
+    def test_concurrent_misses_compute_once(self):
+        calls, results = [], []
+
+        def compute():
+            calls.append(1)
+            time.sleep(0.2)
+            return 'report'
+
+        threads = [threading.Thread(target=lambda: results.append(cached('slow', compute, [Student])))
+                   for _ in range(50)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, ['report'] * 50)
+
+    def test_stale_value_served_while_another_recomputes(self):
+        self.assertEqual(cached('report', lambda: 1, [Student]), 1)
+        self.assertEqual(cached('report', lambda: 2, [Student]), 1)
+        Student.objects.create(first_name='Luis', last_name='Gomez', birthday=timezone.now())
+        commit_bumps()
+        cache.add(LOCK_KEY % 'report', True)
+        self.assertEqual(cached('report', lambda: 2, [Student]), 1)
+        cache.delete(LOCK_KEY % 'report')
+        self.assertEqual(cached('report', lambda: 2, [Student]), 2)
+
+    def test_writes_in_a_transaction_bump_once_on_commit(self):
+        before = generations([Student])
+        for name in ('Luis', 'Eva', 'Juan'):
+            Student.objects.create(first_name=name, last_name='Gomez', birthday=timezone.now())
+        Student.objects.filter(first_name='Eva').update(last_name='Diaz')
+        self.assertEqual(generations([Student]), before)
+        commit_bumps()
+        self.assertEqual(generations([Student]), (before[0] + 1,))
+        try:
+            with transaction.atomic():
+                Student.objects.create(first_name='Ana', last_name='Ruiz', birthday=timezone.now())
+                raise IntegrityError()
+        except IntegrityError:
+            pass
+        self.assertEqual([entry for entry in connection.run_on_commit if isinstance(entry[1], _PendingBumps)], [])
+
+    def test_views_cached_until_a_write(self):
+        request = staff_request('/progreso/', {'curso': self.course.pk})
+        progreso_academico(request)
+        with self.assertNumQueries(0):
+            self.assertContains(progreso_academico(request), '8,0')
+        Grades.objects.create(student=self.student, subject=self.math, grade='6')
+        commit_bumps()
+        self.assertContains(progreso_academico(request), '7,0')
+
+        author = Preceptor.objects.create(email='preceptor@school.com', first_name='Marta', last_name='Diaz')
+        comment = Comment.objects.create(student=self.student, author=author, description='Llega tarde')
+        commit_bumps()
+        self.assertContains(historialnotas(staff_request('/')), 'preceptor@school.com')
+        author.email = 'marta@school.com'
+        author.save()
+        commit_bumps()
+        self.assertContains(historialnotas(staff_request('/')), 'marta@school.com')
+        Comment.objects.filter(pk=comment.pk).soft_delete()
+        commit_bumps()
+        self.assertNotContains(historialnotas(staff_request('/')), 'Llega tarde')
+
+        request = staff_request('/', {'desde': '2023-03-01', 'hasta': '2023-03-31'})
+        ver_asistencia(request, self.course.pk)
+        with self.assertNumQueries(1):
+            self.assertNotContains(ver_asistencia(request, self.course.pk), 'width: 100%')
+        record_roll_call(self.course.pk, [self.student.pk], date=date(2023, 3, 2))
+        commit_bumps()
+        self.assertContains(ver_asistencia(request, self.course.pk), 'width: 100%')
+
+
+class ReplicaRouterTests(TestCase):
+
+    def setUp(self):
+        self.router = ReplicaRouter()
+        self.router.replicas = ['replica']
+        unpin()
+
+    def tearDown(self):
+        unpin()
+
+    def test_reads_of_school_data_go_to_the_replica_until_a_write(self):
+        # Test cases run inside a transaction, which alone keeps reads on the primary.
+        self.assertEqual(self.router.db_for_read(Student), 'default')
+        with mock.patch.object(connection, 'in_atomic_block', False):
+            self.assertEqual(self.router.db_for_read(Student), 'replica')
+            self.assertEqual(self.router.db_for_read(StudentAcademicSummary), 'replica')
+            self.assertEqual(self.router.db_for_read(Preceptor), 'default')
+            self.assertEqual(self.router.db_for_write(Student), 'default')
+            self.assertEqual(self.router.db_for_read(Student), 'default')
+        self.assertFalse(self.router.allow_migrate('replica', 'managerLibrary'))
+
+    def test_writes_pin_the_client_to_the_primary(self):
+        course = Course.objects.create()
+        warm_rosters()
+        self.client.force_login(Preceptor.objects.create(email='preceptor@school.com'))
+        self.assertNotIn('primary', self.client.get('/asistencia/%d/' % course.pk).cookies)
+        response = self.client.post('/asistencia/%d/' % course.pk, {'presentes': []})
+        self.assertIn('primary', response.cookies)
+        self.assertFalse(is_pinned() or has_written())
+
+    def test_sqlite_pragmas(self):
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA synchronous')
+            self.assertEqual(cursor.fetchone()[0], 1)
+            cursor.execute('PRAGMA cache_size')
+            self.assertEqual(cursor.fetchone()[0], -20000)
+
+
+class ReplicaRoutingTests(TransactionTestCase):
+    """The router against the test settings' replica, a second connection to the test database."""
+
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        unpin()
+        replica_router, = [r for r in router.routers if isinstance(r, ReplicaRouter)]
+        patcher = mock.patch.object(replica_router, 'replicas', ['replica'])
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        unpin()
+
+    def reads_on(self, read):
+        with CaptureQueriesContext(connections['default']) as primary, \
+                CaptureQueriesContext(connections['replica']) as replica:
+            read()
+        return {alias for alias, queries in (('default', primary), ('replica', replica)) if queries}
+
+    def test_a_write_pins_reads_until_the_request_or_job_ends(self):
+        Student.objects.create(first_name='Ana', last_name='Perez', birthday=timezone.now())
+        self.assertTrue(is_pinned())
+        self.assertEqual(self.reads_on(Student.objects.count), {'default'})
+        request_finished.send(sender=None)
+        self.assertEqual(self.reads_on(Student.objects.count), {'replica'})
+        self.assertEqual(self.reads_on(Preceptor.objects.count), {'default'})
+
+        with mock.patch.dict(JOBS, {'count_students': Student.objects.count}):
+            job = enqueue('count_students')
+            claim('test')
+            Student.objects.update(first_name='Ana María')
+            self.assertIn('replica', self.reads_on(lambda: run_job(job.pk)))
+
+
+class AsgiTests(TestCase):
+
+    def serve(self, application, scope, body=b''):
+        messages = [{'type': 'http.request', 'body': body[:3], 'more_body': True},
+                    {'type': 'http.request', 'body': body[3:], 'more_body': False}]
+        sent = []
+
+        async def receive():
+            return messages.pop(0)
+
+        async def send(message):
+            sent.append(message)
+
+        asyncio.run(application(dict({'type': 'http', 'query_string': b'', 'http_version': '1.1'}, **scope),
+                                receive, send))
+        return sent
+
+    def test_django_served_over_asgi(self):
+        finished = []
+        request_finished.connect(lambda **kwargs: finished.append(kwargs['sender']), weak=False,
+                                 dispatch_uid='asgi_test')
+        try:
+            sent = self.serve(asgi_application, {'method': 'GET', 'path': '/perfil/',
+                                                 'headers': [(b'host', b'testserver')]})
+        finally:
+            request_finished.disconnect(dispatch_uid='asgi_test')
+        self.assertEqual(sent[0]['status'], 404)
+        self.assertFalse(sent[-1].get('more_body', False))
+        # The response was closed, as a WSGI server would.
+        self.assertEqual(len(finished), 1)
+
+    def test_response_closed_after_the_body(self):
+        events = []
+
+        class Response(list):
+            def close(self):
+                events.append('closed')
+
+        def wsgi_application(environ, start_response):
+            start_response('201 Created', [('Content-Type', 'text/plain')])
+            return Response([environ['PATH_INFO'].encode('latin1'), b' ', environ['wsgi.input'].read()])
+
+        sent = self.serve(WsgiToAsgi(close_after_response(wsgi_application)),
+                          {'method': 'POST', 'path': '/año/'}, b'a=1&b=2')
+        self.assertEqual(sent[0]['status'], 201)
+        self.assertEqual(b''.join(message.get('body', b'') for message in sent[1:]).decode('utf-8'), '/año/ a=1&b=2')
+        self.assertEqual(events, ['closed'])
+
+    def test_gather_runs_calls_at_the_same_time(self):
+        start = time.perf_counter()
+        with mock.patch.object(connection, 'in_atomic_block', False):
+            results = gather(*[lambda i=i: time.sleep(0.1) or i for i in range(4)])
+        self.assertEqual(results, [0, 1, 2, 3])
+        self.assertLess(time.perf_counter() - start, 0.3)
+
+    def test_student_profile(self):
+        student = Student.objects.create(first_name='Ana', last_name='Perez', birthday=timezone.now())
+        Grades.objects.create(student=student, subject=Subject.objects.create(name='Lengua'), grade='9')
+        Presence.objects.create(student=student, presence=False)
+        self.assertEqual(self.client.get('/alumno/%d/' % student.pk).status_code, 403)
+        self.client.force_login(Preceptor.objects.create(email='preceptor@school.com'))
+        data = self.client.get('/alumno/%d/' % student.pk).json()
+        self.assertEqual(data['student']['last_name'], 'Perez')
+        self.assertEqual(data['grades'], [{'subject': 'Lengua', 'grade': 9}])
+        self.assertEqual(data['attendance'], {'present': 0, 'absent': 1})
+        self.assertEqual(self.client.get('/alumno/%d/' % (student.pk + 1)).status_code, 404)
+
+
+class JobQueueTests(TestCase):
+
+    def test_idempotency_keys_and_priorities(self):
+        low = enqueue('recompute_grade_averages', idempotency_key='grades')
+        self.assertEqual(enqueue('recompute_grade_averages', idempotency_key='grades'), low)
+        high = enqueue('purge_soft_deleted', priority=10, days=30)
+        enqueue('purge_soft_deleted', run_after=timezone.now() + timedelta(hours=1))
+        self.assertEqual(claim('test', limit=5), [high, low])
+        self.assertEqual(claim('test'), [])
+        high.refresh_from_db()
+        self.assertEqual((high.status, high.attempts, high.worker), (Job.RUNNING, 1, 'test'))
+        with self.assertRaises(ValueError):
+            enqueue('no_such_job')
+
+    def test_failures_retry_with_backoff_then_fail(self):
+        with mock.patch.dict(JOBS, {'broken': lambda: 1 / 0}):
+            job = enqueue('broken', max_attempts=2)
+            claim('test')
+            self.assertEqual(run_job(job.pk), Job.QUEUED)
+            job.refresh_from_db()
+            self.assertIn('ZeroDivisionError', job.last_error)
+            self.assertGreater(job.run_after, timezone.now() + timedelta(seconds=20))
+            self.assertEqual(claim('test'), [])
+            Job.objects.filter(pk=job.pk).update(run_after=timezone.now())
+            claim('test')
+            self.assertEqual(run_job(job.pk), Job.FAILED)
+
+    def test_only_jobs_of_lost_workers_are_requeued(self):
+        with mock.patch.dict(JOBS, {'slow': lambda: None, 'crashing': lambda: None}):
+            slow, crashing = enqueue('slow'), enqueue('crashing', max_attempts=1)
+        claim('test', limit=2)
+        long_ago = timezone.now() - timedelta(hours=2)
+        Job.objects.update(started_at=long_ago, heartbeat_at=long_ago)
+        heartbeat([slow.pk])
+        self.assertEqual(requeue_stale(), 1)
+        slow.refresh_from_db()
+        crashing.refresh_from_db()
+        self.assertEqual(slow.status, Job.RUNNING)
+        self.assertEqual((crashing.status, crashing.last_error), (Job.FAILED, 'Worker lost'))
+
+        Job.objects.filter(pk=slow.pk).update(heartbeat_at=long_ago)
+        self.assertEqual(requeue_stale(), 1)
+        self.assertEqual(Job.objects.get(pk=slow.pk).status, Job.QUEUED)
+
+    def test_a_requeued_job_is_finished_by_its_new_attempt_only(self):
+        def lose_the_job():
+            # The worker stalls past STALE_AFTER; another one claims the job again.
+            Job.objects.update(heartbeat_at=timezone.now() - timedelta(hours=2))
+            requeue_stale()
+            claim('other')
+            return 'late'
+
+        with mock.patch.dict(JOBS, {'stalling': lose_the_job}):
+            job = enqueue('stalling')
+            first = claim('test')[0]
+            self.assertEqual(run_job(job.pk, first.attempts), Job.RUNNING)
+            job.refresh_from_db()
+            self.assertEqual((job.worker, job.attempts, job.result), ('other', 2, ''))
+            # Too late to even start.
+            self.assertEqual(run_job(job.pk, first.attempts), Job.RUNNING)
+
+    def test_a_failing_pool_fails_the_job_and_not_the_worker(self):
+        with mock.patch.dict(JOBS, {'slow': lambda: None}):
+            job = enqueue('slow')
+            enqueue('slow')
+            with mock.patch('managerLibrary.jobs._run_in_pool', side_effect=[BrokenExecutor('Pool died'), Job.DONE]), \
+                    mock.patch('managerLibrary.jobs.ThreadPoolExecutor', wraps=ThreadPoolExecutor) as pools:
+                self.assertEqual(work(workers=1, once=True, poll_interval=0.01), 2)
+        # The next job ran on a new pool.
+        self.assertEqual(pools.call_count, 2)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.worker), (Job.FAILED, ''))
+        self.assertIn('Pool died', job.last_error)
+
+    def test_unserializable_result_fails_the_attempt(self):
+        with mock.patch.dict(JOBS, {'opaque': object}):
+            job = enqueue('opaque')
+            claim('test')
+            self.assertEqual(run_job(job.pk), Job.QUEUED)
+        self.assertIn('TypeError', Job.objects.get(pk=job.pk).last_error)
+
+    def test_purge_and_grade_recomputation_jobs(self):
+        old = Student.objects.create(first_name='Ana', last_name='Perez', birthday=timezone.now())
+        recent = Student.objects.create(first_name='Luis', last_name='Gomez', birthday=timezone.now())
+        Student.objects.filter(pk=old.pk).update(deleted_at=timezone.now() - timedelta(days=100))
+        recent.delete()
+        job = enqueue('purge_soft_deleted', days=90)
+        claim('test')
+        self.assertEqual(run_job(job.pk), Job.DONE)
+        self.assertFalse(Student.all_objects.filter(pk=old.pk).exists())
+        self.assertTrue(Student.all_objects.filter(pk=recent.pk).exists())
+        job.refresh_from_db()
+        self.assertEqual(job.payload_dict(), {'days': 90})
+        self.assertEqual(json.loads(job.result)['managerLibrary.Student'], 1)
+
+        student = Student.objects.create(first_name='Eva', last_name='Diaz', birthday=timezone.now())
+        Grades.objects.bulk_create([Grades(student=student, grade='8'), Grades(student=student, grade='6')])
+        Grades.objects.filter(student=student).update(subject=Subject.objects.create(name='Lengua'))
+        job = enqueue('recompute_grade_averages', student_ids=[student.pk])
+        claim('test')
+        run_job(job.pk)
+        self.assertEqual(StudentAcademicSummary.objects.get(student=student).grade_average, 7.0)
+
+
+class CategoryStatsTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.author = Preceptor.objects.create(email='preceptor@school.com', first_name='Luis', last_name='Soto')
+        self.course = Course.objects.create(division='A')
+        self.students = [Student.objects.create(first_name='Juan', last_name=name, birthday=timezone.now())
+                         for name in ('Pérez', 'Gómez')]
+        for student in self.students:
+            CourseHistory.objects.create(student=student, id_course=self.course)
+        self.conduct = Category.objects.create(name='Conducta')
+        self.merit = Category.objects.create(name='Mérito')
+        self.day = timezone.localdate()
+
+    def comment(self, student, *categories, days_ago=0):
+        comment = Comment.objects.create(student=student, author=self.author, description='Nota',
+                                         date=timezone.now() - timedelta(days=days_ago))
+        comment.categories.add(*categories)
+        return comment
+
+    def counts(self):
+        return sorted(CategoryDailyCount.objects.values_list('category__name', 'student__last_name', 'day', 'count'))
+
+    def test_signals_keep_counts_current(self):
+        perez, gomez = self.students
+        first = self.comment(perez, self.conduct, self.merit)
+        self.comment(perez, self.conduct)
+        self.comment(gomez, self.conduct, days_ago=1)
+        yesterday = self.day - timedelta(days=1)
+        self.assertEqual(self.counts(), [
+            ('Conducta', 'Gómez', yesterday, 1), ('Conducta', 'Pérez', self.day, 2),
+            ('Mérito', 'Pérez', self.day, 1),
+        ])
+        self.assertEqual(CategoryDailyCount.objects.get(student=perez, category=self.conduct).course, self.course)
+
+        first.categories.remove(self.merit)
+        self.merit.categories.clear()
+        first.date = timezone.now() - timedelta(days=1)
+        first.save()
+        self.assertEqual(self.counts(), [
+            ('Conducta', 'Gómez', yesterday, 1), ('Conducta', 'Pérez', yesterday, 1),
+            ('Conducta', 'Pérez', self.day, 1),
+        ])
+        first.delete()
+        self.assertEqual(self.counts(), [('Conducta', 'Gómez', yesterday, 1), ('Conducta', 'Pérez', self.day, 1)])
+
+        # Notes stay with the course the student was in when they got them.
+        other = Course.objects.create(division='B')
+        move_student(gomez.pk, other.pk, self.day)
+        self.comment(gomez, self.conduct)
+        self.assertEqual(list(CategoryDailyCount.objects.filter(student=gomez).order_by('day').values_list(
+            'course', flat=True)), [self.course.pk, other.pk])
+        move_student(gomez.pk, other.pk, yesterday)
+        self.assertEqual(set(CategoryDailyCount.objects.filter(student=gomez).values_list('course', flat=True)),
+                         {other.pk})
+
+        incremental = sorted(CategoryDailyCount.objects.values_list('student', 'day', 'course', 'count'))
+        self.assertEqual(backfill(chunk_size=1), 3)
+        self.assertEqual(sorted(CategoryDailyCount.objects.values_list('student', 'day', 'course', 'count')),
+                         incremental)
+
+    def test_stats_read_a_fixed_number_of_queries(self):
+        perez, gomez = self.students
+        for days_ago in (0, 0, 2):
+            self.comment(perez, self.conduct, days_ago=days_ago)
+        self.comment(gomez, self.conduct, self.merit)
+        with self.assertNumQueries(3):
+            stats = category_stats(self.day - timedelta(days=7), self.day, top=1)
+        self.assertEqual([(category['name'], category['total']) for category in stats],
+                         [('Conducta', 4), ('Mérito', 1)])
+        self.assertEqual(stats[0]['trend'], [(self.day - timedelta(days=2), 1), (self.day, 3)])
+        self.assertEqual(stats[0]['top_students'], [{'id': perez.pk, 'name': 'Juan Pérez', 'count': 3}])
+        self.assertEqual(category_stats(self.day, self.day, course_id=self.course.pk + 1), [])
+
+    def test_view_is_for_principals(self):
+        self.comment(self.students[0], self.conduct)
+        self.client.force_login(self.author)
+        self.assertEqual(self.client.get('/estadisticas/categorias/').status_code, 403)
+        principal = Principal.objects.create(email='director@school.com', first_name='Ana', last_name='Ruiz')
+        self.client.force_login(principal)
+        self.assertEqual(self.client.get('/estadisticas/categorias/', {'top': 'x'}).status_code, 400)
+        self.assertEqual(self.client.get('/estadisticas/categorias/', {'desde': '2023-02-30'}).status_code, 400)
+        response = self.client.get('/estadisticas/categorias/', {'curso': self.course.pk, 'categoria': self.conduct.pk})
+        categories = response.json()['categories']
+        self.assertEqual([(category['name'], category['total']) for category in categories], [('Conducta', 1)])
+        self.assertEqual(categories[0]['trend'], [[self.day.isoformat(), 1]])
+
+
+class SoftDeletionAdminTests(TestCase):
+
+    def setUp(self):
+        self.client.force_login(get_user_model().objects.create_superuser('super@user.com', 'foo'))
+        self.preceptor = Preceptor.objects.create(email='preceptor@school.com', first_name='Luis', last_name='Soto')
+
+    def add_presences(self, count):
+        students = Student.objects.bulk_create([
+            Student(first_name='Juan', last_name='Pérez %d' % i, birthday=timezone.now()) for i in range(count)])
+        Presence.objects.bulk_create([
+            Presence(student=student, preceptor=self.preceptor, presence=True) for student in students])
+
+    def changelist_queries(self, url, params=None):
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.get(url, params or {}).status_code, 200)
+        return len(queries)
+
+    def test_changelists_run_a_fixed_number_of_queries(self):
+        url = '/admin/managerLibrary/presence/'
+        self.add_presences(2)
+        few = self.changelist_queries(url), self.changelist_queries(url, {'estado': 'todos'})
+        self.add_presences(30)
+        self.assertEqual((self.changelist_queries(url), self.changelist_queries(url, {'estado': 'todos'})), few)
+
+    def test_deleted_rows_can_be_listed_restored_and_purged(self):
+        url = '/admin/managerLibrary/student/'
+        alive, deleted = [Student.objects.create(first_name='Ana', last_name=name, birthday=timezone.now())
+                          for name in ('Ruiz', 'Díaz')]
+        Phone.objects.create(student=deleted, number='1234')
+        deleted.delete()
+        self.assertEqual(list(self.client.get(url).context['cl'].result_list), [alive])
+        self.assertEqual(list(self.client.get(url, {'estado': 'borrados'}).context['cl'].result_list), [deleted])
+        self.assertEqual(self.client.get('/admin/managerLibrary/student/%d/change/' % deleted.pk).status_code, 200)
+
+        self.client.post(url, {'action': 'purge_selected', '_selected_action': [alive.pk]})
+        self.client.post(url + '?estado=borrados', {'action': 'restore_selected', '_selected_action': [deleted.pk]})
+        self.assertEqual(Student.objects.count(), 2)
+        self.client.post(url, {'action': 'soft_delete_selected', '_selected_action': [deleted.pk]})
+        self.assertEqual(Phone.objects.count(), 0)
+        self.client.post(url + '?estado=todos', {'action': 'purge_selected', '_selected_action': [deleted.pk]})
+        self.assertFalse(Student.all_objects.filter(pk=deleted.pk).exists())
+        self.assertFalse(Phone.all_objects.exists())
+
+    def test_actions_refresh_what_the_signal_handlers_keep(self):
+        cache.clear()
+        principal = Principal.objects.create(email='director@school.com', first_name='Ana', last_name='Ruiz')
+        course = Course.objects.create()
+        student = Student.objects.create(first_name='Eva', last_name='Sosa', birthday=timezone.now())
+        CourseHistory.objects.create(student=student, id_course=course)
+        request = RequestFactory().get('/exportar/notas/')
+        request.user = principal
+        self.assertEqual(exportar(request, 'notas').status_code, 200)
+        warm_rosters()
+
+        self.client.post('/admin/managerLibrary/principal/', {
+            'action': 'soft_delete_selected', '_selected_action': [principal.pk]})
+        request = RequestFactory().get('/exportar/notas/')
+        request.user = principal
+        self.assertEqual(exportar(request, 'notas').status_code, 403)
+
+        url = '/admin/managerLibrary/student/'
+        self.client.post(url, {'action': 'soft_delete_selected', '_selected_action': [student.pk]})
+        self.assertEqual(get_course_roster(course.pk).students, ())
+        self.assertEqual(search('sosa'), [])
+        self.assertFalse(StudentAcademicSummary.objects.filter(student=student).exists())
+        self.client.post(url + '?estado=borrados', {'action': 'restore_selected', '_selected_action': [student.pk]})
+        self.assertEqual([s.id for s in get_course_roster(course.pk).students], [student.pk])
+        self.assertEqual(len(search('sosa')), 1)
+        self.assertEqual(StudentAcademicSummary.objects.get(student=student).course, course)
+
+    def test_large_tables_show_an_estimated_count(self):
+        url = '/admin/managerLibrary/presence/'
+        self.add_presences(3)
+        with mock.patch('managerLibrary.admin.estimated_count', return_value=ESTIMATED_COUNT_THRESHOLD + 1):
+            self.assertEqual(self.client.get(url, {'estado': 'todos'}).context['cl'].result_count,
+                             ESTIMATED_COUNT_THRESHOLD + 1)
+            # The estimate includes deleted rows, so the default view of alive ones counts them.
+            self.assertEqual(self.client.get(url).context['cl'].result_count, 3)
+        self.assertEqual(self.client.get(url).context['cl'].result_count, 3)
+
+
+class ApiTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.preceptor = Preceptor.objects.create(email='preceptor@school.com', first_name='Luis', last_name='Soto')
+        self.course = Course.objects.create()
+        self.students = [Student.objects.create(first_name='Juan', last_name='Pérez %d' % i, birthday=timezone.now())
+                         for i in range(5)]
+        for student in self.students[:3]:
+            CourseHistory.objects.create(student=student, id_course=self.course)
+        self.client.force_login(self.preceptor)
+
+    def test_cursor_pages_with_sparse_fields(self):
+        params = {'fields': 'last_name', 'limit': 2, 'curso': self.course.pk}
+        page = self.client.get('/api/alumnos/', params).json()
+        self.assertEqual(page['results'], [{'id': student.pk, 'last_name': student.last_name}
+                                           for student in self.students[:2]])
+        self.assertTrue(page['has_next'])
+        page = self.client.get('/api/alumnos/', dict(params, cursor=page['next_cursor'])).json()
+        self.assertEqual([row['id'] for row in page['results']], [self.students[2].pk])
+        self.assertEqual((page['next_cursor'], page['has_next']), (None, False))
+        move_student(self.students[0].pk, Course.objects.create(division='B').pk)
+        commit_bumps()
+        page = self.client.get('/api/alumnos/', dict(params, limit=10)).json()
+        self.assertEqual([row['id'] for row in page['results']], [student.pk for student in self.students[1:3]])
+
+        category = Category.objects.create(name='Conducta')
+        comment = Comment.objects.create(student=self.students[0], author=self.preceptor, description='Nota')
+        comment.categories.add(category)
+        row, = self.client.get('/api/comentarios/', {'fields': 'categories'}).json()['results']
+        self.assertEqual(row, {'id': comment.pk, 'categories': [category.pk]})
+
+    def test_etag_is_reused_until_a_write(self):
+        response = self.client.get('/api/alumnos/')
+        etag = response['ETag']
+        self.assertTrue(etag.startswith('W/"'))
+        with self.assertNumQueries(2):
+            # Only the session and the user.
+            self.assertEqual(self.client.get('/api/alumnos/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.students[0].delete()
+        commit_bumps()
+        response = self.client.get('/api/alumnos/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(len(response.json()['results']), 4)
+
+    def test_gzip_and_errors(self):
+        response = self.client.get('/api/alumnos/', HTTP_ACCEPT_ENCODING='br;q=0, gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertEqual(len(json.loads(gzip.decompress(response.content))['results']), 5)
+        self.assertNotIn('Content-Encoding', self.client.get('/api/alumnos/', HTTP_ACCEPT_ENCODING='gzip;q=0'))
+
+        self.assertEqual(self.client.get('/api/alumnos/', {'fields': 'password'}).status_code, 400)
+        self.assertEqual(self.client.get('/api/alumnos/', {'cursor': 'x'}).status_code, 400)
+        self.assertEqual(self.client.get('/api/asistencias/', {'desde': 'ayer'}).status_code, 400)
+        self.assertEqual(self.client.get('/api/usuarios/').status_code, 404)
+        self.client.logout()
+        self.assertEqual(self.client.get('/api/alumnos/').status_code, 403)
+        # Signed in, but not school staff.
+        self.client.force_login(get_user_model().objects.create_user(email='normal@user.com', password='foo'))
+        self.assertEqual(self.client.get('/api/alumnos/').status_code, 403)
+
+
+class GradeStorageTests(TestCase):
+
+    def test_string_grades_are_still_accepted(self):
+        grade = Grades.objects.create(grade='8')
+        self.assertEqual(grade.grade, 8)
+        self.assertIsNone(Grades.objects.create(grade='0').grade)
+        self.assertEqual(list(Grades.objects.filter(grade='8')), [grade])
+        self.assertEqual(list(Grades.objects.filter(grade__gte='6')), [grade])
+        form = modelform_factory(Grades, fields=['grade'])({'grade': '9'}, instance=grade)
+        self.assertTrue(form.is_valid())
+        self.assertEqual(form.save().grade, 9)
+        self.assertFalse(modelform_factory(Grades, fields=['grade'])({'grade': '11'}).is_valid())
+
+    def test_grades_are_checked_by_the_database(self):
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Grades.objects.create(grade=11)
+
+
+class GradeMigrationTests(TransactionTestCase):
+    """Runs the real migrations, which can't happen inside a TestCase's transaction on SQLite."""
+
+    def migrate(self, name):
+        executor = MigrationExecutor(connection)
+        target = [('managerLibrary', name)]
+        executor.migrate(target)
+        return executor.loader.project_state(target).apps.get_model('managerLibrary', 'Grades')
+
+    def tearDown(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes())
+
+    def test_copy_resumes_and_catches_edits(self):
+        Grades = self.migrate('0011_grade_value')
+        grades = [Grades.objects.create(grade=grade) for grade in ('7', '8', '9', '', '10')]
+        # A first run that stopped after copying the first grade.
+        Grades.objects.filter(pk=grades[0].pk).update(grade_value=7)
+        copy_grades = import_module('managerLibrary.migrations.0012_grade_value_backfill').copy_grades
+        self.assertEqual(copy_grades(Grades, chunk_size=2), 3)
+        self.assertEqual(copy_grades(Grades, chunk_size=2), 0)
+
+        # The old code keeps writing only the text grade until 0013 is deployed.
+        Grades.objects.filter(pk=grades[1].pk).update(grade='4')
+        Grades.objects.filter(pk=grades[2].pk).update(grade='')
+        Grades.objects.create(grade='5')
+        Grades = self.migrate('0013_grade_integer')
+        self.assertEqual(list(Grades.objects.order_by('pk').values_list('grade', flat=True)),
+                         [7, 4, None, None, 10, 5])
+
+        # Going back, ungraded rows get the old column's default.
+        Grades = self.migrate('0012_grade_value_backfill')
+        self.assertEqual(list(Grades.objects.order_by('pk').values_list('grade', 'grade_value')), [
+            ('7', 7), ('4', 4), ('0', None), ('0', None), ('10', 10), ('5', 5)])
+
+
+class TemplateTests(TestCase):
+
+    PAGES = (
+        'academic_progress.html', 'assistance.html', 'capacitaciondocente.html', 'comments_history.html',
+        'create_comment.html', 'director_userprofile.html', 'menu.html', 'my_comments.html', 'new_account.html',
+        'preceptor_userprofile.html', 'see_assistance.html', 'teacher_userprofile.html', 'update_grade.html',
+    )
+
+    def test_pages_extend_the_base_template(self):
+        for name in self.PAGES:
+            template = loader.get_template(name)
+            self.assertEqual(template.template.nodelist[0].parent_name.var, 'base.html', name)
+            html = template.render({})
+            self.assertEqual(html.count('<html'), 1, name)
+            self.assertEqual(html.count('bootstrap.min.css'), 1, name)
+        self.assertNotIn('navbar', loader.render_to_string('menu.html'))
+
+    def test_course_selector_marks_the_course(self):
+        course = Course.objects.create(year=Course.THIRD_YEAR, division='B')
+        student = Student.objects.create(first_name='Ana', last_name='Ruiz', birthday=timezone.now())
+        CourseHistory.objects.create(student=student, id_course=course)
+        request = staff_request('/asistencia/%d/' % course.pk)
+        html = asistencia(request, course.pk).content.decode()
+        self.assertIn('active" name="year" value="THI" title="Tercer Año">3<', html)
+        self.assertIn('active" name="division" value="B"', html)
+        self.assertEqual(html.count(' active"'), 2)
+        self.assertNotIn('name="shift"', html)
+        html = Template('{% load course_selectors %}{% course_selector Course "shift" %}').render(
+            Context({'Course': course}))
+        self.assertIn('active" name="shift" value="MS" title="Turno mañana">Mañana<', html)
+        self.assertIn('value="NS" title="Turno noche">Noche<', html)
+
+    def test_forms_get_course_fields_they_submit(self):
+        html = loader.render_to_string('create_comment.html', {'Course': Course(year=Course.SECOND_YEAR)})
+        self.assertIn('<select id="input_year" class="form-control" name="year">', html)
+        self.assertIn('<option value="SEC" selected>Segundo Año</option>', html)
+        self.assertIn('name="division"', html)
+        self.assertNotIn('btn-group', html)
+
+
+class CourseTimelineTests(TestCase):
+
+    def setUp(self):
+        self.second_a = Course.objects.create(year=Course.SECOND_YEAR, division='A')
+        self.third_b = Course.objects.create(year=Course.THIRD_YEAR, division='B', shift=Course.EVENING_SHIFT)
+        self.ana, self.luis = [Student.objects.create(first_name=name, last_name='Ruiz', birthday=timezone.now())
+                               for name in ('Ana', 'Luis')]
+
+    def test_rosters_and_paths_at_a_point_in_time(self):
+        CourseHistory.objects.create(student=self.ana, id_course=self.second_a, cycle=2022,
+                                     valid_from=date(2022, 3, 1), valid_to=date(2023, 1, 1))
+        CourseHistory.objects.create(student=self.ana, id_course=self.third_b, cycle=2023,
+                                     valid_from=date(2023, 3, 1))
+        CourseHistory.objects.create(student=self.luis, id_course=self.third_b, cycle=2023,
+                                     valid_from=date(2023, 3, 1))
+        move_student(self.luis.pk, self.second_a.pk, date(2023, 7, 1))
+
+        with self.assertNumQueries(1):
+            roster = roster_at(self.third_b.pk, date(2023, 5, 1))
+        self.assertEqual([student.first_name for student in roster], ['Ana', 'Luis'])
+        self.assertEqual([student.first_name for student in roster_at(self.third_b.pk, date(2023, 8, 1))], ['Ana'])
+        self.assertEqual(roster_at(self.third_b.pk, date(2022, 5, 1)), [])
+        self.assertEqual(len(cycle_roster(self.third_b.pk, 2023)), 2)
+
+        with self.assertNumQueries(1):
+            path = course_path(self.luis.pk)
+        self.assertEqual([(step.cycle, step.course_id, step.valid_from, step.valid_to) for step in path], [
+            (2023, self.third_b.pk, date(2023, 3, 1), date(2023, 7, 1)),
+            (2023, self.second_a.pk, date(2023, 7, 1), None),
+        ])
+        self.assertEqual((path[0].year, path[0].division, path[0].shift), ('THI', 'B', 'ES'))
+
+    def test_backfill_derives_cycles_of_legacy_rows(self):
+        for course in (self.second_a, self.third_b):
+            CourseHistory.objects.create(student=self.ana, id_course=course)
+        moved = CourseHistory.objects.create(student=self.luis, id_course=self.second_a)
+        CourseHistory.objects.update(cycle=None, valid_from=None)
+        CourseHistory.objects.create(student=self.luis, id_course=self.third_b, cycle=2024,
+                                     valid_from=date(2024, 3, 1))
+
+        out = StringIO()
+        call_command('backfill_course_timeline', cycle=2023, stdout=out)
+        self.assertIn('derived 3 course histories', out.getvalue())
+        self.assertEqual([(step.cycle, step.course_id, step.valid_to) for step in course_path(self.ana.pk)], [
+            (2022, self.second_a.pk, date(2023, 1, 1)), (2023, self.third_b.pk, None)])
+        moved.refresh_from_db()
+        self.assertEqual((moved.cycle, moved.valid_from, moved.valid_to), (2024, date(2024, 1, 1), date(2024, 3, 1)))
+        self.assertEqual(backfill_timeline(), 0)
+        self.assertEqual(len(roster_at(self.third_b.pk, date(2023, 6, 1))), 1)
+
+
+class BenchmarkTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+
+    def seeded(self):
+        return (list(Grades.objects.order_by('id').values_list('student__first_name', 'subject__name', 'grade')),
+                list(Comment.categories.through.objects.order_by('comment_id', 'category_id').values_list(
+                    'comment__description', 'category__name')))
+
+    def test_seed_is_reproducible_and_complete(self):
+        with rolled_back():
+            seed(30, grades=2, comments=1, days=3, chunk_size=20, derived=False)
+            first = self.seeded()
+        self.assertFalse(Course.all_objects.exists())
+
+        counts = seed(30, grades=2, comments=1, days=3, chunk_size=20)
+        self.assertEqual(counts['managerLibrary.Course'], 105)
+        self.assertEqual(counts['managerLibrary.Student'], 30)
+        self.assertEqual(counts['managerLibrary.CourseHistory'], 30)
+        self.assertEqual(counts['managerLibrary.Grades'], 60)
+        self.assertEqual(counts['managerLibrary.Presence'], 90)
+        self.assertEqual(StudentAcademicSummary.objects.count(), 30)
+        self.assertEqual(CourseHistory.objects.filter(cycle=2024, valid_from=date(2024, 3, 1)).count(), 30)
+        self.assertEqual(self.seeded(), first)
+
+        with self.assertRaisesMessage(CommandError, 'already has students'):
+            call_command('seed_benchmark', students=5, stdout=StringIO())
+
+    def test_run_and_compare(self):
+        seed(30, grades=2, comments=1, days=3)
+        students, grades = Student.objects.count(), Grades.objects.count()
+        cache.set('served', 'kept')
+        with tempfile.TemporaryDirectory() as directory:
+            output = os.path.join(directory, 'old.json')
+            call_command('run_benchmarks', repeat=1, output=output, stdout=StringIO())
+            with open(output) as f:
+                report = json.load(f)
+            self.assertEqual(report['counts']['managerLibrary.Student'], 30)
+            self.assertEqual(report['results']['comment history, warm cache']['queries'], 0)
+            self.assertEqual(report['results']['api page of grades']['queries'], 1)
+            self.assertEqual(report['results']['see_assistance.html']['group'], 'template')
+            self.assertEqual(report['cached_templates'], not settings.DEBUG)
+            # The bulk writes were rolled back.
+            self.assertEqual((Student.objects.count(), Grades.objects.count()), (students, grades))
+            # The cold runs didn't clear what the servers cached, nor left their own keys behind.
+            self.assertEqual(cache.get('served'), 'kept')
+            self.assertEqual(cache._connection().execute(
+                "SELECT COUNT(*) FROM cache WHERE key LIKE 'benchmarks-%'").fetchone(), (0,))
+
+            report['results']['search']['queries'] = 0
+            report['results']['grade report']['median_ms'] = 0.0
+            with open(output, 'w') as f:
+                json.dump(report, f)
+            with self.assertRaisesMessage(CommandError, ', 0 -> '):
+                call_command('run_benchmarks', benchmark=['search', 'count alive students'], compare=output,
+                             output=os.path.join(directory, 'new.json'), stdout=StringIO())
+
+        new = run_benchmarks(repeat=1, names=['grade report'])
+        self.assertEqual(list(new['results']), ['grade report'])
+        self.assertEqual(compare({'results': {'grade report': {'median_ms': 0.0, 'queries': 2}}}, new,
+                                 min_ms=0), [('grade report', {'median_ms': 0.0, 'queries': 2},
+                                              new['results']['grade report'])])
+        self.assertEqual(compare(new, new), [])
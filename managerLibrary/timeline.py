@@ -0,0 +1,125 @@
+from collections import namedtuple
+from datetime import date, timedelta
+
+from django.db import transaction
+from django.db.models import Min, Q
+from django.utils import timezone
+
+from .models import CourseHistory
+
+
+DEFAULT_CHUNK_SIZE = 1000
+
+TimelineStudent = namedtuple('TimelineStudent', ['id', 'first_name', 'last_name'])
+Enrolment = namedtuple('Enrolment', ['cycle', 'course_id', 'year', 'division', 'shift', 'valid_from', 'valid_to'])
+
+
+def cycle_of(day):
+    return day.year
+
+
+def cycle_start(cycle):
+    return date(cycle, 1, 1)
+
+
+def valid_between(start, end, prefix=''):
+    """
+    CourseHistory rows valid on some day from ``start`` to ``end``, both
+    included; ``prefix`` is the path to them from the model filtered, e.g.
+    'student__courseHistory__'.
+    """
+    return Q(**{prefix + 'valid_from__lte': end}) & (
+        Q(**{prefix + 'valid_to': None}) | Q(**{prefix + 'valid_to__gt': start}))
+
+
+def valid_on(day, prefix=''):
+    """CourseHistory rows whose validity range covers ``day``."""
+    return valid_between(day, day, prefix)
+
+
+def current_enrolments(day=None):
+    """
+    The rows naming the course each student is in on ``day`` (today by
+    default), by their validity range. Should a student have several, the
+    latest started is the current one and comes last.
+    """
+    day = day or timezone.localdate()
+    return CourseHistory.objects.filter(valid_on(day)).exclude(id_course=None).order_by('valid_from', 'id')
+
+
+def _students(course_histories):
+    rows = course_histories.filter(student__deleted_at=None).order_by(
+        'student__last_name', 'student__first_name', 'student_id').values_list(
+        'student_id', 'student__first_name', 'student__last_name').distinct()
+    return [TimelineStudent(*row) for row in rows]
+
+
+def roster_at(course_id, day=None):
+    """
+    The students in the course on ``day`` (today by default), in one query.
+    Only the validity range counts: a row left open since an earlier cycle
+    is still current.
+    """
+    day = day or timezone.localdate()
+    return _students(CourseHistory.objects.filter(valid_on(day), id_course_id=course_id))
+
+
+def cycle_roster(course_id, cycle):
+    """Everyone who was in the course at some point of ``cycle``. One query on the (course, cycle) index."""
+    return _students(CourseHistory.objects.filter(id_course_id=course_id, cycle=cycle))
+
+
+def course_path(student_id):
+    """The student's courses, oldest first. One query on the (student, cycle) index."""
+    return [Enrolment(*row) for row in CourseHistory.objects.filter(
+        student_id=student_id, cycle__isnull=False).order_by('cycle', 'valid_from', 'id').values_list(
+        'cycle', 'id_course_id', 'id_course__year', 'id_course__division', 'id_course__shift',
+        'valid_from', 'valid_to')]
+
+
+def move_student(student_id, course_id, day=None):
+    """
+    Register the student in another course from ``day`` on, closing the
+    courses they are in. Saves instance by instance, so rosters and other
+    caches hear about it. Returns the new CourseHistory.
+    """
+    day = day or timezone.localdate()
+    with transaction.atomic():
+        for enrolment in CourseHistory.objects.filter(student_id=student_id, valid_to=None):
+            enrolment.valid_to = day
+            enrolment.save()
+        return CourseHistory.objects.create(student_id=student_id, id_course_id=course_id, cycle=cycle_of(day),
+                                            valid_from=day)
+
+
+def backfill(cycle=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Derive the cycle and validity range of rows from before the timeline.
+    They are assumed to be one per school year: a student's latest one is
+    in ``cycle`` (the current one by default) and still open, or ends where
+    the student's first dated row starts, and each earlier one a cycle
+    before. Only rows without a cycle are written, one transaction per
+    ``chunk_size`` of them, so an interrupted run can simply be repeated.
+    Returns the number of rows written.
+    """
+    cycle = cycle or cycle_of(timezone.localdate())
+    dated = dict(CourseHistory.all_objects.exclude(cycle=None).values('student_id').annotate(
+        first=Min('valid_from')).order_by().values_list('student_id', 'first'))
+    pending = list(CourseHistory.all_objects.filter(cycle=None).order_by('student_id', '-id').values_list(
+        'id', 'student_id', 'valid_to'))
+
+    rows = []
+    previous = None
+    for pk, student_id, valid_to in pending:
+        if student_id != previous:
+            previous, end = student_id, dated.get(student_id)
+            row_cycle = cycle_of(end - timedelta(days=1)) if end else cycle
+        else:
+            end = cycle_start(row_cycle)
+            row_cycle -= 1
+        rows.append(CourseHistory(id=pk, cycle=row_cycle, valid_from=cycle_start(row_cycle), valid_to=valid_to or end))
+
+    for start in range(0, len(rows), chunk_size):
+        with transaction.atomic():
+            CourseHistory.all_objects.bulk_update(rows[start:start + chunk_size], ['cycle', 'valid_from', 'valid_to'])
+    return len(rows)
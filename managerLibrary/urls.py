@@ -1,8 +1,17 @@
 from django.urls import path
-from . import views
+from . import api, views
 
 urlpatterns = [
     path('', views.historialnotas, name='comment_list'),
+    path('perfil/', views.perfil, name='profile'),
+    path('alumno/<int:student_id>/', views.perfil_alumno, name='student_profile'),
+    path('buscar/', views.buscar, name='search'),
+    path('progreso/', views.progreso_academico, name='academic_progress'),
+    path('asistencia/<int:course_id>/', views.asistencia, name='assistance'),
+    path('asistencia/<int:course_id>/resumen/', views.ver_asistencia, name='see_assistance'),
+    path('exportar/<str:kind>/', views.exportar, name='export'),
+    path('estadisticas/categorias/', views.estadisticas_categorias, name='category_stats'),
+    path('api/<str:resource>/', api.api, name='api'),
 
 ]
 
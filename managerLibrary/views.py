@@ -1,4 +1,23 @@
-from django.shortcuts import render
+from django.http import Http404, HttpResponseBadRequest, HttpResponseForbidden, JsonResponse, StreamingHttpResponse
+from django.db.models import Count, Q
+from django.shortcuts import get_object_or_404, render
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from .attendance import record_roll_call
+from .attendance_bitmaps import attendance_counts, course_attendance, longest_absence_streaks
+from .caching import cached, make_key
+from .category_stats import category_stats
+from .concurrency import gather
+from .exports import CONTENT_TYPES, CSV, EXPORTS, export_stream
+from .feeds import comment_feed, ORDER_BY_DATE
+from .models import (
+    AttendanceBitmap, Category, CategoryDailyCount, Comment, Course, CourseHistory, CustomUser, Grades, Presence,
+    Student, StudentAcademicSummary,
+)
+from .roles import PRECEPTOR, PRINCIPAL, PROFESSOR, role_for_request
+from .rosters import get_course_roster
+from .search import CATEGORY, COMMENT, STUDENT, search
 
 
 # Create your views here.
@@ -6,5 +25,201 @@ from django.shortcuts import render
 
 
 
+def _parse_date(value):
+    """Like parse_date, but None for well formed impossible dates such as 2023-02-30 instead of ValueError."""
+    try:
+        return parse_date(value)
+    except ValueError:
+        return None
+
+
+def _school_role(request):
+    """The user's role if they are school staff, else None."""
+    role = role_for_request(request)
+    return role if role is not None and role.name is not None else None
+
+
 def historialnotas(request):
-    return render(request, 'comments_history.html', {})
+    if _school_role(request) is None:
+        return HttpResponseForbidden('Solo personal de la escuela')
+    order = request.GET.get('orden', ORDER_BY_DATE)
+    cursor = request.GET.get('cursor')
+    try:
+        page = cached(make_key('comment_feed', order, cursor), lambda: comment_feed(order=order, cursor=cursor),
+                      # The author's name is shown too.
+                      [Comment, Student, Category, CustomUser])
+    except ValueError:
+        return HttpResponseBadRequest('Cursor inválido')
+    return render(request, 'comments_history.html', {'Comments': page})
+
+
+def progreso_academico(request):
+    if _school_role(request) is None:
+        return HttpResponseForbidden('Solo personal de la escuela')
+    course = request.GET.get('curso', '')
+    if not course.isdigit():
+        return render(request, 'academic_progress.html', {'Summaries': []})
+    # Only evaluated if the template's cached fragment has to be rendered.
+    summaries = StudentAcademicSummary.objects.filter(course_id=course).select_related('student').order_by(
+        'student__last_name', 'student__first_name')
+    return render(request, 'academic_progress.html', {'Course': int(course), 'Summaries': summaries})
+
+
+def asistencia(request, course_id):
+    if request.method != 'POST':
+        if _school_role(request) is None:
+            return HttpResponseForbidden('Solo personal de la escuela')
+        roster = get_course_roster(course_id)
+        if roster is None:
+            raise Http404('Curso inexistente')
+        return render(request, 'assistance.html', {'Course': roster, 'Students': roster.students})
+
+    role = role_for_request(request)
+    if role is None or role.name not in (PRECEPTOR, PRINCIPAL):
+        return HttpResponseForbidden('Solo preceptores y directivos')
+    course = get_object_or_404(Course, pk=course_id)
+
+    date = request.POST.get('fecha')
+    if date:
+        date = _parse_date(date)
+        if date is None:
+            return HttpResponseBadRequest('Fecha inválida')
+    present = request.POST.getlist('presentes')
+    if not all(pk.isdigit() for pk in present):
+        return HttpResponseBadRequest('Alumno inválido')
+    preceptor_id = role.user_id if role.name == PRECEPTOR else None
+    recorded = record_roll_call(course.pk, present, date=date, preceptor_id=preceptor_id)
+    return JsonResponse({'course': course.pk, 'recorded': recorded})
+
+
+def _attendance_rows(course_id, start, end):
+    attendance = course_attendance(course_id, start, end)
+    present, absent = attendance_counts(attendance)
+    streaks = longest_absence_streaks(attendance)
+    students = Student.objects.in_bulk(attendance.student_ids.tolist())
+    return [
+        {
+            'student': students[student_id],
+            'present': int(present[i]),
+            'absent': int(absent[i]),
+            'rate': int(round(100.0 * present[i] / (present[i] + absent[i]))) if present[i] + absent[i] else None,
+            'streak': int(streaks[i]),
+        }
+        for i, student_id in enumerate(attendance.student_ids.tolist()) if student_id in students
+    ]
+
+
+# Longest span the attendance summary covers; each day is a column of the matrices.
+MAX_ATTENDANCE_DAYS = 366
+
+
+def ver_asistencia(request, course_id):
+    if _school_role(request) is None:
+        return HttpResponseForbidden('Solo personal de la escuela')
+    course = get_object_or_404(Course, pk=course_id)
+    today = timezone.localdate()
+    start = _parse_date(request.GET['desde']) if request.GET.get('desde') else today.replace(month=1, day=1)
+    end = _parse_date(request.GET['hasta']) if request.GET.get('hasta') else today
+    if start is None or end is None or start > end or (end - start).days >= MAX_ATTENDANCE_DAYS:
+        return HttpResponseBadRequest('Rango de fechas inválido')
+
+    rows = cached(make_key('attendance_summary', course.pk, start, end),
+                  lambda: _attendance_rows(course.pk, start, end), [AttendanceBitmap, CourseHistory, Student])
+    return render(request, 'see_assistance.html', {'Course': course, 'Rows': rows, 'From': start, 'To': end})
+
+
+PROFILE_TEMPLATES = {
+    PRINCIPAL: 'director_userprofile.html',
+    PRECEPTOR: 'preceptor_userprofile.html',
+    PROFESSOR: 'teacher_userprofile.html',
+}
+
+
+def perfil(request):
+    role = role_for_request(request)
+    if role is None or role.name is None:
+        raise Http404('Usuario sin perfil')
+    return render(request, PROFILE_TEMPLATES[role.name])
+
+
+STUDENT_PROFILE_COMMENTS = 20
+
+
+def perfil_alumno(request, student_id):
+    if _school_role(request) is None:
+        return HttpResponseForbidden('Solo personal de la escuela')
+    # Four independent queries, run at the same time.
+    student, comments, grades, attendance = gather(
+        lambda: Student.objects.filter(pk=student_id).values('id', 'first_name', 'last_name', 'birthday').first(),
+        lambda: list(Comment.objects.filter(student_id=student_id).order_by('-date', '-id').values(
+            'id', 'date', 'description')[:STUDENT_PROFILE_COMMENTS]),
+        lambda: list(Grades.objects.filter(student_id=student_id).order_by('subject__name', 'id').values(
+            'subject__name', 'grade')),
+        lambda: Presence.objects.filter(student_id=student_id).aggregate(
+            present=Count('id', filter=Q(presence=True)), absent=Count('id', filter=Q(presence=False))),
+    )
+    if student is None:
+        raise Http404('Alumno inexistente')
+    return JsonResponse({
+        'student': student,
+        'comments': comments,
+        'grades': [{'subject': grade['subject__name'], 'grade': grade['grade']} for grade in grades],
+        'attendance': attendance,
+    })
+
+
+SEARCH_KINDS = {'alumno': STUDENT, 'nota': COMMENT, 'categoria': CATEGORY}
+
+
+def buscar(request):
+    if _school_role(request) is None:
+        return HttpResponseForbidden('Solo personal de la escuela')
+    query = request.GET.get('q', '')
+    kinds = [SEARCH_KINDS[kind] for kind in request.GET.getlist('tipo') if kind in SEARCH_KINDS]
+    results = search(query, kinds=kinds, limit=10) if len(query.strip()) >= 2 else []
+    return JsonResponse({'results': results})
+
+
+def exportar(request, kind):
+    if kind not in EXPORTS:
+        raise Http404('Exportación inexistente')
+    role = role_for_request(request)
+    if role is None or role.name != PRINCIPAL:
+        return HttpResponseForbidden('Solo directivos')
+    format = request.GET.get('formato', CSV)
+    if format not in CONTENT_TYPES:
+        return HttpResponseBadRequest('Formato inválido')
+    filters = {}
+    for param, name in (('desde', 'start'), ('hasta', 'end')):
+        if request.GET.get(param):
+            filters[name] = _parse_date(request.GET[param])
+            if filters[name] is None:
+                return HttpResponseBadRequest('Fecha inválida')
+    for param, name in (('anio', 'year'), ('division', 'division'), ('turno', 'shift')):
+        filters[name] = request.GET.get(param)
+
+    response = StreamingHttpResponse(export_stream(kind, format, **filters), content_type=CONTENT_TYPES[format])
+    response['Content-Disposition'] = 'attachment; filename="%s.%s"' % (kind, format)
+    return response
+
+
+def estadisticas_categorias(request):
+    role = role_for_request(request)
+    if role is None or role.name != PRINCIPAL:
+        return HttpResponseForbidden('Solo directivos')
+    today = timezone.localdate()
+    start = _parse_date(request.GET['desde']) if request.GET.get('desde') else today.replace(day=1)
+    end = _parse_date(request.GET['hasta']) if request.GET.get('hasta') else today
+    if start is None or end is None or start > end:
+        return HttpResponseBadRequest('Rango de fechas inválido')
+    course_id, top = request.GET.get('curso', ''), request.GET.get('top', '5')
+    category_ids = request.GET.getlist('categoria')
+    if not all(value.isdigit() for value in [course_id, top] + category_ids if value):
+        return HttpResponseBadRequest('Parámetro inválido')
+    course_id = int(course_id) if course_id else None
+    category_ids = sorted(int(pk) for pk in category_ids) or None
+    top = min(int(top or 5), 50)
+    categories = cached(make_key('category_stats', start, end, course_id, category_ids, top),
+                        lambda: category_stats(start, end, course_id, category_ids, top),
+                        [CategoryDailyCount, Category, Student])
+    return JsonResponse({'from': start, 'to': end, 'categories': categories})
@@ -0,0 +1,46 @@
+"""
+ASGI config for mylibrary project.
+
+It exposes the ASGI callable as a module-level variable named ``application``,
+for servers such as uvicorn or daphne.
+
+Django 2.2 has no ASGI handler and no async views: every view in this
+project is synchronous. The WSGI application is served over ASGI with
+asgiref's WsgiToAsgi adapter, which runs each request in a thread. Servers
+that probe the lifespan protocol are told it is unsupported and go on
+without it.
+"""
+
+import os
+
+from asgiref.sync import ThreadSensitiveContext
+from asgiref.wsgi import WsgiToAsgi
+from django.core.wsgi import get_wsgi_application
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "mylibrary.settings")
+
+
+def close_after_response(wsgi_application):
+    """
+    Close the response once it has been sent, as WSGI servers do. WsgiToAsgi
+    never calls close(), and Django's response sends request_finished there,
+    which closes the database connections.
+    """
+    def application(environ, start_response):
+        response = wsgi_application(environ, start_response)
+        try:
+            yield from response
+        finally:
+            if hasattr(response, 'close'):
+                response.close()
+    return application
+
+
+wsgi_to_asgi = WsgiToAsgi(close_after_response(get_wsgi_application()))
+
+
+async def application(scope, receive, send):
+    # As in Django's own ASGI handler: each request gets a thread of its own
+    # instead of all of them queueing for asgiref's single shared thread.
+    async with ThreadSensitiveContext():
+        await wsgi_to_asgi(scope, receive, send)
@@ -23,9 +23,11 @@ BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 SECRET_KEY = '_)9f!7he2&p1o#ga8^tlgj*c(7^u2a_b9j$n99h^pqdlbwtmb='
 
 # SECURITY WARNING: don't run with debug turned on in production!
-DEBUG = True
+# DJANGO_DEBUG=0 turns it off, and with it Django caches compiled templates.
+DEBUG = os.environ.get('DJANGO_DEBUG', '1') != '0'
 
-ALLOWED_HOSTS = []
+# Space separated, e.g. DJANGO_ALLOWED_HOSTS="escuela.example.com 10.0.0.5".
+ALLOWED_HOSTS = os.environ.get('DJANGO_ALLOWED_HOSTS', '').split()
 
 
 # Application definition
@@ -40,7 +42,9 @@ INSTALLED_APPS = [
     'managerLibrary.apps.ManagerLibraryConfig',
 ]
 
-MIDDLEWARE = {
+MIDDLEWARE = [
+    'managerLibrary.middleware.InstrumentationMiddleware',
+    'managerLibrary.middleware.PrimaryPinningMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -48,15 +52,16 @@ MIDDLEWARE = {
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
-}
+]
 
 ROOT_URLCONF = 'mylibrary.urls'
 
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
-        'DIRS': [os.path.join(BASE_DIR, 'templates')]
-        ,
+        'DIRS': [os.path.join(BASE_DIR, 'templates')],
+        # Without DEBUG, Django wraps these loaders in the cached loader, so each
+        # template is read and compiled once per process instead of on every render.
         'APP_DIRS': True,
         'OPTIONS': {
             'context_processors': [
@@ -64,6 +69,7 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'managerLibrary.context_processors.role',
             ],
         },
     },
@@ -79,6 +85,42 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        # Keep connections open between requests; see
+        # managerLibrary.databases.check_connections for CONN_HEALTH_CHECKS.
+        'CONN_MAX_AGE': 60,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'timeout': 20,
+        },
+    }
+}
+
+# Reads of school data may go to replicas (managerLibrary.databases.ReplicaRouter).
+# DATABASE_REPLICA names a copy of the database kept up to date by replication;
+# tests read from the test primary instead.
+REPLICA_DATABASES = []
+if os.environ.get('DATABASE_REPLICA'):
+    DATABASES['replica'] = dict(DATABASES['default'], NAME=os.environ['DATABASE_REPLICA'], TEST={'MIRROR': 'default'})
+    REPLICA_DATABASES.append('replica')
+
+DATABASE_ROUTERS = ['managerLibrary.databases.ReplicaRouter']
+
+# How long a client keeps reading from the primary after writing.
+REPLICA_PIN_SECONDS = 15
+
+
+# Cache
+# Shared by every worker process through one SQLite file, so roles, rosters
+# and cached reports are computed once per server rather than once per worker.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'managerLibrary.cache_backend.SQLiteCache',
+        'LOCATION': os.path.join(BASE_DIR, 'cache.sqlite3'),
+        'TIMEOUT': 300,
+        'OPTIONS': {
+            'MAX_ENTRIES': 100000,
+        },
     }
 }
 
@@ -121,4 +163,49 @@ USE_TZ = True
 
 STATIC_URL = '/static/'
 STATIC_ROOT = os.path.join(BASE_DIR, 'static')
-AUTH_USER_MODEL = 'managerLibrary.CustomUser'
\ No newline at end of file
+AUTH_USER_MODEL = 'managerLibrary.CustomUser'
+
+
+# Request instrumentation (managerLibrary.middleware.InstrumentationMiddleware)
+# Queries allowed per request by URL name, or "METHOD name", counting the
+# session and user lookups, with the user's role already cached. Going over
+# logs a warning and fails the budget tests in managerLibrary/tests.py.
+
+QUERY_BUDGETS = {
+    'comment_list': 4,
+    'profile': 3,
+    'student_profile': 7,
+    'search': 4,
+    'academic_progress': 3,
+    'assistance': 2,
+    'POST assistance': 23,
+    'see_assistance': 5,
+    'api': 5,
+}
+
+REQUEST_METRICS_LOG = os.path.join(BASE_DIR, 'request_metrics.log')
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'message': {'format': '%(message)s'},
+    },
+    'handlers': {
+        'request_metrics': {
+            'class': 'logging.handlers.RotatingFileHandler',
+            'filename': REQUEST_METRICS_LOG,
+            'maxBytes': 10 * 1024 * 1024,
+            'backupCount': 2,
+            'delay': True,
+            'formatter': 'message',
+        },
+    },
+    'loggers': {
+        'managerLibrary.requests': {
+            'handlers': ['request_metrics'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+    },
+}
@@ -0,0 +1,33 @@
+"""
+Settings for ``manage.py test``, which picks them up unless
+DJANGO_SETTINGS_MODULE says otherwise.
+
+The tests clear the cache and write request metrics, so both go to a
+temporary directory instead of the cache file and log the servers share.
+A replica alias mirroring the test database is configured too, so the
+read routing can be tested against two real connections; only the tests
+that ask for it route reads there.
+"""
+
+import atexit
+import copy
+import os
+import shutil
+import tempfile
+
+from .settings import *  # noqa: F401,F403
+from .settings import CACHES, DATABASES, LOGGING
+
+TEST_DIR = tempfile.mkdtemp(prefix='mylibrary-tests-')
+atexit.register(shutil.rmtree, TEST_DIR, ignore_errors=True)
+
+CACHES = copy.deepcopy(CACHES)
+CACHES['default']['LOCATION'] = os.path.join(TEST_DIR, 'cache.sqlite3')
+
+REQUEST_METRICS_LOG = os.path.join(TEST_DIR, 'request_metrics.log')
+LOGGING = copy.deepcopy(LOGGING)
+LOGGING['handlers']['request_metrics']['filename'] = REQUEST_METRICS_LOG
+
+if 'replica' not in DATABASES:
+    DATABASES = copy.deepcopy(DATABASES)
+    DATABASES['replica'] = dict(DATABASES['default'], TEST={'MIRROR': 'default'})